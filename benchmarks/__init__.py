@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for prom's hot paths
+
+these aren't installed with prom, run them from the repo root:
+
+    $ python -m benchmarks --output before.json
+    $ python -m benchmarks --output after.json --compare before.json
+
+they run against SQLite (a temp file and :memory:) and against Postgres if
+PROM_DSN (or PROM_POSTGRES_DSN) is a postgres dsn
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import time
+import tempfile
+import tracemalloc
+from uuid import uuid4
+
+from prom.config import DsnConnection
+from prom.interface import set_interface, interfaces
+
+from . import data
+
+
+benchmarks = []
+"""holds all the registered Benchmark instances in the order they were defined"""
+
+
+class Benchmark(object):
+    """Wraps a benchmark setup function
+
+    the setup function is passed an Environment and does any setup the benchmark
+    needs, it returns a tuple (op, count) where op is a callable that does count
+    operations each time it is called, op is what gets timed
+    """
+    def __init__(self, setup, name="", group=""):
+        self.setup = setup
+        self.name = name or setup.__name__
+        self.group = group or setup.__module__.split(".")[-1].replace("bench_", "")
+
+    @property
+    def fullname(self):
+        return "{}.{}".format(self.group, self.name)
+
+    def run(self, env, min_time=1.0, warmup=1):
+        """run the benchmark against env
+
+        :param env: Environment
+        :param min_time: float, keep calling op until it has run this many seconds
+        :param warmup: int, how many times to call op before timing it
+        :returns: dict, the results
+        """
+        op, count = self.setup(env)
+
+        for _ in range(warmup):
+            op()
+
+        calls = 0
+        elapsed = 0.0
+        best = None
+        while elapsed < min_time:
+            start = time.perf_counter()
+            op()
+            stop = time.perf_counter() - start
+            elapsed += stop
+            calls += 1
+            if best is None or stop < best:
+                best = stop
+
+        # tracemalloc slows everything down so memory gets its own call
+        tracemalloc.start()
+        try:
+            op()
+            _, peak = tracemalloc.get_traced_memory()
+
+        finally:
+            tracemalloc.stop()
+
+        ops = calls * count
+        return {
+            "name": self.fullname,
+            "backend": env.name,
+            "ops": ops,
+            "seconds": elapsed,
+            "ops_per_sec": ops / elapsed if elapsed else 0.0,
+            "best_ops_per_sec": count / best if best else 0.0,
+            "peak_memory": peak,
+        }
+
+
+def benchmark(setup=None, **kwargs):
+    """decorator that registers a benchmark setup function, see Benchmark"""
+    def wrap(setup):
+        benchmarks.append(Benchmark(setup, **kwargs))
+        return setup
+
+    return wrap(setup) if setup else wrap
+
+
+class Environment(object):
+    """An interface and the data generators that a benchmark runs against"""
+    def __init__(self, name, dsn, path=""):
+        """
+        :param name: string, the backend name that is reported in the results
+        :param dsn: string, the prom dsn of the interface
+        :param path: string, a file that should be removed when the environment
+            is closed
+        """
+        self.name = name
+        self.path = path
+        self.connection_name = "benchmark_{}".format(name.replace("-", "_"))
+        config = DsnConnection("{}#{}".format(dsn, self.connection_name))
+        self.interface = config.interface
+        set_interface(self.interface, self.connection_name)
+
+        self.interface.unsafe_delete_tables()
+        self.orm_classes = data.create_orm_classes(self.connection_name)
+
+    def __getattr__(self, k):
+        try:
+            return self.__dict__["orm_classes"][k]
+
+        except KeyError:
+            raise AttributeError(k)
+
+    def close(self):
+        self.interface.unsafe_delete_tables()
+        self.interface.close()
+        interfaces.pop(self.connection_name, None)
+        if self.path:
+            for path in [self.path, self.path + "-wal", self.path + "-shm"]:
+                if os.path.isfile(path):
+                    os.unlink(path)
+
+    @classmethod
+    def create_all(cls, names=None):
+        """create the environments for all the backends that can run here
+
+        :param names: list, only create these backends
+        :returns: list, Environment instances
+        """
+        ret = []
+        if not names or "sqlite-memory" in names:
+            ret.append(cls("sqlite-memory", "sqlite://:memory:"))
+
+        if not names or "sqlite-file" in names:
+            path = os.path.join(tempfile.gettempdir(), "prom-benchmark-{}.sqlite".format(uuid4()))
+            ret.append(cls("sqlite-file", "sqlite://{}".format(path), path=path))
+
+        if not names or "postgres" in names:
+            for env_name in ["PROM_POSTGRES_DSN", "PROM_DSN"]:
+                dsn = os.environ.get(env_name, "")
+                if dsn.startswith("postgres") or ".PostgreSQL" in dsn.split("://")[0]:
+                    ret.append(cls("postgres", dsn.split("#")[0]))
+                    break
+
+        return ret
+
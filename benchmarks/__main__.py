@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import sys
+import json
+import argparse
+import datetime
+import platform
+
+import prom
+
+from . import benchmarks, Environment
+from . import bench_orm, bench_query, bench_interface
+
+
+def compare(results, previous):
+    """print how results changed from previous
+
+    :param results: list, the results of this run
+    :param previous: list, the results loaded from an earlier run's json file
+    """
+    before = {(r["name"], r["backend"]): r for r in previous}
+    print("")
+    print("{:<35} {:<15} {:>12} {:>12} {:>8}".format("benchmark", "backend", "before", "after", "change"))
+    for r in results:
+        b = before.get((r["name"], r["backend"]), None)
+        if b and b["ops_per_sec"]:
+            change = (r["ops_per_sec"] - b["ops_per_sec"]) / b["ops_per_sec"]
+            print("{:<35} {:<15} {:>12.1f} {:>12.1f} {:>+7.1%}".format(
+                r["name"],
+                r["backend"],
+                b["ops_per_sec"],
+                r["ops_per_sec"],
+                change,
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run prom's benchmarks")
+    parser.add_argument(
+        "--backend", "-b",
+        dest="backends",
+        action="append",
+        choices=["sqlite-memory", "sqlite-file", "postgres"],
+        help="only run against this backend, can be passed more than once",
+    )
+    parser.add_argument(
+        "--filter", "-f",
+        default="",
+        help="only run benchmarks whose name contains this",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=1.0,
+        help="how many seconds to run each benchmark",
+    )
+    parser.add_argument(
+        "--output", "-o",
+        default="",
+        help="write the results to this json file",
+    )
+    parser.add_argument(
+        "--compare", "-c",
+        default="",
+        help="compare the results to this json file from an earlier run",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    print("{:<35} {:<15} {:>12} {:>14}".format("benchmark", "backend", "ops/sec", "peak memory"))
+    for env in Environment.create_all(args.backends):
+        try:
+            for b in benchmarks:
+                if args.filter not in b.fullname: continue
+
+                # every benchmark starts with empty tables
+                env.interface.unsafe_delete_tables()
+                r = b.run(env, min_time=args.min_time)
+                results.append(r)
+                print("{:<35} {:<15} {:>12.1f} {:>14,}".format(
+                    r["name"],
+                    r["backend"],
+                    r["ops_per_sec"],
+                    r["peak_memory"],
+                ))
+
+        finally:
+            env.close()
+
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(results, json.load(fp)["results"])
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(
+                {
+                    "prom": prom.__version__,
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "created": datetime.datetime.utcnow().isoformat(),
+                    "results": results,
+                },
+                fp,
+                indent=2,
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
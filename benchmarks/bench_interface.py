@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+
+from . import benchmark, data
+
+
+@benchmark
+def text_scan(env):
+    """read a lot of text values straight from the interface, this is where the
+    per-value typecasting (eg, Postgres' STRING caster) shows up"""
+    Text = env.Text
+    data.populate(Text, 2000, data.get_text_fields)
+    interface = Text.interface
+    schema = Text.schema
+    query = Text.query
+
+    def op():
+        interface.get(schema, query)
+
+    return op, 2000
+
+
+@benchmark
+def get_one(env):
+    """primary key lookups, the shortest round trip prom can do"""
+    Foo = env.Foo
+    pks = data.populate(Foo, 100, data.get_foo_fields)
+    interface = Foo.interface
+    schema = Foo.schema
+
+    def op():
+        for pk in pks:
+            interface.get_one(schema, Foo.query.is_pk(pk))
+
+    return op, len(pks)
+
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+
+from . import benchmark, data
+
+
+@benchmark
+def hydrate(env):
+    """Orm.hydrate() on rows that have already been fetched"""
+    Foo = env.Foo
+    rows = []
+    for pk in range(1, 1001):
+        fields = data.get_foo_fields()
+        fields["_id"] = pk
+        fields["_created"] = fields["_updated"] = fields["when"]
+        rows.append(fields)
+
+    def op():
+        for row in rows:
+            Foo.hydrate(row)
+
+    return op, len(rows)
+
+
+@benchmark
+def iterate(env):
+    """fetch and hydrate rows using the query Iterator"""
+    Foo = env.Foo
+    data.populate(Foo, 1000, data.get_foo_fields)
+
+    def op():
+        for o in Foo.query.get():
+            pass
+
+    return op, 1000
+
+
+@benchmark
+def save_insert(env):
+    Foo = env.Foo
+
+    def op():
+        for _ in range(50):
+            Foo(data.get_foo_fields()).save()
+
+    return op, 50
+
+
+@benchmark
+def save_update(env):
+    Foo = env.Foo
+    data.populate(Foo, 50, data.get_foo_fields)
+    orms = list(Foo.query.limit(50).get())
+
+    def op():
+        for o in orms:
+            o.che += 1
+            o.save()
+
+    return op, len(orms)
+
+
+@benchmark
+def pool_hit(env):
+    """OrmPool lookups that are always in the pool"""
+    Foo = env.Foo
+    pks = data.populate(Foo, 100, data.get_foo_fields)
+    pool = Foo.pool(len(pks))
+    for pk in pks:
+        pool[pk]
+
+    def op():
+        for pk in pks:
+            pool[pk]
+
+    return op, len(pks)
+
+
+@benchmark
+def pool_miss(env):
+    """OrmPool lookups that always have to go to the db"""
+    Foo = env.Foo
+    pks = data.populate(Foo, 100, data.get_foo_fields)
+
+    def op():
+        pool = Foo.pool(len(pks))
+        for pk in pks:
+            pool[pk]
+
+    return op, len(pks)
+
+
+@benchmark
+def serialize_encode(env):
+    """encoding a json field's value for the db"""
+    field = env.Doc.schema.fields["body"]
+    docs = [data.get_document() for _ in range(100)]
+
+    def op():
+        for doc in docs:
+            field.encode(doc)
+
+    return op, len(docs)
+
+
+@benchmark
+def serialize_decode(env):
+    """decoding a json field's value from the db"""
+    field = env.Doc.schema.fields["body"]
+    docs = [field.encode(data.get_document()) for _ in range(100)]
+
+    def op():
+        for doc in docs:
+            field.decode(doc)
+
+    return op, len(docs)
+
+
+@benchmark
+def serialize_roundtrip(env):
+    """saving and then loading an orm with a json field"""
+    Doc = env.Doc
+
+    def op():
+        for _ in range(20):
+            d = Doc.create(body=data.get_document())
+            Doc.query.is_pk(d.pk).one()
+
+    return op, 20
+
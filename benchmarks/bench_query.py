@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+
+from . import benchmark, data
+
+
+def get_complex_query(env):
+    Foo = env.Foo
+    Bar = env.Bar
+    return (
+        Foo.query
+        .select_pk().select_foo().select_bar()
+        .gte_foo(10).lt_foo(100000)
+        .in_che(list(range(1, 50)))
+        .ne_bar("nope")
+        .startswith_bar("a")
+        .is_active(True)
+        .in_pk(Bar.query.select_foo_id().is_bar("one"))
+        .desc_when().asc_pk()
+        .limit(25).page(3)
+    )
+
+
+@benchmark
+def get_SQL_simple(env):
+    Foo = env.Foo
+    interface = Foo.interface
+    schema = Foo.schema
+    query = Foo.query.is_pk(1)
+
+    def op():
+        for _ in range(100):
+            interface.get_SQL(schema, query)
+
+    return op, 100
+
+
+@benchmark
+def get_SQL_complex(env):
+    Foo = env.Foo
+    interface = Foo.interface
+    schema = Foo.schema
+    query = get_complex_query(env)
+
+    def op():
+        for _ in range(100):
+            interface.get_SQL(schema, query)
+
+    return op, 100
+
+
+@benchmark
+def copy(env):
+    """Query.copy() of a complex query, this happens on every Iterator slice
+    and count"""
+    query = get_complex_query(env)
+
+    def op():
+        for _ in range(100):
+            query.copy()
+
+    return op, 100
+
+
+@benchmark
+def count(env):
+    Foo = env.Foo
+    data.populate(Foo, 1000, data.get_foo_fields)
+
+    def op():
+        for che in range(1, 11):
+            Foo.query.is_che(che).count()
+
+    return op, 10
+
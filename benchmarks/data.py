@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data generators for the benchmarks, everything uses a seeded random
+so two runs work with the same data
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import random
+import string
+import datetime
+
+from prom import Orm, Field, Index
+
+
+rand = random.Random(1)
+
+
+def get_text(size=32):
+    return "".join(rand.choice(string.ascii_letters + " ") for _ in range(size))
+
+
+def get_int(low=1, high=1000000):
+    return rand.randint(low, high)
+
+
+def get_datetime():
+    return datetime.datetime(2020, 1, 1) + datetime.timedelta(seconds=get_int(0, 86400 * 365))
+
+
+def get_document(depth=2, width=5):
+    """return a nested dict like the ones that usually end up in json fields"""
+    d = {}
+    for i in range(width):
+        k = "key_{}".format(i)
+        if depth > 0 and i % 2:
+            d[k] = get_document(depth - 1, width)
+        elif i % 3:
+            d[k] = [get_int() for _ in range(width)]
+        else:
+            d[k] = get_text(16)
+    return d
+
+
+def get_foo_fields():
+    return {
+        "foo": get_int(),
+        "bar": get_text(32),
+        "che": get_int(1, 10),
+        "when": get_datetime(),
+        "ratio": rand.random(),
+        "active": rand.random() > 0.5,
+    }
+
+
+def get_text_fields(size=200):
+    return {
+        "one": get_text(size),
+        "two": get_text(size),
+        "three": get_text(size),
+        "four": get_text(size),
+    }
+
+
+def create_orm_classes(name):
+    """create the Orm classes the benchmarks use
+
+    the table names are prefixed with the connection name because schemas are
+    singletons keyed by table name, so each environment needs its own tables
+
+    :param name: string, the connection name of the interface the orms will use
+    :returns: dict, orm class name -> orm class
+    """
+    class Foo(Orm):
+        table_name = "{}_foo".format(name)
+        connection_name = name
+
+        foo = Field(int, True)
+        bar = Field(str, True)
+        che = Field(int, True)
+        when = Field(datetime.datetime, True)
+        ratio = Field(float, True)
+        active = Field(bool, True)
+
+        ifoo = Index("foo")
+        iche = Index("che", "foo")
+
+    class Bar(Orm):
+        table_name = "{}_bar".format(name)
+        connection_name = name
+
+        foo_id = Field(Foo, True)
+        bar = Field(str, True)
+
+    class Doc(Orm):
+        table_name = "{}_doc".format(name)
+        connection_name = name
+
+        body = Field(dict, True)
+
+    class Text(Orm):
+        table_name = "{}_text".format(name)
+        connection_name = name
+
+        one = Field(str, True)
+        two = Field(str, True)
+        three = Field(str, True)
+        four = Field(str, True)
+
+    return {
+        "Foo": Foo,
+        "Bar": Bar,
+        "Doc": Doc,
+        "Text": Text,
+    }
+
+
+def populate(orm_class, count, get_fields):
+    """insert count rows into orm_class's table in one transaction
+
+    :param orm_class: Orm
+    :param count: int, how many rows to insert
+    :param get_fields: callable, returns the fields of each row
+    :returns: list, the primary keys of the inserted rows
+    """
+    pks = []
+    with orm_class.interface.transaction():
+        for _ in range(count):
+            pks.append(orm_class.create(get_fields()).pk)
+    return pks
+
@@ -9,9 +9,9 @@ from .config import (
     Field,
     Index
 )
-from .query import Query, Iterator
+from .query import Query, Iterator, gather, Count, Sum, Avg, Min, Max, Trunc
 from . import decorators
-from .model import Orm
+from .model import Orm, install_all
 from .interface import (
     get_interface,
     set_interface,
@@ -19,7 +19,8 @@ from .interface import (
     configure,
     configure_environ
 )
-from .exception import InterfaceError, Error, UniqueError
+from .exception import InterfaceError, Error, UniqueError, NPlusOneError
+from .instrument import profile, detect_n_plus_one, tag_queries
 from . import utils
 
 
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""
+Tools for measuring how prom performs against a real db, see prom.bench.load
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+A concurrent workload generator that reports throughput and latency
+
+this drives a mix of get, one, count, save, and delete operations against an
+interface from N threads (or N greenlets) so you can see how prom behaves under
+contention, size pool_maxconn, and compare backends:
+
+    $ python -m prom.bench.load --dsn "sqlite:///tmp/load.sqlite" --workers 8
+    $ python -m prom.bench.load --dsn "postgres://u:p@localhost/db" --workers 50 \\
+        --gevent --pool-maxconn 10 --mix get=50,one=30,save=15,delete=5
+
+the dsn defaults to the PROM_DSN environment variable. Postgres interfaces use
+prom's thread safe ConnectionPool unless the dsn (or --pool-class) says
+otherwise, so workers wait for a connection instead of failing when the pool is
+exhausted and the connection checkout numbers show how long they waited
+
+only operations that succeed count towards the latencies and ops/sec, failed
+operations are reported separately by exception class
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import threading
+from collections import Counter
+
+from ..compat import *
+from ..config import Field, Index
+from ..model import Orm
+from ..instrument import Histogram, MetricsRegistry
+from ..interface import configure, get_interface
+
+
+OPERATIONS = ["get", "one", "count", "save", "delete"]
+
+POOL_CLASS = "prom.interface.postgres.pool.ConnectionPool"
+"""the pool Postgres interfaces use unless they were configured with another one,
+psycopg2's default pool isn't thread safe and errors instead of waiting when all
+its connections are checked out"""
+
+
+def parse_mix(mix):
+    """parse a mix string (eg, "get=40,one=30,save=30") into weights
+
+    :param mix: string, comma separated op=weight pairs
+    :returns: list, (op, weight) tuples
+    """
+    ret = []
+    for part in mix.split(","):
+        part = part.strip()
+        if not part: continue
+        op, _, weight = part.partition("=")
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError("Unknown operation {}, must be one of {}".format(
+                op,
+                ", ".join(OPERATIONS)
+            ))
+        ret.append((op, float(weight or 1)))
+
+    if not ret or not sum(w for _, w in ret):
+        raise ValueError("Mix {} doesn't have any operations".format(mix))
+    return ret
+
+
+def is_lock_error(e):
+    """return True if e was caused by lock contention (eg, SQLite's "database is
+    locked" or a Postgres deadlock)"""
+    msg = String(e).lower()
+    for s in ["locked", "busy", "deadlock", "could not obtain lock", "could not serialize"]:
+        if s in msg:
+            return True
+    return False
+
+
+def is_postgres(interface):
+    """return True if interface is a Postgres interface"""
+    try:
+        from ..interface.postgres import PostgreSQL
+
+    except ImportError:
+        # psycopg2 isn't installed so this can't be a Postgres interface
+        return False
+
+    return isinstance(interface, PostgreSQL)
+
+
+def create_orm_class(interface):
+    """create the orm class the load is run against"""
+    suffix = "".join(random.sample(string.ascii_lowercase, 8))
+    return type(
+        String("LoadOrm"),
+        (Orm,),
+        {
+            "table_name": "prom_load_{}".format(suffix),
+            "interface": interface,
+            "foo": Field(int, True),
+            "bar": Field(str, True),
+            "che": Field(int, True),
+            "iche": Index("che"),
+        }
+    )
+
+
+class Keys(object):
+    """The primary keys of the rows the workers know about, shared by all the
+    workers so deletes don't usually go after rows that aren't there"""
+    def __init__(self, pks):
+        self.lock = threading.Lock()
+        self.pks = list(pks)
+
+    def choice(self, rand):
+        with self.lock:
+            return rand.choice(self.pks) if self.pks else None
+
+    def pop(self, rand):
+        with self.lock:
+            if not self.pks: return None
+            i = rand.randrange(len(self.pks))
+            self.pks[i], self.pks[-1] = self.pks[-1], self.pks[i]
+            return self.pks.pop()
+
+    def append(self, pk):
+        with self.lock:
+            self.pks.append(pk)
+
+
+class Worker(object):
+    """Runs operations until the deadline and records how long each successful
+    one took"""
+    def __init__(self, orm_class, keys, mix, seed=None):
+        self.orm_class = orm_class
+        self.keys = keys
+        self.ops = [op for op, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.rand = random.Random(seed)
+        self.latency = {op: Histogram() for op in OPERATIONS}
+        self.errors = {op: 0 for op in OPERATIONS}
+        self.lock_errors = {op: 0 for op in OPERATIONS}
+        self.error_classes = Counter()
+
+    def get_fields(self):
+        return {
+            "foo": self.rand.randint(1, 1000000),
+            "bar": "".join(self.rand.choice(string.ascii_letters) for _ in range(32)),
+            "che": self.rand.randint(1, 100),
+        }
+
+    def get(self):
+        for o in self.orm_class.query.is_che(self.rand.randint(1, 100)).limit(20).get():
+            pass
+
+    def one(self):
+        pk = self.keys.choice(self.rand)
+        if pk:
+            self.orm_class.query.is_pk(pk).one()
+
+    def count(self):
+        self.orm_class.query.is_che(self.rand.randint(1, 100)).count()
+
+    def save(self):
+        o = self.orm_class.create(self.get_fields())
+        self.keys.append(o.pk)
+
+    def delete(self):
+        pk = self.keys.pop(self.rand)
+        if pk:
+            self.orm_class.query.is_pk(pk).delete()
+
+    def run(self, deadline):
+        while time.time() < deadline:
+            op = self.rand.choices(self.ops, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                getattr(self, op)()
+
+            except Exception as e:
+                # a failure is usually much faster (or slower) than a success so
+                # it would skew the latencies
+                self.errors[op] += 1
+                if is_lock_error(e):
+                    self.lock_errors[op] += 1
+                self.error_classes[type(e).__name__] += 1
+
+            else:
+                self.latency[op].record(time.perf_counter() - start)
+
+
+class Load(object):
+    """Sets up the table, runs the workers, and builds the report"""
+    def __init__(self, interface, workers=8, duration=10.0, mix="get=40,one=30,count=10,save=15,delete=5", rows=1000, use_gevent=False):
+        """
+        :param interface: Interface, the interface to put under load
+        :param workers: int, how many threads (or greenlets) to run
+        :param duration: float, how many seconds to run the load
+        :param mix: string, the operation weights, see parse_mix()
+        :param rows: int, how many rows the table starts with
+        :param use_gevent: bool, True to run the workers as greenlets
+        """
+        self.interface = interface
+        self.workers = int(workers)
+        self.duration = float(duration)
+        self.mix = parse_mix(mix)
+        self.rows = int(rows)
+        self.use_gevent = use_gevent
+        self.orm_class = create_orm_class(interface)
+        self.metrics = MetricsRegistry()
+
+    def setup(self):
+        orm_class = self.orm_class
+        orm_class.install()
+        rand = random.Random(0)
+        pks = []
+        with self.interface.transaction():
+            for _ in range(self.rows):
+                o = orm_class.create(
+                    foo=rand.randint(1, 1000000),
+                    bar="".join(rand.choice(string.ascii_letters) for _ in range(32)),
+                    che=rand.randint(1, 100),
+                )
+                pks.append(o.pk)
+        return Keys(pks)
+
+    def teardown(self):
+        self.interface.unsafe_delete_table(self.orm_class.schema)
+
+    def run(self):
+        """run the load and return the report
+
+        :returns: dict
+        """
+        keys = self.setup()
+        workers = [
+            Worker(self.orm_class, keys, self.mix, seed=i) for i in range(self.workers)
+        ]
+
+        self.interface.add_observer(self.metrics)
+        start = time.time()
+        deadline = start + self.duration
+        try:
+            if self.use_gevent:
+                import gevent
+                gevent.joinall([gevent.spawn(w.run, deadline) for w in workers])
+
+            else:
+                threads = [threading.Thread(target=w.run, args=(deadline,)) for w in workers]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+        finally:
+            elapsed = time.time() - start
+            self.interface.remove_observer(self.metrics)
+
+        return self.report(workers, elapsed)
+
+    def report(self, workers, elapsed):
+        operations = {}
+        total = 0
+        total_errors = 0
+        error_classes = Counter()
+        for op in OPERATIONS:
+            latency = Histogram()
+            errors = lock_errors = 0
+            for w in workers:
+                latency.merge(w.latency[op])
+                errors += w.errors[op]
+                lock_errors += w.lock_errors[op]
+
+            if latency.count or errors:
+                total += latency.count
+                total_errors += errors
+                operations[op] = {
+                    "count": latency.count,
+                    "ops_per_sec": latency.count / elapsed,
+                    "p50": latency.percentile(50),
+                    "p99": latency.percentile(99),
+                    "p999": latency.percentile(99.9),
+                    "max": latency.max or 0.0,
+                    "errors": errors,
+                    "lock_errors": lock_errors,
+                }
+
+        for w in workers:
+            error_classes.update(w.error_classes)
+
+        wait = self.metrics.checkout_wait
+        return {
+            "interface": self.interface.connection_config.interface_name,
+            "workers": self.workers,
+            "mode": "gevent" if self.use_gevent else "threads",
+            "pool_maxconn": self.interface.connection_config.options.get("pool_maxconn", None),
+            "pool_class": self.interface.connection_config.options.get("pool_class", None),
+            "seconds": elapsed,
+            "ops": total,
+            "ops_per_sec": total / elapsed if elapsed else 0.0,
+            "errors": total_errors,
+            "error_classes": dict(error_classes.most_common()),
+            "operations": operations,
+            "pool_wait": {
+                "count": wait.count,
+                "total": wait.total,
+                "p50": wait.percentile(50),
+                "p99": wait.percentile(99),
+                "max": wait.max or 0.0,
+            },
+        }
+
+
+def print_report(report):
+    print("{} with {} {} for {:.1f} seconds: {} ops, {:.1f} ops/sec, {} errors".format(
+        report["interface"],
+        report["workers"],
+        report["mode"],
+        report["seconds"],
+        report["ops"],
+        report["ops_per_sec"],
+        report["errors"],
+    ))
+    print("")
+    print("{:<8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>8} {:>8}".format(
+        "op", "count", "ops/sec", "p50 ms", "p99 ms", "p999 ms", "errors", "locks"
+    ))
+    for op, r in report["operations"].items():
+        print("{:<8} {:>8} {:>10.1f} {:>10.3f} {:>10.3f} {:>10.3f} {:>8} {:>8}".format(
+            op,
+            r["count"],
+            r["ops_per_sec"],
+            r["p50"] * 1000.0,
+            r["p99"] * 1000.0,
+            r["p999"] * 1000.0,
+            r["errors"],
+            r["lock_errors"],
+        ))
+
+    if report["error_classes"]:
+        print("")
+        print("errors: {}".format(", ".join(
+            "{} {}".format(count, name) for name, count in report["error_classes"].items()
+        )))
+
+    wait = report["pool_wait"]
+    print("")
+    print("connection checkout: {} checkouts, p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+        wait["count"],
+        wait["p50"] * 1000.0,
+        wait["p99"] * 1000.0,
+        wait["max"] * 1000.0,
+    ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Put an interface under a concurrent load")
+    parser.add_argument("--dsn", default="", help="the prom dsn to test, defaults to PROM_DSN")
+    parser.add_argument("--workers", "-w", type=int, default=8, help="how many concurrent workers")
+    parser.add_argument("--duration", "-d", type=float, default=10.0, help="how many seconds to run")
+    parser.add_argument(
+        "--mix", "-m",
+        default="get=40,one=30,count=10,save=15,delete=5",
+        help="comma separated op=weight pairs of {}".format(", ".join(OPERATIONS)),
+    )
+    parser.add_argument("--rows", type=int, default=1000, help="how many rows to start with")
+    parser.add_argument("--gevent", action="store_true", help="use greenlets instead of threads")
+    parser.add_argument("--pool-maxconn", type=int, default=0, help="set the pool_maxconn option")
+    parser.add_argument(
+        "--pool-class",
+        default="",
+        help="set the pool_class option of a Postgres interface, defaults to {}".format(POOL_CLASS),
+    )
+    parser.add_argument("--output", "-o", default="", help="write the report to this json file")
+    args = parser.parse_args(argv)
+
+    interface = configure(args.dsn) if args.dsn else get_interface()
+
+    if args.gevent:
+        # this updates the configured Postgres interfaces so it has to happen
+        # after configure() but before the interface connects
+        from ..interface.postgres.gevent import patch_all
+        patch_all(maxconn=args.pool_maxconn or args.workers)
+
+    if is_postgres(interface):
+        # the pool has to be able to make workers wait for a connection or the
+        # load just measures how fast the pool can say no
+        interface.close()
+        options = interface.connection_config.options
+        if args.pool_class:
+            options["pool_class"] = args.pool_class
+        else:
+            options.setdefault("pool_class", POOL_CLASS)
+
+    if args.pool_maxconn:
+        interface.close()
+        options = interface.connection_config.options
+        options["pool_maxconn"] = args.pool_maxconn
+        options["pool_minconn"] = min(int(options.get("pool_minconn", 5)), args.pool_maxconn)
+
+    load = Load(
+        interface,
+        workers=args.workers,
+        duration=args.duration,
+        mix=args.mix,
+        rows=args.rows,
+        use_gevent=args.gevent,
+    )
+    try:
+        report = load.run()
+
+    finally:
+        load.teardown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
@@ -425,6 +425,63 @@ class Schema(object):
         return child_class
 
 
+class JoinSchema(Schema):
+    """The fields of a schema, the fields of the tables joined to it, and the
+    fields the query computes (eg, the _depth of Query.descendants()), the
+    joined fields are named <JOIN NAME>.<FIELD NAME> (eg, bar.name)
+
+    this is what the interface uses to build and decode a query that has joins
+    (see Query.join()), it doesn't have any indexes and is never a table
+    """
+    instances = {}
+    """class variable, holds an instance for each schema, joins, and fields combination"""
+
+    @classmethod
+    def get_instance(cls, schema, joins, fields=None):
+        """return a JoinSchema singleton instance
+
+        :param schema: Schema, the schema of the query's table
+        :param joins: list, tuples of (join_name, Schema)
+        :param fields: list, tuples of (field_name, field_type) of the computed fields
+        :returns: JoinSchema
+        """
+        key = (schema,) + tuple(joins) + tuple(fields or [])
+        if key not in cls.instances:
+            cls.instances[key] = cls(schema, joins, fields)
+        return cls.instances[key]
+
+    def __init__(self, schema, joins, fields=None):
+        super(JoinSchema, self).__init__(schema.table_name)
+        self.orm_class = schema.orm_class
+        self.schemas = {}
+
+        # the Field instances are shared with the schemas so they are added
+        # directly instead of through .set_field(), which would rename them
+        self.fields.update(schema.fields)
+        self.lookup["names"].update(schema.lookup["names"])
+        self.lookup["pk"] = schema.lookup["pk"]
+
+        for join_name, join_schema in joins:
+            self.schemas[join_name] = join_schema
+            for field_name, field in join_schema.fields.items():
+                self.fields["{}.{}".format(join_name, field_name)] = field
+
+            for name, field in join_schema.lookup["names"].items():
+                self.lookup["names"]["{}.{}".format(join_name, name)] = field
+
+        for field_name, field_type in (fields or []):
+            field = Field(field_type, True)
+            field.name = field_name
+            self.fields[field_name] = field
+            self.lookup["names"][field_name] = field
+
+    def field_name(self, k):
+        join_name, _, name = k.rpartition(".")
+        if join_name in self.schemas:
+            return "{}.{}".format(join_name, self.schemas[join_name].field_name(name))
+        return super(JoinSchema, self).field_name(k)
+
+
 class Index(object):
     """Each index on the table is configured using this class"""
 
@@ -16,3 +16,13 @@ class InterfaceError(Error):
 
 class UniqueError(InterfaceError):
     pass
+
+
+class NPlusOneError(Error):
+    """raised when the same query is run over and over with different values,
+    see prom.detect_n_plus_one()"""
+    def __init__(self, e, query=None, site=None, fingerprint=""):
+        self.query = query
+        self.site = site
+        self.fingerprint = fingerprint
+        super(NPlusOneError, self).__init__(e)
@@ -0,0 +1,932 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import re
+import sys
+import math
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from functools import lru_cache
+from contextlib import contextmanager
+
+from .compat import *
+from .exception import NPlusOneError
+
+
+logger = logging.getLogger(__name__)
+
+
+FINGERPRINT_STRING_REGEX = re.compile(r"'(?:[^']|'')*'")
+FINGERPRINT_COMMENT_REGEX = re.compile(r"/\*.*?\*/", re.DOTALL)
+FINGERPRINT_PLACEHOLDER_REGEX = re.compile(r"%s|%\(\w+\)s|\?|(?<!:):\w+")
+FINGERPRINT_NUMBER_REGEX = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+FINGERPRINT_LIST_REGEX = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+FINGERPRINT_SPACE_REGEX = re.compile(r"\s+")
+
+TAG_VALUE_REGEX = re.compile(r"[^\w.:/-]+")
+
+PROM_PATH = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+local = threading.local()
+"""per thread state, holds the tags set with tag_queries() and the context set
+with use_context()"""
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(query_str):
+    """normalize query_str so every execution of the same statement has the
+    same fingerprint no matter what values it was called with
+
+    string and number literals and placeholders all become ?, IN lists of any
+    size become IN (?), comments (like query tags) are removed, and whitespace
+    is collapsed
+
+    :param query_str: string, the SQL statement
+    :returns: string, the normalized statement
+    """
+    fp = FINGERPRINT_STRING_REGEX.sub("?", query_str)
+    fp = FINGERPRINT_COMMENT_REGEX.sub("", fp)
+    fp = FINGERPRINT_PLACEHOLDER_REGEX.sub("?", fp)
+    fp = FINGERPRINT_NUMBER_REGEX.sub("?", fp)
+    fp = FINGERPRINT_LIST_REGEX.sub("(?)", fp)
+    fp = FINGERPRINT_SPACE_REGEX.sub(" ", fp)
+    return fp.strip()
+
+
+def call_site(skip=None):
+    """find the first frame on the stack that isn't in prom (or contextlib)
+
+    :param skip: tuple, more path prefixes whose frames should be skipped
+    :returns: tuple, (module, lineno, function) of the code that caused the
+        query, or ("", 0, "") if every frame is in prom
+    """
+    site = getattr(local, "site", None)
+    if site:
+        # the query is being run for another thread, see use_context()
+        return site
+
+    paths = (PROM_PATH,) + tuple(skip or ())
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(paths) and not filename.endswith("contextlib.py"):
+            return (
+                frame.f_globals.get("__name__", filename),
+                frame.f_lineno,
+                frame.f_code.co_name,
+            )
+        frame = frame.f_back
+
+    return ("", 0, "")
+
+
+def query_tags():
+    """return the tags that have been set for the current thread with tag_queries()
+
+    :returns: dict
+    """
+    return getattr(local, "tags", {})
+
+
+@contextmanager
+def tag_queries(**tags):
+    """add tags to the comment of every query run on this thread inside the with
+    block, these are nested so inner blocks add to (and can override) the tags
+    of outer blocks. Interfaces only tag queries if they have the tag_queries
+    dsn option
+
+    :example:
+        with prom.tag_queries(request_id=request.id):
+            handle(request)
+    :param **tags: the tag names and their values
+    """
+    previous = query_tags()
+    local.tags = dict(previous, **tags)
+    try:
+        yield local.tags
+
+    finally:
+        local.tags = previous
+
+
+def thread_ident():
+    """return the ident of the thread queries on this thread are being run for,
+    this is the current thread unless it is inside use_context()"""
+    return getattr(local, "ident", None) or threading.get_ident()
+
+
+def current_context():
+    """capture this thread's instrumentation state so use_context() can apply it
+    to queries another thread runs on this thread's behalf
+
+    :returns: dict
+    """
+    return {
+        "ident": thread_ident(),
+        "tags": query_tags(),
+        "site": call_site(),
+    }
+
+
+@contextmanager
+def use_context(context):
+    """inside the with block the queries this thread runs are tagged, observed,
+    and attributed as if the thread that called current_context() ran them
+
+    :param context: dict, returned from current_context()
+    """
+    previous = (
+        getattr(local, "ident", None),
+        query_tags(),
+        getattr(local, "site", None),
+    )
+    local.ident = context["ident"]
+    local.tags = context["tags"]
+    local.site = context["site"]
+    try:
+        yield context
+
+    finally:
+        local.ident, local.tags, local.site = previous
+
+
+def format_tags(tags):
+    """format tags into a SQL comment
+
+    values are cleaned so the comment is always key=value pairs that can't
+    break out of the comment
+
+    :param tags: list, (name, value) tuples, pairs with empty values are skipped
+    :returns: string, the comment (eg, /* orm=Foo,op=get */)
+    """
+    parts = []
+    for k, v in tags:
+        if v is None or v == "": continue
+        parts.append("{}={}".format(
+            TAG_VALUE_REGEX.sub("_", String(k)),
+            TAG_VALUE_REGEX.sub("_", String(v)),
+        ))
+    return "/* {} */".format(",".join(parts)) if parts else ""
+
+
+class QueryEvent(object):
+    """Everything an Observer gets told about one query
+
+    all the times are in seconds. Results that are returned as a cursor are
+    fetched (and usually hydrated into Orm instances) after the interface has
+    returned, so the event doesn't finish until the cursor is exhausted, closed,
+    or garbage collected
+    """
+    @property
+    def fingerprint(self):
+        return fingerprint(self.query_str)
+
+    @property
+    def operation(self):
+        """the SQL command of the statement (eg, SELECT, INSERT)"""
+        parts = self.query_str.lstrip().split(None, 1)
+        return parts[0].upper() if parts else ""
+
+    @property
+    def total_time(self):
+        return self.build_time + self.execute_time + self.fetch_time + self.hydrate_time
+
+    def __init__(self, interface, observers, query_str, query_args=None, schema=None, build_time=0.0, query=None):
+        """
+        :param interface: Interface, the interface that ran the query
+        :param observers: list, the Observer instances to notify
+        :param query_str: string, the SQL statement
+        :param query_args: list, the values bound to the statement
+        :param schema: Schema, the schema of the rows being selected if known
+        :param build_time: float, how long it took to generate query_str
+        :param query: Query, the query that query_str was generated from if known
+        """
+        self.interface = interface
+        self.observers = observers
+        self.query_str = query_str
+        self.query_args = query_args
+        self.schema = schema
+        self.query = query
+        self.start = time.time()
+        self.build_time = build_time
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.hydrate_time = 0.0
+        self.rowcount = 0
+        self.hydrated = 0
+        self.filtered = 0
+        self.error = None
+        self.finished = False
+
+        for observer in observers:
+            observer.query_start(self)
+
+    def finish(self, error=None):
+        """let the observers know the query is done, this only does anything the
+        first time it is called"""
+        if self.finished: return
+        self.finished = True
+        self.error = error
+        for observer in self.observers:
+            try:
+                observer.query_end(self)
+
+            except Exception as e:
+                logger.exception(e)
+
+    def __str__(self):
+        return "{} {:.6f} seconds, {} rows: {}".format(
+            self.operation,
+            self.total_time,
+            self.rowcount,
+            self.fingerprint,
+        )
+
+
+class Cursor(object):
+    """Wraps a db cursor to time the fetches for a QueryEvent, the event is
+    finished once all the rows have been fetched or the cursor is closed"""
+    def __init__(self, cursor, event):
+        self.cursor = cursor
+        self.event = event
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = next(self.cursor)
+
+        except StopIteration:
+            self.event.fetch_time += time.perf_counter() - start
+            self.event.finish()
+            raise
+
+        self.event.fetch_time += time.perf_counter() - start
+        self.event.rowcount += 1
+        return row
+
+    next = __next__
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self.cursor.fetchone()
+        self.event.fetch_time += time.perf_counter() - start
+        if row is None:
+            self.event.finish()
+        else:
+            self.event.rowcount += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self.cursor.fetchmany() if size is None else self.cursor.fetchmany(size)
+        self.event.fetch_time += time.perf_counter() - start
+        self.event.rowcount += len(rows)
+        if not rows:
+            self.event.finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self.cursor.fetchall()
+        self.event.fetch_time += time.perf_counter() - start
+        self.event.rowcount += len(rows)
+        self.event.finish()
+        return rows
+
+    def close(self):
+        self.event.finish()
+        return self.cursor.close()
+
+    def __getattr__(self, k):
+        return getattr(self.cursor, k)
+
+    def __del__(self):
+        event = self.__dict__.get("event", None)
+        if event is not None:
+            event.finish()
+
+
+class Observer(object):
+    """Base class for anything that wants to be told about queries, add instances
+    to an interface with Interface.add_observer()
+
+    these methods are called on the thread that ran the query, so they need to
+    be quick and thread safe
+    """
+    def query_start(self, event):
+        """called right before the query is sent to the db
+
+        :param event: QueryEvent
+        """
+        pass
+
+    def query_end(self, event):
+        """called once the query's results have been fetched, event.error will
+        be set if the query failed
+
+        :param event: QueryEvent
+        """
+        pass
+
+    def checkout(self, interface, wait_time):
+        """called every time the interface gets a connection
+
+        :param interface: Interface
+        :param wait_time: float, how many seconds it took to get the connection
+        """
+        pass
+
+
+class Histogram(object):
+    """A latency histogram using log scaled buckets so recording a value is
+    O(1) and the memory used is fixed no matter how many values are recorded
+
+    percentiles are accurate to within the growth factor of the buckets (5% by
+    default)
+    """
+    def __init__(self, minimum=0.000001, growth=1.05):
+        """
+        :param minimum: float, values smaller than this all go into the first bucket
+        :param growth: float, how much bigger each bucket is than the last
+        """
+        self.minimum = minimum
+        self.growth = growth
+        self.log_growth = math.log(growth)
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        if value <= self.minimum:
+            i = 0
+        else:
+            i = int(math.log(value / self.minimum) / self.log_growth) + 1
+
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+
+    def merge(self, other):
+        """add all the values recorded in other to this histogram, both histograms
+        need to have the same minimum and growth"""
+        for i, count in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def percentile(self, p):
+        """return the value that p percent of the recorded values are less than or
+        equal to
+
+        :param p: float, between 0 and 100
+        :returns: float, 0.0 if nothing has been recorded
+        """
+        if not self.count: return 0.0
+
+        rank = max(1, int(math.ceil(self.count * (p / 100.0))))
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                # the upper edge of the bucket, but never more than we've actually seen
+                v = self.minimum * (self.growth ** i)
+                return min(max(v, self.min), self.max)
+
+        return self.max
+
+    @property
+    def mean(self):
+        return (self.total / self.count) if self.count else 0.0
+
+    def jsonable(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min or 0.0,
+            "max": self.max or 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class QueryStats(object):
+    """The metrics MetricsRegistry keeps for each fingerprint"""
+    def __init__(self, fingerprint, operation):
+        self.fingerprint = fingerprint
+        self.operation = operation
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.hydrated = 0
+        self.build_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.hydrate_time = 0.0
+        self.latency = Histogram()
+
+    def record(self, event):
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.rows += event.rowcount
+        self.hydrated += event.hydrated
+        self.build_time += event.build_time
+        self.execute_time += event.execute_time
+        self.fetch_time += event.fetch_time
+        self.hydrate_time += event.hydrate_time
+        self.latency.record(event.total_time)
+
+    def jsonable(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "operation": self.operation,
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "hydrated": self.hydrated,
+            "build_time": self.build_time,
+            "execute_time": self.execute_time,
+            "fetch_time": self.fetch_time,
+            "hydrate_time": self.hydrate_time,
+            "latency": self.latency.jsonable(),
+        }
+
+
+class MetricsRegistry(Observer):
+    """In process query metrics
+
+    :example:
+        metrics = MetricsRegistry()
+        Foo.interface.add_observer(metrics)
+        # ... run some queries ...
+        for stats in metrics.top(10):
+            print(stats.fingerprint, stats.latency.percentile(99))
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.queries = {}
+            self.checkout_wait = Histogram()
+            self.rows_hydrated = 0
+
+    def query_end(self, event):
+        fp = event.fingerprint
+        with self.lock:
+            stats = self.queries.get(fp, None)
+            if stats is None:
+                stats = QueryStats(fp, event.operation)
+                self.queries[fp] = stats
+            stats.record(event)
+            self.rows_hydrated += event.hydrated
+
+    def checkout(self, interface, wait_time):
+        with self.lock:
+            self.checkout_wait.record(wait_time)
+
+    def top(self, n=10, key="total"):
+        """return the n fingerprints that have used the most time
+
+        :param n: int, how many to return
+        :param key: string, one of total, count, or p99
+        :returns: list, QueryStats instances
+        """
+        keys = {
+            "total": lambda s: s.latency.total,
+            "count": lambda s: s.count,
+            "p99": lambda s: s.latency.percentile(99),
+        }
+        with self.lock:
+            stats = list(self.queries.values())
+        return sorted(stats, key=keys[key], reverse=True)[:n]
+
+    def jsonable(self):
+        with self.lock:
+            return {
+                "queries": [s.jsonable() for s in self.queries.values()],
+                "checkout_wait": self.checkout_wait.jsonable(),
+                "rows_hydrated": self.rows_hydrated,
+            }
+
+
+class SlowQueryLog(Observer):
+    """Log every query that takes longer than threshold seconds
+
+    the most recent slow queries are also kept in .entries so they can be
+    looked at without going through the logs. This can be turned on for an
+    interface using the slow_query_threshold dsn option
+    """
+    def __init__(self, threshold=1.0, maxlen=100, level=logging.WARNING):
+        """
+        :param threshold: float, queries that take at least this many seconds are slow
+        :param maxlen: int, how many slow queries to keep in .entries
+        :param level: int, the level the slow queries are logged at
+        """
+        self.threshold = float(threshold)
+        self.level = level
+        self.entries = deque(maxlen=maxlen)
+
+    def query_end(self, event):
+        if event.total_time >= self.threshold:
+            self.entries.append(event)
+            if logger.isEnabledFor(self.level):
+                logger.log(
+                    self.level,
+                    "Slow query ({:.6f} build, {:.6f} execute, {:.6f} fetch, {:.6f} hydrate): {}".format(
+                        event.build_time,
+                        event.execute_time,
+                        event.fetch_time,
+                        event.hydrate_time,
+                        event,
+                    )
+                )
+
+
+class ScopedObserver(Observer):
+    """An Observer that is added to interfaces for the length of a with block,
+    it should only pay attention to queries when in_scope() is True, which is
+    only on the thread that entered the block, or threads running queries for it
+    (see use_context())"""
+    def __init__(self, *interfaces):
+        """
+        :param *interfaces: Interface, the interfaces to observe, defaults to all
+            the configured interfaces
+        """
+        self.interfaces = interfaces
+        self.ident = None
+
+    def in_scope(self):
+        return thread_ident() == self.ident
+
+    def __enter__(self):
+        self.ident = thread_ident()
+        if not self.interfaces:
+            from .interface import get_interfaces # avoid circular import
+            self.interfaces = tuple(get_interfaces().values())
+
+        for interface in self.interfaces:
+            interface.add_observer(self)
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        for interface in self.interfaces:
+            interface.remove_observer(self)
+
+
+class ProfileEntry(object):
+    """The totals Profile keeps for each statement run from each call site"""
+    @property
+    def total_time(self):
+        return self.build_time + self.execute_time + self.fetch_time + self.hydrate_time
+
+    def __init__(self, fingerprint, site):
+        self.fingerprint = fingerprint
+        self.site = site
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.hydrated = 0
+        self.filtered = 0
+        self.allocated = 0
+        self.build_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.hydrate_time = 0.0
+
+    def record(self, event, allocated=0):
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.rows += event.rowcount
+        self.hydrated += event.hydrated
+        self.filtered += event.filtered
+        self.allocated += allocated
+        self.build_time += event.build_time
+        self.execute_time += event.execute_time
+        self.fetch_time += event.fetch_time
+        self.hydrate_time += event.hydrate_time
+
+    def jsonable(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "site": "{}:{}".format(self.site[0], self.site[1]),
+            "function": self.site[2],
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "hydrated": self.hydrated,
+            "filtered": self.filtered,
+            "allocated": self.allocated,
+            "build_time": self.build_time,
+            "execute_time": self.execute_time,
+            "fetch_time": self.fetch_time,
+            "hydrate_time": self.hydrate_time,
+            "total_time": self.total_time,
+        }
+
+
+class Profile(ScopedObserver):
+    """Record where the time went for every query run inside a with block
+
+    only queries run on the thread that entered the block are recorded, each
+    one is attributed to the first line of code outside of prom that caused it.
+    Allocations are the change in memory traced by tracemalloc between the
+    query starting and its results being fetched and hydrated, tracemalloc is
+    slow so pass trace_memory=False if you don't need them
+
+    :example:
+        with prom.profile() as p:
+            foos = list(Foo.query.is_bar(1).get())
+        p.print_summary()
+    """
+    def __init__(self, *interfaces, **kwargs):
+        """
+        :param *interfaces: Interface, the interfaces to profile, defaults to all
+            the configured interfaces
+        :param **kwargs:
+            trace_memory -- boolean -- True to record allocations (default True)
+        """
+        super(Profile, self).__init__(*interfaces)
+        self.trace_memory = kwargs.get("trace_memory", True)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+            self.running = {}
+            self.start = None
+            self.stop = None
+
+    def __enter__(self):
+        self.tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+
+        super(Profile, self).__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        self.stop = time.perf_counter()
+        super(Profile, self).__exit__(exception_type, exception_val, trace)
+
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def query_start(self, event):
+        if not self.in_scope(): return
+        memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        with self.lock:
+            self.running[id(event)] = (call_site(), memory)
+
+    def query_end(self, event):
+        with self.lock:
+            running = self.running.pop(id(event), None)
+        if running is None: return
+
+        site, memory = running
+        allocated = 0
+        if memory and tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - memory
+
+        k = (site, event.fingerprint)
+        with self.lock:
+            entry = self.entries.get(k, None)
+            if entry is None:
+                entry = ProfileEntry(event.fingerprint, site)
+                self.entries[k] = entry
+            entry.record(event, allocated)
+
+    def summary(self, n=10, key="total"):
+        """return the n statements/call sites that used the most time
+
+        :param n: int, how many to return, 0 for all of them
+        :param key: string, one of total, count, rows, or allocated
+        :returns: list, ProfileEntry instances
+        """
+        keys = {
+            "total": lambda e: e.total_time,
+            "count": lambda e: e.count,
+            "rows": lambda e: e.rows,
+            "allocated": lambda e: e.allocated,
+        }
+        with self.lock:
+            entries = list(self.entries.values())
+        entries.sort(key=keys[key], reverse=True)
+        return entries[:n] if n else entries
+
+    def rollup(self):
+        """the totals of every query run inside the block, this is small enough
+        to log with every request
+
+        :returns: dict
+        """
+        ret = {
+            "seconds": 0.0,
+            "queries": 0,
+            "errors": 0,
+            "rows": 0,
+            "hydrated": 0,
+            "filtered": 0,
+            "allocated": 0,
+            "build_time": 0.0,
+            "execute_time": 0.0,
+            "fetch_time": 0.0,
+            "hydrate_time": 0.0,
+            "total_time": 0.0,
+        }
+        if self.start is not None:
+            ret["seconds"] = (self.stop or time.perf_counter()) - self.start
+
+        for entry in self.summary(0):
+            ret["queries"] += entry.count
+            for k in ["errors", "rows", "hydrated", "filtered", "allocated"]:
+                ret[k] += getattr(entry, k)
+            for k in ["build_time", "execute_time", "fetch_time", "hydrate_time", "total_time"]:
+                ret[k] += getattr(entry, k)
+        return ret
+
+    def jsonable(self):
+        ret = self.rollup()
+        ret["entries"] = [e.jsonable() for e in self.summary(0)]
+        return ret
+
+    def print_summary(self, n=10, key="total", stream=None):
+        """print the rollup and the n most expensive statements/call sites
+
+        :param n: int, how many statements to print
+        :param key: string, what to rank the statements by, see summary()
+        :param stream: io.IOBase, where to print, defaults to stdout
+        """
+        stream = stream or sys.stdout
+        r = self.rollup()
+        print("{} queries in {:.3f} ms ({:.3f} ms in queries), {} rows, {} hydrated, {} filtered, {} bytes allocated".format(
+            r["queries"],
+            r["seconds"] * 1000.0,
+            r["total_time"] * 1000.0,
+            r["rows"],
+            r["hydrated"],
+            r["filtered"],
+            r["allocated"],
+        ), file=stream)
+
+        for i, e in enumerate(self.summary(n, key), 1):
+            print("", file=stream)
+            print("{}. {}:{} in {}() ran {} times".format(
+                i,
+                e.site[0],
+                e.site[1],
+                e.site[2],
+                e.count,
+            ), file=stream)
+            print("   {}".format(e.fingerprint), file=stream)
+            print("   total {:.3f} ms: build {:.3f}, execute {:.3f}, fetch {:.3f}, hydrate {:.3f}".format(
+                e.total_time * 1000.0,
+                e.build_time * 1000.0,
+                e.execute_time * 1000.0,
+                e.fetch_time * 1000.0,
+                e.hydrate_time * 1000.0,
+            ), file=stream)
+            print("   {} rows, {} hydrated, {} filtered, {} bytes allocated".format(
+                e.rows,
+                e.hydrated,
+                e.filtered,
+                e.allocated,
+            ), file=stream)
+
+
+def profile(*interfaces, **kwargs):
+    """profile every query run inside a with block, see Profile
+
+    :example:
+        with prom.profile() as p:
+            handle_request()
+        logger.info(p.rollup())
+    """
+    return Profile(*interfaces, **kwargs)
+
+
+class NPlusOneDetector(ScopedObserver):
+    """Notice when the same SELECT is run over and over from the same line of
+    code with different values, which is usually a loop that should have been
+    one query (eg, accessing a foreign key on every Orm in a list)
+
+    only the first time each statement passes the threshold is reported, the
+    report is logged as a warning or raised as an NPlusOneError if strict is
+    True. Every report is also kept in .detections
+    """
+    def __init__(self, *interfaces, **kwargs):
+        """
+        :param *interfaces: Interface, the interfaces to watch, defaults to all
+            the configured interfaces
+        :param **kwargs:
+            threshold -- int -- how many different values are allowed (default 10)
+            strict -- boolean -- True to raise instead of warn (default False)
+        """
+        super(NPlusOneDetector, self).__init__(*interfaces)
+        self.threshold = int(kwargs.get("threshold", 10))
+        self.strict = kwargs.get("strict", False)
+        self.queries = {}
+        self.detections = []
+
+    def query_start(self, event):
+        if not self.in_scope(): return
+        if not event.query_args or event.operation != "SELECT": return
+
+        site = call_site()
+        fp = event.fingerprint
+        values = self.queries.setdefault((site, fp), set())
+        values.add(repr(tuple(event.query_args)))
+        if len(values) == self.threshold + 1:
+            query = event.query
+            e = NPlusOneError(
+                "{} ran {} times with different values from {}:{} in {}(): {}".format(
+                    repr(query) if query is not None else "Query",
+                    len(values),
+                    site[0],
+                    site[1],
+                    site[2],
+                    fp,
+                ),
+                query=query,
+                site=site,
+                fingerprint=fp,
+            )
+            self.detections.append(e)
+            if self.strict:
+                raise e
+
+            logger.warning("Possible N+1 query, {}".format(e))
+
+
+def detect_n_plus_one(*interfaces, **kwargs):
+    """watch for N+1 queries inside a with block, see NPlusOneDetector
+
+    :example:
+        with prom.detect_n_plus_one(threshold=10, strict=True):
+            for foo in Foo.query.get():
+                foo.bar # raises NPlusOneError on the 11th different bar
+    """
+    return NPlusOneDetector(*interfaces, **kwargs)
+
+
+class QueryCounter(ScopedObserver):
+    """Keeps every query run inside a with block in .events"""
+    def __init__(self, *interfaces):
+        super(QueryCounter, self).__init__(*interfaces)
+        self.events = []
+
+    @property
+    def count(self):
+        return len(self.events)
+
+    def query_start(self, event):
+        if self.in_scope():
+            self.events.append(event)
+
+
+@contextmanager
+def assert_max_queries(count, *interfaces):
+    """test helper that fails if the block runs more than count queries
+
+    :example:
+        with assert_max_queries(2):
+            foos = list(Foo.query.get())
+    :param count: int, the most queries the block is allowed to run
+    :param *interfaces: Interface, the interfaces to count, defaults to all
+        the configured interfaces
+    :raises: AssertionError
+    """
+    with QueryCounter(*interfaces) as counter:
+        yield counter
+
+    if counter.count > count:
+        raise AssertionError("Expected at most {} queries but {} ran:{}{}".format(
+            count,
+            counter.count,
+            os.linesep,
+            os.linesep.join(
+                "{}. {}".format(i, e.fingerprint) for i, e in enumerate(counter.events, 1)
+            ),
+        ))
@@ -4,12 +4,23 @@ import sys
 import os
 import datetime
 import logging
+import threading
 from contextlib import contextmanager
-import uuid as uuidgen
+from concurrent.futures import Future
+import itertools
+import time
 
 # first party
-from ..query import Query
-from ..exception import InterfaceError, UniqueError
+from ..query import Query, Aggregate, Trunc
+from ..instrument import (
+    QueryEvent,
+    Cursor as InstrumentCursor,
+    SlowQueryLog,
+    call_site,
+    query_tags,
+    format_tags,
+)
+from ..exception import Error, InterfaceError, UniqueError
 from ..decorators import reconnecting
 from ..compat import *
 from ..utils import make_list
@@ -31,16 +42,23 @@ class Connection(object):
     transaction_fail will set this back to 0 and rollback the transaction
     """
 
+    transaction_counter = itertools.count(1)
+    """shared by all connections, used to generate unique transaction names"""
+
     def transaction_name(self):
-        """generate a random transaction name for use in start_transaction() and
+        """generate a unique transaction name for use in start_transaction() and
         fail_transaction()"""
-        name = uuidgen.uuid4()
-        return "p{}".format(str(name)[-5:])
+        return "p{}".format(next(self.transaction_counter))
 
     def in_transaction(self):
         """return true if currently in a transaction"""
         return self.transaction_count > 0
 
+    def in_failed_transaction(self):
+        """return True if the current transaction has failed and can't run any
+        more queries until it is rolled back"""
+        return False
+
     def transaction_start(self, name):
         """
         start a transaction
@@ -128,6 +146,312 @@ class SQLConnection(Connection):
         cur.execute("ROLLBACK TO SAVEPOINT {}".format(name))
 
 
+class PipelineOperation(object):
+    """A write that has been queued in a Pipeline, the future will be resolved
+    with the result of the write when the pipeline is flushed"""
+    def __init__(self, method_name, schema, *args):
+        self.method_name = method_name
+        self.schema = schema
+        self.args = args
+        self.future = Future()
+
+
+class Pipeline(object):
+    """Queues insert/update/delete calls so they can be sent to the db in one go
+
+    you should not create these directly, use Interface.pipeline()
+
+    https://www.psycopg.org/docs/extras.html#fast-execution-helpers
+    """
+    def __init__(self, interface):
+        self.interface = interface
+        self.operations = []
+
+    def __len__(self):
+        return len(self.operations)
+
+    def append(self, method_name, schema, *args):
+        operation = PipelineOperation(method_name, schema, *args)
+        self.operations.append(operation)
+        return operation.future
+
+    def insert(self, schema, fields):
+        return self.append("insert", schema, fields)
+
+    def update(self, schema, fields, query):
+        return self.append("update", schema, fields, query)
+
+    def delete(self, schema, query):
+        if not query or not query.fields_where:
+            raise ValueError('aborting delete because there is no where clause')
+        return self.append("delete", schema, query)
+
+    def flush(self, **kwargs):
+        """send all the queued operations to the db and resolve their futures"""
+        operations = self.operations
+        self.operations = []
+        if not operations: return
+
+        try:
+            results = self.interface.execute_operations(operations, **kwargs)
+
+        except Exception as e:
+            for operation in operations:
+                operation.future.set_exception(e)
+            raise
+
+        else:
+            for operation, result in zip(operations, results):
+                operation.future.set_result(result)
+
+    def cancel(self):
+        operations = self.operations
+        self.operations = []
+        for operation in operations:
+            operation.future.cancel()
+
+
+class ListCursor(object):
+    """A cursor over rows that are already in memory (eg, merged from more than
+    one shard), it has as much of the db cursor interface as query.Iterator uses"""
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = len(rows)
+        self.it = iter(rows)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.it)
+
+    next = __next__
+
+    def fetchone(self):
+        return next(self.it, None)
+
+    def fetchmany(self, size=1):
+        return list(itertools.islice(self.it, size))
+
+    def fetchall(self):
+        return list(self.it)
+
+    def close(self):
+        self.it = iter([])
+
+
+class SchemaCache(object):
+    """Remembers the tables, fields, and indexes the db is known to have so the
+    catalog doesn't have to be queried every time
+
+    this is only trusted for things that exist, if a table isn't in the cache the
+    interface will still check the db before deciding it doesn't exist, and
+    Interface.has_table() always checks the db. It is
+    filled with one bulk catalog query (see Interface._get_catalog()) and
+    cleared whenever the interface has to handle an error
+
+    you shouldn't need to create this directly, use Interface.get_schema_cache()
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.loaded = False
+            self.tables = {}
+
+    def load(self, tables):
+        """
+        tables -- dict -- {table_name: {"fields": [field_name, ...],
+            "indexes": {index_name: [field_name, ...]}}}
+        """
+        with self.lock:
+            self.tables = {}
+            for table_name, table in tables.items():
+                self.tables[table_name] = {
+                    "fields": set(table.get("fields", [])),
+                    "indexes": dict(table.get("indexes", {})),
+                }
+            self.loaded = True
+
+    def __contains__(self, table_name):
+        return str(table_name) in self.tables
+
+    def add_table(self, table_name, fields=None, indexes=None):
+        """
+        fields -- list -- the field names, None if they aren't known
+        indexes -- dict -- {index_name: fields}, None if they aren't known
+        """
+        with self.lock:
+            self.tables[str(table_name)] = {
+                "fields": None if fields is None else set(fields),
+                "indexes": None if indexes is None else dict(indexes),
+            }
+
+    def add_schema(self, schema):
+        self.add_table(
+            schema,
+            fields=schema.fields.keys(),
+            indexes={name: index.fields for name, index in schema.indexes.items()},
+        )
+
+    def add_fields(self, table_name, field_names):
+        with self.lock:
+            table = self.tables.get(str(table_name), None)
+            if table and table["fields"] is not None:
+                table["fields"].update(field_names)
+
+    def remove_table(self, table_name):
+        with self.lock:
+            self.tables.pop(str(table_name), None)
+
+    def get_fields(self, table_name):
+        """return the set of field names of table_name or None if they aren't known"""
+        table = self.tables.get(str(table_name), None)
+        return None if table is None else table["fields"]
+
+
+class PlanNode(object):
+    """One step of a query plan, see Plan
+
+    the node types are normalized across the interfaces, so a full table scan
+    is always "Seq Scan", a scan using an index is "Index Scan", and a sort
+    that couldn't use an index is "Sort", anything else keeps the name the db
+    gave it
+    """
+    SEQ_SCAN = "Seq Scan"
+    INDEX_SCAN = "Index Scan"
+    SORT = "Sort"
+
+    def __init__(self, node_type, relation=None, index=None, rows=None, cost=None, **kwargs):
+        """
+        :param node_type: string, the normalized node type
+        :param relation: string, the table this node reads from
+        :param index: string, the index this node uses
+        :param rows: float, the estimated number of rows this node returns, None
+            if the db doesn't estimate rows
+        :param cost: float, the estimated total cost of this node, None if the db
+            doesn't estimate costs
+        :param **kwargs:
+            actual_rows: float, the rows the node returned (analyze only)
+            actual_time: float, the milliseconds the node took (analyze only)
+            detail: string|dict, what the db actually returned for this node
+        """
+        self.node_type = node_type
+        self.relation = relation
+        self.index = index
+        self.rows = rows
+        self.cost = cost
+        self.actual_rows = kwargs.get("actual_rows", None)
+        self.actual_time = kwargs.get("actual_time", None)
+        self.detail = kwargs.get("detail", None)
+        self.children = []
+
+    def is_seq_scan(self):
+        return self.node_type == self.SEQ_SCAN
+
+    def is_index_scan(self):
+        return self.index is not None
+
+    def is_sort(self):
+        return self.node_type == self.SORT
+
+    def __iter__(self):
+        """depth first iteration of this node and all its children"""
+        yield self
+        for child in self.children:
+            for node in child:
+                yield node
+
+    def __str__(self):
+        parts = [self.node_type]
+        if self.relation:
+            parts.append("on {}".format(self.relation))
+        if self.index:
+            parts.append("using {}".format(self.index))
+        if self.rows is not None:
+            parts.append("(rows={} cost={})".format(self.rows, self.cost))
+        return " ".join(parts)
+
+
+class Plan(object):
+    """The query plan returned from Interface.explain()
+
+    :example:
+        plan = Foo.query.is_bar(1).explain()
+        assert not plan.has_seq_scan()
+        print(plan)
+    """
+    @property
+    def rows(self):
+        """the estimated rows the query returns, None if the db doesn't say"""
+        return self.nodes[0].rows if self.nodes else None
+
+    @property
+    def cost(self):
+        """the estimated total cost of the query, None if the db doesn't say"""
+        return self.nodes[0].cost if self.nodes else None
+
+    def __init__(self, nodes, query_str="", query_args=None, raw=None):
+        """
+        :param nodes: list, the top level PlanNode instances
+        :param query_str: string, the SQL that was explained
+        :param query_args: list, the values that were bound to query_str
+        :param raw: mixed, what the db returned
+        """
+        self.nodes = nodes
+        self.query_str = query_str
+        self.query_args = query_args or []
+        self.raw = raw
+
+    def __iter__(self):
+        for node in self.nodes:
+            for n in node:
+                yield n
+
+    def seq_scans(self):
+        """return the tables that are fully scanned"""
+        return [n.relation for n in self if n.is_seq_scan()]
+
+    def has_seq_scan(self, table_name=None):
+        """return True if the query does a full scan of table_name (or any table
+        if table_name is None)"""
+        for n in self:
+            if n.is_seq_scan():
+                if table_name is None or n.relation == str(table_name):
+                    return True
+        return False
+
+    def has_sort(self):
+        """return True if the query has to sort rows itself (usually in a temp
+        structure) instead of reading them from an index in order"""
+        for n in self:
+            if n.is_sort(): return True
+        return False
+
+    def uses_index(self, index_name=None):
+        """return True if the query uses index_name (or any index if index_name
+        is None), the index name only has to be contained in the db's index name
+        since the interfaces prefix index names with the table name"""
+        for n in self:
+            if n.index:
+                if index_name is None or index_name in n.index:
+                    return True
+        return False
+
+    def __str__(self):
+        lines = []
+        def render(node, depth):
+            lines.append("{}{}".format("  " * depth, node))
+            for child in node.children:
+                render(child, depth + 1)
+
+        for node in self.nodes:
+            render(node, 0)
+        return os.linesep.join(lines)
+
+
 class Interface(object):
 
     connected = False
@@ -149,6 +473,14 @@ class Interface(object):
 
     def __init__(self, connection_config=None):
         self.connection_config = connection_config
+        # holds state that is specific to the current thread (or greenlet if
+        # gevent has patched threading)
+        self.local = threading.local()
+        self.schema_cache = SchemaCache()
+        # instrument.Observer instances, this list is replaced instead of
+        # modified so it can be iterated without a lock
+        self.observers = []
+        self.slow_query_log = None
 
     def connect(self, connection_config=None, *args, **kwargs):
         """
@@ -163,6 +495,11 @@ class Interface(object):
 
         if connection_config: self.connection_config = connection_config
 
+        threshold = self.connection_config.options.get("slow_query_threshold", None)
+        if threshold and not self.slow_query_log:
+            self.slow_query_log = SlowQueryLog(float(threshold))
+            self.add_observer(self.slow_query_log)
+
         self.connected = True
         try:
             self._connect(self.connection_config)
@@ -182,6 +519,21 @@ class Interface(object):
 
     def is_connected(self): return self.connected
 
+    def max_concurrency(self):
+        """return how many queries this interface can run at the same time, this
+        is the pool_maxconn option since each query needs its own connection"""
+        return int(self.connection_config.options.get("pool_maxconn", 5))
+
+    def add_observer(self, observer):
+        """observer will be told about every query this interface runs
+
+        :param observer: instrument.Observer
+        """
+        self.observers = self.observers + [observer]
+
+    def remove_observer(self, observer):
+        self.observers = [o for o in self.observers if o is not observer]
+
     @contextmanager
     def connection(self, connection=None, **kwargs):
         try:
@@ -193,7 +545,17 @@ class Interface(object):
                 # connection fails to be created then free_connection() will fail
                 # which would then cover up the real error, so don't think to 
                 # yourself you can move it back into try/finally
-                connection = self.get_connection()
+                observers = self.observers
+                if observers:
+                    start = time.perf_counter()
+                    connection = self.get_connection()
+                    wait_time = time.perf_counter() - start
+                    for observer in observers:
+                        observer.checkout(self, wait_time)
+
+                else:
+                    connection = self.get_connection()
+
                 try:
                     yield connection
 
@@ -209,6 +571,7 @@ class Interface(object):
 
         self._close()
         self.connected = False
+        self.schema_cache.clear()
         self.log("Closed Connection {}", self.connection_config.interface_name)
         return True
 
@@ -257,6 +620,7 @@ class Interface(object):
         with self.connection(connection) as connection:
             name = connection.transaction_name()
             connection.transaction_start(name)
+            self.local.transactions = getattr(self.local, "transactions", 0) + 1
             try:
                 yield connection
                 connection.transaction_stop(name)
@@ -265,6 +629,148 @@ class Interface(object):
                 connection.transaction_fail(name)
                 self.raise_error(e)
 
+            finally:
+                self.local.transactions -= 1
+
+    def in_transaction(self):
+        """return True if the current thread has a transaction() open on this
+        interface"""
+        return getattr(self.local, "transactions", 0) > 0
+
+    @contextmanager
+    def statement_transaction(self, connection=None, **kwargs):
+        """wraps a write that is only one statement
+
+        this is a normal transaction unless the elide_transactions option is on and
+        there isn't already a transaction, then the statement just runs on its own
+        since a single statement is already atomic, this saves the BEGIN and COMMIT
+        round trips
+        """
+        with self.connection(connection) as connection:
+            if not connection.in_transaction() and int(self.connection_config.options.get("elide_transactions", 0)):
+                yield connection
+
+            else:
+                with self.transaction(connection, **kwargs) as connection:
+                    yield connection
+
+    @contextmanager
+    def pipeline(self, **kwargs):
+        """
+        queue all the Query.insert(), Query.update(), and Query.delete() calls
+        made in the with block and send them to the db in one transaction when
+        the block exits
+
+        while the pipeline is open those Query methods will return a
+        concurrent.futures.Future instance that will contain the result of the
+        call after the pipeline has been flushed
+
+        example --
+            with interface.pipeline():
+                pk = Foo.query.set_bar(1).insert()
+                count = Foo.query.set_bar(2).is_pk(1).update()
+            print(pk.result(), count.result())
+
+        **kwargs -- passed through to execute_operations()
+        """
+        pipeline = self.get_pipeline()
+        if pipeline is not None:
+            # nested pipelines just become part of the outer pipeline
+            yield pipeline
+
+        else:
+            pipeline = Pipeline(self)
+            self.local.pipeline = pipeline
+            try:
+                yield pipeline
+
+            except Exception:
+                self.local.pipeline = None
+                pipeline.cancel()
+                raise
+
+            else:
+                self.local.pipeline = None
+                pipeline.flush(**kwargs)
+
+    def get_pipeline(self):
+        """return the currently open Pipeline for this thread, or None"""
+        return getattr(self.local, "pipeline", None)
+
+    @reconnecting()
+    def execute_operations(self, operations, **kwargs):
+        """
+        run all the PipelineOperation instances on one connection in one transaction
+
+        operations -- list -- PipelineOperation instances
+        return -- list -- the result of each operation in the same order as operations
+        """
+        ret = []
+        with self.connection(**kwargs) as connection:
+            kwargs['connection'] = connection
+            try:
+                with self.transaction(**kwargs):
+                    ret = self._execute_operations(operations, **kwargs)
+
+            except Exception as e:
+                exc_info = sys.exc_info()
+                handled = False
+                seen = set()
+                for operation in operations:
+                    if operation.schema and str(operation.schema) not in seen:
+                        seen.add(str(operation.schema))
+                        if self.handle_error(operation.schema, e, **kwargs):
+                            handled = True
+
+                if handled:
+                    with self.transaction(**kwargs):
+                        ret = self._execute_operations(operations, **kwargs)
+                else:
+                    self.raise_error(e, exc_info)
+
+        return ret
+
+    def _execute_operations(self, operations, **kwargs):
+        ret = []
+        for operation in operations:
+            method = getattr(self, "_{}".format(operation.method_name))
+            ret.append(method(operation.schema, *operation.args, **kwargs))
+        return ret
+
+    def execute_batch(self, queries, **kwargs):
+        """
+        run all the raw queries on one connection in one transaction
+
+        example --
+            interface.execute_batch([
+                ("INSERT INTO foo (bar) VALUES (%s)", [1]),
+                ("UPDATE foo SET bar = %s WHERE bar = %s", [2, 1], {"count_result": True}),
+            ])
+
+        queries -- list -- each item is a (query_str, query_args) or a
+            (query_str, query_args, query_options) tuple
+        return -- list -- the result of each query in the same order as queries
+        """
+        batch = []
+        for q in queries:
+            if len(q) == 2:
+                query_str, query_args = q
+                query_options = {}
+            else:
+                query_str, query_args, query_options = q
+            batch.append((query_str, list(query_args or []), dict(query_options)))
+
+        with self.transaction(**kwargs) as connection:
+            kwargs['connection'] = connection
+            return self._execute_batch(batch, **kwargs)
+
+    def _execute_batch(self, queries, **kwargs):
+        ret = []
+        for query_str, query_args, query_options in queries:
+            query_options.update(kwargs)
+            ret.append(self._query(query_str, query_args, **query_options))
+        return ret
+
     def set_table(self, schema, **kwargs):
         """
         add the table to the db
@@ -273,6 +779,7 @@ class Interface(object):
         """
         with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
+            if schema in self.get_schema_cache(**kwargs): return True
             if self.has_table(str(schema), **kwargs): return True
 
             try:
@@ -288,6 +795,8 @@ class Interface(object):
                             **index.options
                         )
 
+                self.schema_cache.add_schema(schema)
+
             except InterfaceError:
                 # check to see if this table now exists, it might have been created
                 # in another thread
@@ -296,16 +805,94 @@ class Interface(object):
 
     def _set_table(self, schema, **kwargs): raise NotImplementedError()
 
+    def set_tables(self, schemas, **kwargs):
+        """
+        add all the tables (and their indexes) that don't already exist in the db
+        in one transaction
+
+        schemas -- list -- Schema() instances, any schema that is referenced by
+            another schema needs to come before it in the list
+        return -- list -- the schemas whose tables were created
+        """
+        ret = []
+        with self.connection(**kwargs) as connection:
+            kwargs['connection'] = connection
+            with self.transaction(**kwargs):
+                # this is usually called on startup so get a fresh view of the db
+                self.schema_cache.clear()
+                cache = self.get_schema_cache(**kwargs)
+
+                queries = []
+                for schema in schemas:
+                    if schema in cache or schema in ret: continue
+                    queries.append(self._set_table_SQL(schema))
+                    for index_name, index in schema.indexes.items():
+                        queries.append(self._set_index_SQL(
+                            schema,
+                            index.name,
+                            index.fields,
+                            **index.options
+                        ))
+                    ret.append(schema)
+
+                if queries:
+                    try:
+                        self._execute_batch(
+                            [(query_str, [], {"ignore_result": True}) for query_str in queries],
+                            **kwargs
+                        )
+
+                    except Exception as e:
+                        self.schema_cache.clear()
+                        self.raise_error(e)
+
+            for schema in ret:
+                self.schema_cache.add_schema(schema)
+
+        return ret
+
+    def _set_table_SQL(self, schema): raise NotImplementedError()
+
+    def _set_index_SQL(self, schema, name, fields, **index_options):
+        raise NotImplementedError()
+
+    def get_schema_cache(self, **kwargs):
+        """return the SchemaCache, loading it from the db if it hasn't been loaded"""
+        cache = self.schema_cache
+        if not cache.loaded:
+            with self.connection(**kwargs) as connection:
+                kwargs['connection'] = connection
+                cache.load(self._get_catalog(**kwargs))
+        return cache
+
+    def _get_catalog(self, **kwargs):
+        """return all the tables in the db with their fields and indexes
+
+        return -- dict -- {table_name: {"fields": [field_name, ...],
+            "indexes": {index_name: [field_name, ...]}}}
+        """
+        raise NotImplementedError()
+
     def has_table(self, table_name, **kwargs):
         """
         check to see if a table is in the db
 
+        this always asks the db since the table could have been dropped since
+        the schema cache was loaded, the cache is updated with the answer
+
         table_name -- string -- the table to check
         return -- boolean -- True if the table exists, false otherwise
         """
         with self.connection(kwargs.get('connection', None)) as connection:
             kwargs['connection'] = connection
             tables = self.get_tables(table_name, **kwargs)
+            if tables:
+                if table_name not in self.schema_cache:
+                    self.schema_cache.add_table(table_name)
+
+            else:
+                self.schema_cache.remove_table(table_name)
+
             return len(tables) > 0
 
     def get_tables(self, table_name="", **kwargs):
@@ -337,6 +924,7 @@ class Interface(object):
             if not self.has_table(str(schema), **kwargs): return True
             with self.transaction(**kwargs):
                 self._delete_table(schema, **kwargs)
+            self.schema_cache.remove_table(schema)
 
         return True
 
@@ -363,6 +951,7 @@ class Interface(object):
         with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
             self._delete_tables(**kwargs)
+            self.schema_cache.clear()
 
     def _delete_tables(self, **kwargs): raise NotImplementedError()
 
@@ -403,7 +992,8 @@ class Interface(object):
         return True
 
     def _set_index(self, schema, name, fields, **index_options):
-        raise NotImplementedError()
+        query_str = self._set_index_SQL(schema, name, fields, **index_options)
+        return self.query(query_str, ignore_result=True, **index_options)
 
     @reconnecting()
     def insert(self, schema, fields, **kwargs):
@@ -420,13 +1010,13 @@ class Interface(object):
         with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
             try:
-                with self.transaction(**kwargs):
+                with self.statement_transaction(**kwargs):
                     r = self._insert(schema, fields, **kwargs)
 
             except Exception as e:
                 exc_info = sys.exc_info()
                 if self.handle_error(schema, e, **kwargs):
-                    with self.transaction(**kwargs):
+                    with self.statement_transaction(**kwargs):
                         r = self._insert(schema, fields, **kwargs)
                 else:
                     self.raise_error(e, exc_info)
@@ -449,7 +1039,7 @@ class Interface(object):
         with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
             try:
-                with self.transaction(**kwargs):
+                with self.statement_transaction(**kwargs):
                     r = self._update(schema, fields, query, **kwargs)
 
             except Exception as e:
@@ -468,16 +1058,24 @@ class Interface(object):
         """this is just a common wrapper around all the get queries since they are
         all really similar in how they execute"""
         if not query: query = Query()
+        if query.joins or query.tree:
+            # the joined and computed fields have to be decoded along with the
+            # query's fields
+            schema = query.join_schema
 
         ret = None
         with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
+
+            # we wrap SELECT queries in a transaction if we are in a transaction because
+            # it could cause data loss if it failed by causing the db to discard
+            # anything in the current transaction if the query isn't wrapped,
+            # go ahead, ask me how I know this. This can be turned off with the
+            # savepoint_reads option to save the SAVEPOINT round trip on every read
+            in_transaction = connection.in_transaction()
+            savepoint = in_transaction and int(self.connection_config.options.get("savepoint_reads", 1))
             try:
-                if connection.in_transaction():
-                    # we wrap SELECT queries in a transaction if we are in a transaction because
-                    # it could cause data loss if it failed by causing the db to discard
-                    # anything in the current transaction if the query isn't wrapped,
-                    # go ahead, ask me how I know this
+                if savepoint:
                     with self.transaction(**kwargs):
                         ret = callback(schema, query, *args, **kwargs)
 
@@ -486,8 +1084,22 @@ class Interface(object):
 
             except Exception as e:
                 exc_info = sys.exc_info()
-                if self.handle_error(schema, e, query=query, **kwargs):
+                if in_transaction and not savepoint:
+                    # the query ran without a savepoint, if the transaction survived
+                    # the error then the fix and retry get a savepoint of their own,
+                    # otherwise (eg, Postgres) there is nothing we can do
+                    if connection.in_failed_transaction():
+                        self.raise_error(e, exc_info)
+
+                    with self.transaction(**kwargs):
+                        if self.handle_error(schema, e, query=query, **kwargs):
+                            ret = callback(schema, query, *args, **kwargs)
+                        else:
+                            self.raise_error(e, exc_info)
+
+                elif self.handle_error(schema, e, query=query, **kwargs):
                     ret = callback(schema, query, *args, **kwargs)
+
                 else:
                     self.raise_error(e, exc_info)
 
@@ -502,6 +1114,9 @@ class Interface(object):
 
         return -- dict -- the matching row
         """
+        if query and query.is_empty():
+            return {}
+
         ret = self._get_query(self._get_one, schema, query, **kwargs)
         if not ret: ret = {}
         return ret
@@ -517,6 +1132,10 @@ class Interface(object):
 
         return -- list -- a list of matching dicts
         """
+        if query and query.is_empty():
+            # no need to bother the db with a query that can't match anything
+            return ListCursor([]) if kwargs.get("cursor_result", False) else []
+
         ret = self._get_query(self._get, schema, query, **kwargs)
         if not ret: ret = []
         return ret
@@ -524,6 +1143,9 @@ class Interface(object):
     def _get(self, schema, query, **kwargs): raise NotImplementedError()
 
     def count(self, schema, query=None, **kwargs):
+        if query and query.is_empty():
+            return 0
+
         ret = self._get_query(self._count, schema, query, **kwargs)
         return int(ret)
 
@@ -533,14 +1155,32 @@ class Interface(object):
         if not query or not query.fields_where:
             raise ValueError('aborting delete because there is no where clause')
 
-        with self.transaction(**kwargs) as connection:
+        with self.connection(**kwargs) as connection:
             kwargs['connection'] = connection
-            ret = self._get_query(self._delete, schema, query, **kwargs)
+            with self.statement_transaction(**kwargs):
+                ret = self._get_query(self._delete, schema, query, **kwargs)
 
         return ret
 
     def _delete(self, schema, query, **kwargs): raise NotImplementedError()
 
+    def explain(self, schema, query=None, **kwargs):
+        """
+        get the db's plan for the select query
+
+        schema -- Schema()
+        query -- Query()
+        **kwargs --
+            analyze -- boolean -- actually run the query to get real row counts
+                and times, if the interface supports it
+            buffers -- boolean -- include buffer usage, if the interface supports it
+
+        return -- Plan
+        """
+        return self._get_query(self._explain, schema, query, **kwargs)
+
+    def _explain(self, schema, query, **kwargs): raise NotImplementedError()
+
     def render(self, schema, query, **kwargs):
         """Render the query in a way that the interface can interpret it
 
@@ -595,7 +1235,7 @@ class Interface(object):
         if not exc_info:
             exc_info = sys.exc_info()
 
-        if not isinstance(e, InterfaceError):
+        if not isinstance(e, Error):
             # allow python's built in errors to filter up through
             # https://docs.python.org/2/library/exceptions.html
             #if not hasattr(exceptions, e.__class__.__name__):
@@ -625,12 +1265,16 @@ class SQLInterface(Interface):
         return True
 
     def _delete(self, schema, query, **kwargs):
+        start = time.perf_counter()
         where_query_str, query_args = self.get_SQL(schema, query, only_where_clause=True)
         query_str = []
         query_str.append('DELETE FROM')
         query_str.append('  {}'.format(schema))
         query_str.append(where_query_str)
         query_str = os.linesep.join(query_str)
+        kwargs["build_time"] = time.perf_counter() - start
+        kwargs["query"] = query
+        kwargs["op"] = "delete"
         ret = self.query(query_str, *query_args, count_result=True, **kwargs)
         return ret
 
@@ -641,8 +1285,19 @@ class SQLInterface(Interface):
             ignore_result -- boolean -- true to not attempt to fetch results
             fetchone -- boolean -- true to only fetch one result
             count_result -- boolean -- true to return the int count of rows affected
+            schema -- Schema -- the schema of the rows being selected, interfaces
+                can use this to decode the returned values
+            build_time -- float -- how many seconds it took to generate query_str,
+                this is passed along to any observers
+            query -- Query -- the query that query_str was generated from, this
+                is passed along to any observers
+            op -- string -- the interface method running the query (eg, get),
+                this is used to tag the query
         """
         ret = True
+        if self.connection_config.options.get("tag_queries", 0):
+            query_str = self._tag_query(query_str, query_options)
+
         # http://stackoverflow.com/questions/6739355/dictcursor-doesnt-seem-to-work-under-psycopg2
         connection = query_options.get('connection', None)
         with self.connection(connection) as connection:
@@ -652,6 +1307,10 @@ class SQLInterface(Interface):
             one_result = query_options.get('fetchone', query_options.get('one_result', False))
             cursor_result = query_options.get('cursor_result', False)
 
+            event = self._query_event(query_str, query_args, query_options)
+            if event:
+                start = time.perf_counter()
+
             try:
                 if query_args:
                     self.log("{}{}{}", query_str, os.linesep, query_args)
@@ -660,26 +1319,105 @@ class SQLInterface(Interface):
                     self.log(query_str)
                     cur.execute(query_str)
 
+                if event:
+                    stop = time.perf_counter()
+                    event.execute_time = stop - start
+                    start = stop
+
                 if cursor_result:
-                    ret = cur
+                    ret = InstrumentCursor(cur, event) if event else cur
 
                 elif not ignore_result:
                     if one_result:
                         # https://www.psycopg.org/docs/cursor.html#cursor.fetchone
                         ret = cur.fetchone()
+                        if event and ret is not None: event.rowcount = 1
                     elif count_result:
                         # https://www.psycopg.org/docs/cursor.html#cursor.rowcount
                         ret = cur.rowcount
+                        if event: event.rowcount = ret
                     else:
                         # https://www.psycopg.org/docs/cursor.html#cursor.fetchall
                         ret = cur.fetchall()
+                        if event: event.rowcount = len(ret)
+
+                if event and not cursor_result:
+                    event.fetch_time = time.perf_counter() - start
+                    event.finish()
 
             except Exception as e:
+                if event: event.finish(e)
                 self.log(e)
                 raise
 
             return ret
 
+    def _query_event(self, query_str, query_args, query_options):
+        """create the event the observers are told about when query_str runs
+
+        :param query_str: string, the SQL statement, with any tag comment
+        :param query_args: list, the values bound to the statement
+        :param query_options: dict, the options passed to _query()
+        :returns: QueryEvent, or None if the interface doesn't have observers
+        """
+        event = None
+        if self.observers:
+            event = QueryEvent(
+                self,
+                self.observers,
+                query_str,
+                query_args,
+                schema=query_options.get('schema', None),
+                build_time=query_options.get('build_time', 0.0),
+                query=query_options.get('query', None),
+            )
+        return event
+
+    def _tag_query(self, query_str, query_options):
+        """append a comment to query_str that says where the query came from so
+        it can be attributed in the db's logs and stats (eg, pg_stat_statements)
+
+        the tag_queries dsn option controls the tags, 1 adds the orm, op, site and
+        any tags set with instrument.tag_queries(). static only adds the orm, op,
+        and site, which are the same every time the same line of code runs the
+        same query, so statements stay the same for statement caches like
+        SQLite's cached_statements
+
+        :param query_str: string, the SQL statement
+        :param query_options: dict, the options passed to _query()
+        :returns: string, query_str with the tag comment appended
+        """
+        mode = String(self.connection_config.options.get("tag_queries", 0)).lower()
+        if mode in ("0", "false"):
+            return query_str
+
+        orm_name = ""
+        query = query_options.get("query", None)
+        orm_class = getattr(query, "orm_class", None)
+        if orm_class:
+            orm_name = orm_class.__name__
+        else:
+            schema = query_options.get("schema", None)
+            if schema is not None:
+                orm_name = schema.table_name
+
+        op = query_options.get("op", "")
+        if not op:
+            parts = query_str.lstrip().split(None, 1)
+            op = parts[0].lower() if parts else ""
+
+        site = call_site()
+        tags = [
+            ("orm", orm_name),
+            ("op", op),
+            ("site", "{}:{}".format(site[0], site[1]) if site[0] else ""),
+        ]
+        if mode != "static":
+            tags.extend(query_tags().items())
+
+        comment = format_tags(tags)
+        return "{} {}".format(query_str, comment) if comment else query_str
+
     def _normalize_date_SQL(self, field_name, field_kwargs, symbol):
         raise NotImplemented()
 
@@ -730,12 +1468,13 @@ class SQLInterface(Interface):
                 field_val = make_list(field_val) if field_val else []
                 field_name, format_val_str = self._normalize_field_SQL(schema, field_name, symbol)
                 if field_val:
-                    format_str = '{} {} ({})'.format(
+                    format_str, format_args = self._normalize_list_SQL(
                         field_name,
                         symbol,
-                        ', '.join([format_val_str] * len(field_val))
+                        format_val_str,
+                        field_val,
+                        schema.fields.get(field.name, None)
                     )
-                    format_args.extend(field_val)
 
                 else:
                     # field value is empty, so we need to customize the SQL to
@@ -797,6 +1536,282 @@ class SQLInterface(Interface):
 
         return format_str, format_args
 
+    def _normalize_list_SQL(self, field_name, symbol, format_val_str, field_vals, field=None):
+        """normalize a list membership where clause (eg, foo IN (...))
+
+        :param field_name: string, the normalized field name
+        :param symbol: string, IN or NOT IN
+        :param format_val_str: string, the normalized value placeholder
+        :param field_vals: list, the values, this is never empty
+        :param field: Field, the schema field the values are compared to, None
+            if the values are compared to an aggregate
+        :returns: tuple, (format_str, format_args)
+        """
+        format_str = '{} {} ({})'.format(
+            field_name,
+            symbol,
+            ', '.join([format_val_str] * len(field_vals))
+        )
+        return format_str, list(field_vals)
+
+    def _normalize_aggregate_SQL(self, schema, aggregate):
+        """normalize an Aggregate into its SQL function call (eg, SUM("foo"))"""
+        field_name = aggregate.field_name
+        if field_name != "*":
+            field_name = self._normalize_name(schema.field_name(field_name))
+
+        return '{}({}{})'.format(
+            aggregate.function_name,
+            "DISTINCT " if aggregate.distinct else "",
+            field_name
+        )
+
+    def _normalize_trunc_SQL(self, schema, trunc):
+        """normalize a Trunc into the SQL that truncates its field to its unit"""
+        raise NotImplementedError()
+
+    def _normalize_group_SQL(self, schema, field):
+        """normalize a group by field
+
+        :returns: tuple, (select_str, group_str), the SQL for the field in the
+            SELECT and in the GROUP BY
+        """
+        if field.is_alias:
+            group_str = self._normalize_trunc_SQL(schema, field.value)
+            return '{} AS {}'.format(group_str, self._normalize_name(field.name)), group_str
+
+        name = self._normalize_name(field.name)
+        return name, name
+
+    def _normalize_alias_SQL(self, schema, field):
+        """normalize a reference to an aggregate or time bucket name, this is the
+        whole expression since Postgres doesn't allow the name in HAVING"""
+        alias = field.query.get_alias(field.name)
+        if isinstance(alias, Aggregate):
+            return self._normalize_aggregate_SQL(schema, alias)
+
+        elif isinstance(alias, Trunc):
+            return self._normalize_trunc_SQL(schema, alias)
+
+        return self._normalize_name(field.name)
+
+    def _normalize_having_SQL(self, schema, symbol_map, field):
+        """normalize a having condition, these support the same operators as the
+        where conditions but not the extended kwarg values (eg, day=...)"""
+        if field.kwargs:
+            raise ValueError('Having condition {} does not support extended kwarg values'.format(
+                field.name
+            ))
+
+        if field.is_alias:
+            field_name = self._normalize_alias_SQL(schema, field)
+        else:
+            field_name = self._normalize_name(field.name)
+
+        symbol = symbol_map['symbol']
+        field_val = field.value
+        if field.is_list:
+            field_val = make_list(field_val) if field_val else []
+            if field_val:
+                return self._normalize_list_SQL(
+                    field_name,
+                    symbol,
+                    self.val_placeholder,
+                    field_val,
+                    None if field.is_alias else schema.fields.get(field.name, None)
+                )
+
+            # see _normalize_val_SQL() for why an empty list isn't an error
+            if symbol == "IN":
+                return '{} <> {}'.format(field_name, field_name), []
+            return '{} = {}'.format(field_name, field_name), []
+
+        if field_val is None:
+            symbol = symbol_map['none_symbol']
+
+        return '{} {} {}'.format(field_name, symbol, self.val_placeholder), [field_val]
+
+    def _normalize_join_SQL(self, schema, joins, table_str):
+        """normalize the joined tables into a subquery that has all the fields of
+        the query's table and the joined fields named <JOIN NAME>.<FIELD NAME>,
+        the rest of the query can then use the joined fields like any other
+        field, Postgres and SQLite both flatten the subquery into the outer query
+
+        :param schema: Schema, the query's schema
+        :param joins: list, the query's Join instances
+        :param table_str: string, what the query's rows are selected from, this
+            is the query's table unless it is a tree query
+        :returns: string
+        """
+        table_name = self._normalize_table_name(schema)
+        select_strs = ["{}.*".format(table_name)]
+        join_strs = []
+        for join in joins:
+            join_name = self._normalize_name(join.name)
+            for field_name in join.schema.fields.keys():
+                select_strs.append("{}.{} AS {}".format(
+                    join_name,
+                    self._normalize_name(field_name),
+                    self._normalize_name("{}.{}".format(join.name, field_name))
+                ))
+
+            join_strs.append("{} {} AS {} ON {}.{} = {}.{}".format(
+                "LEFT JOIN" if join.left else "INNER JOIN",
+                self._normalize_table_name(join.schema),
+                join_name,
+                join_name,
+                self._normalize_name(join.schema.pk_name),
+                table_name,
+                self._normalize_name(join.on)
+            ))
+
+        return "(SELECT {} FROM {} {}) AS {}".format(
+            ", ".join(select_strs),
+            table_str,
+            " ".join(join_strs),
+            table_name
+        )
+
+    def _normalize_tree_SQL(self, schema, tree):
+        """normalize a tree query (see Query.descendants() and Query.ancestors())
+        into a recursive common table expression named _tree that has the rows
+        of the tree and the _depth each one was found at
+
+        each row also carries the _path of primary keys it was reached through
+        (eg, ,1,2,4,) and a row already on the path isn't walked again, so rows
+        that have a cycle don't recurse forever
+
+        https://www.postgresql.org/docs/current/queries-with.html#QUERIES-WITH-RECURSIVE
+        https://www.sqlite.org/lang_with.html#recursive_common_table_expressions
+
+        :param schema: Schema, the query's schema
+        :param tree: Tree
+        :returns: tuple, (format_str, format_args)
+        """
+        table_name = self._normalize_table_name(schema)
+        tree_name = self._normalize_name("_tree")
+        pk_name = self._normalize_name(schema.pk_name)
+        via_name = self._normalize_name(tree.via)
+        depth_name = self._normalize_name("_depth")
+        path_name = self._normalize_name("_path")
+        pk_str = "CAST({}.{} AS TEXT)".format(table_name, pk_name)
+        # the pk row starts the path so it is never found again
+        format_args = [",{},".format(String(tree.pk)), tree.pk]
+
+        if tree.ancestors:
+            start_str = '{}.{} IN (SELECT {} FROM {} WHERE {} = {})'.format(
+                table_name,
+                pk_name,
+                via_name,
+                table_name,
+                pk_name,
+                self.val_placeholder
+            )
+            on_str = '{}.{} = {}.{}'.format(table_name, pk_name, tree_name, via_name)
+
+        else:
+            start_str = '{}.{} = {}'.format(table_name, via_name, self.val_placeholder)
+            on_str = '{}.{} = {}.{}'.format(table_name, via_name, tree_name, pk_name)
+
+        format_str = [
+            'WITH RECURSIVE {} AS ('.format(tree_name),
+            "  SELECT {}.*, 1 AS {}, {} || {} || ',' AS {}".format(
+                table_name,
+                depth_name,
+                self.val_placeholder,
+                pk_str,
+                path_name,
+            ),
+            '  FROM {}'.format(table_name),
+            '  WHERE {}'.format(start_str),
+            '  UNION ALL',
+            "  SELECT {}.*, {}.{} + 1, {}.{} || {} || ','".format(
+                table_name,
+                tree_name,
+                depth_name,
+                tree_name,
+                path_name,
+                pk_str,
+            ),
+            '  FROM {}'.format(table_name),
+            '  INNER JOIN {} ON {}'.format(tree_name, on_str),
+            # replace() instead of LIKE so the pks can't be taken as wildcards
+            "  WHERE REPLACE({}.{}, ',' || {} || ',', '') = {}.{}".format(
+                tree_name,
+                path_name,
+                pk_str,
+                tree_name,
+                path_name,
+            ),
+        ]
+
+        if tree.max_depth:
+            format_str.append('  AND {}.{} < {}'.format(tree_name, depth_name, self.val_placeholder))
+            format_args.append(tree.max_depth)
+
+        format_str.append(')')
+        return "\n".join(format_str), format_args
+
+    def _normalize_order_SQL(self, schema, fields_sort):
+        """normalize the sort fields
+
+        :param schema: Schema
+        :param fields_sort: Fields, the query's sort fields
+        :returns: tuple, (list, list), the SQL of each sort field and the args
+        """
+        query_sort_str = []
+        query_args = []
+        for field in fields_sort:
+            sort_dir_str = 'ASC' if field.direction > 0 else 'DESC'
+            if field.value:
+                field_sort_str, field_sort_args = self._normalize_sort_SQL(field.name, field.value, sort_dir_str)
+                query_sort_str.append(field_sort_str)
+                query_args.extend(field_sort_args)
+
+            elif field.is_alias:
+                query_sort_str.append('  {} {}'.format(
+                    self._normalize_alias_SQL(schema, field),
+                    sort_dir_str
+                ))
+
+            else:
+                query_sort_str.append('  {} {}'.format(
+                    self._normalize_name(field.name),
+                    sort_dir_str
+                ))
+
+        return query_sort_str, query_args
+
+    def _normalize_partition_SQL(self, schema, query, from_str, where_str, where_args):
+        """normalize the subquery of a partitioned query (see Query.partition_by()),
+        it numbers the rows of each partition in the query's sort order so the
+        outer query can keep the first limit_per_group() rows of each one
+
+        :param schema: Schema
+        :param query: Query
+        :param from_str: string, the table (or join subquery) being selected from
+        :param where_str: string, the query's WHERE clause
+        :param where_args: list, the WHERE clause args
+        :returns: tuple, (format_str, format_args)
+        """
+        window_str = 'PARTITION BY {}'.format(", ".join(
+            self._normalize_name(f.name) for f in query.fields_partition
+        ))
+
+        query_sort_str, format_args = self._normalize_order_SQL(schema, query.fields_sort)
+        if query_sort_str:
+            window_str += ' ORDER BY {}'.format(", ".join(s.strip() for s in query_sort_str))
+
+        format_str = "(\n  SELECT *, ROW_NUMBER() OVER ({}) AS {}\n  FROM {}\n{}\n) AS {}".format(
+            window_str,
+            self._normalize_name("_row_number"),
+            from_str,
+            where_str,
+            self._normalize_table_name(schema)
+        )
+        format_args.extend(where_args)
+        return format_str, format_args
+
     def _normalize_sort_SQL(self, field_name, field_vals, sort_dir_str):
         """normalize the sort string
 
@@ -831,6 +1846,18 @@ class SQLInterface(Interface):
             only_where_clause -- boolean -- true to only return after WHERE ...
         """
         only_where_clause = sql_options.get('only_where_clause', False)
+        if query.joins or query.tree:
+            if only_where_clause:
+                raise ValueError("Queries with joins or trees can only be used to select rows")
+            schema = query.join_schema
+
+        is_aggregate = query.is_aggregate()
+        if is_aggregate and sql_options.get('count_query', False) and not only_where_clause:
+            # count the groups instead of the rows
+            query_str, query_args = self.get_SQL(schema, query)
+            query_str = 'SELECT count(*) as ct FROM (\n{}\n) AS grouped_rows'.format(query_str)
+            return query_str, query_args
+
         symbol_map = {
             'in': {'symbol': 'IN', 'list': True},
             'nin': {'symbol': 'NOT IN', 'list': True},
@@ -849,11 +1876,58 @@ class SQLInterface(Interface):
         query_args = []
         query_str = []
 
+        # the where clause is built first because a partitioned query moves it
+        # into the window subquery
+        where_str = []
+        where_args = []
+        for field in query.fields_where:
+            if field.operator == "nin" and field.is_empty_list() and not only_where_clause:
+                # not in nothing matches every row, updates and deletes keep
+                # it so they can never lose their where clause
+                continue
+
+            if where_str: where_str.append('AND')
+
+            field_str, field_args = self._normalize_val_SQL(
+                schema,
+                symbol_map[field.operator],
+                field,
+            )
+
+            where_str.append('  {}'.format(field_str))
+            where_args.extend(field_args)
+
+        if where_str:
+            where_str.insert(0, 'WHERE')
+
+        if query.fields_partition or query.fields_partition.options.get("limit", 0):
+            if not query.fields_partition or not query.fields_partition.options.get("limit", 0):
+                raise ValueError("partition_by() and limit_per_group() have to be used together")
+
+            if only_where_clause:
+                raise ValueError("Partitioned queries can only be used to select rows")
+
         if not only_where_clause:
+            table_str = self._normalize_table_name(schema)
+            if query.tree:
+                with_str, with_args = self._normalize_tree_SQL(schema, query.tree)
+                query_str.append(with_str)
+                query_args.extend(with_args)
+                table_str = '{} AS {}'.format(self._normalize_name("_tree"), table_str)
+
             query_str.append('SELECT')
             is_count_query = sql_options.get('count_query', False)
             select_fields = query.fields_select
-            if select_fields:
+            if is_aggregate:
+                select_fields_str = ", ".join(itertools.chain(
+                    (self._normalize_group_SQL(schema, f)[0] for f in query.fields_group),
+                    ("{} AS {}".format(
+                        self._normalize_aggregate_SQL(schema, f.value),
+                        self._normalize_name(f.name)
+                    ) for f in query.fields_aggregate),
+                ))
+
+            elif select_fields:
                 distinct_fields = select_fields.options.get(
                     "distinct",
                     select_fields.options.get("unique", False)
@@ -863,7 +1937,8 @@ class SQLInterface(Interface):
                     (self._normalize_name(f.name) for f in select_fields)
                 )
             else:
-                if is_count_query or select_fields.options.get("all", False):
+                # a partitioned query's * would include the row number
+                if is_count_query or (select_fields.options.get("all", False) and not query.fields_partition):
                     select_fields_str = "*"
                 else:
                     select_fields_str = ", ".join(
@@ -877,41 +1952,56 @@ class SQLInterface(Interface):
                 query_str.append('  {}'.format(select_fields_str))
 
             query_str.append('FROM')
-            query_str.append("  {}".format(self._normalize_table_name(schema)))
+            if query.joins:
+                from_str = self._normalize_join_SQL(schema, query.joins, table_str)
 
-        if query.fields_where:
-            query_str.append('WHERE')
+            else:
+                from_str = table_str
 
-            for i, field in enumerate(query.fields_where):
+            if query.fields_partition:
+                from_str, from_args = self._normalize_partition_SQL(
+                    schema,
+                    query,
+                    from_str,
+                    "\n".join(where_str),
+                    where_args
+                )
+                query_args.extend(from_args)
+                where_str = ['WHERE', '  {} <= {}'.format(
+                    self._normalize_name("_row_number"),
+                    self.val_placeholder
+                )]
+                where_args = [query.fields_partition.options["limit"]]
+
+            query_str.append("  {}".format(from_str))
+
+        query_str.extend(where_str)
+        query_args.extend(where_args)
+
+        if query.fields_group:
+            query_str.append('GROUP BY')
+            query_str.append('  {}'.format(", ".join(
+                self._normalize_group_SQL(schema, f)[1] for f in query.fields_group
+            )))
+
+        if query.fields_having:
+            query_str.append('HAVING')
+            for i, field in enumerate(query.fields_having):
                 if i > 0: query_str.append('AND')
 
-                field_str = ''
-                field_args = []
-                sd = symbol_map[field.operator]
-
-                field_str, field_args = self._normalize_val_SQL(
+                field_str, field_args = self._normalize_having_SQL(
                     schema,
-                    sd,
+                    symbol_map[field.operator],
                     field,
                 )
-
                 query_str.append('  {}'.format(field_str))
                 query_args.extend(field_args)
 
         if query.fields_sort:
-            query_sort_str = []
             query_str.append('ORDER BY')
-            for field in query.fields_sort:
-                sort_dir_str = 'ASC' if field.direction > 0 else 'DESC'
-                if field.value:
-                    field_sort_str, field_sort_args = self._normalize_sort_SQL(field.name, field.value, sort_dir_str)
-                    query_sort_str.append(field_sort_str)
-                    query_args.extend(field_sort_args)
-
-                else:
-                    query_sort_str.append('  {} {}'.format(field.name, sort_dir_str))
-
+            query_sort_str, query_sort_args = self._normalize_order_SQL(schema, query.fields_sort)
             query_str.append(',{}'.format(os.linesep).join(query_sort_str))
+            query_args.extend(query_sort_args)
 
         if query.bounds:
             query_str.append(self._normalize_bounds_SQL(query.bounds, sql_options))
@@ -932,7 +2022,10 @@ class SQLInterface(Interface):
             ret = True
 
         else:
-            # connection is open
+            # connection is open, the error could mean the db changed out from
+            # under us so we can't trust what we think we know about it
+            self.schema_cache.clear()
+
             if isinstance(e, InterfaceError):
                 # unwind to the original error
                 while isinstance(e, InterfaceError):
@@ -973,6 +2066,7 @@ class SQLInterface(Interface):
         return True
 
     def _update(self, schema, fields, query, **kwargs):
+        start = time.perf_counter()
         where_query_str, where_query_args = self.get_SQL(schema, query, only_where_clause=True)
         query_str = 'UPDATE {} SET {} {}'
         query_args = []
@@ -988,19 +2082,34 @@ class SQLInterface(Interface):
             where_query_str
         )
         query_args.extend(where_query_args)
+        kwargs["build_time"] = time.perf_counter() - start
+        kwargs["query"] = query
+        kwargs["op"] = "update"
 
         return self.query(query_str, *query_args, count_result=True, **kwargs)
 
     def _get_one(self, schema, query, **kwargs):
+        start = time.perf_counter()
         query_str, query_args = self.get_SQL(schema, query, one_query=True)
-        return self.query(query_str, *query_args, fetchone=True, **kwargs)
+        kwargs["build_time"] = time.perf_counter() - start
+        kwargs["query"] = query
+        kwargs["op"] = "get_one"
+        return self.query(query_str, *query_args, fetchone=True, schema=schema, **kwargs)
 
     def _get(self, schema, query, **kwargs):
+        start = time.perf_counter()
         query_str, query_args = self.get_SQL(schema, query)
-        return self.query(query_str, *query_args, **kwargs)
+        kwargs["build_time"] = time.perf_counter() - start
+        kwargs["query"] = query
+        kwargs["op"] = "get"
+        return self.query(query_str, *query_args, schema=schema, **kwargs)
 
     def _count(self, schema, query, **kwargs):
+        start = time.perf_counter()
         query_str, query_args = self.get_SQL(schema, query, count_query=True)
+        kwargs["build_time"] = time.perf_counter() - start
+        kwargs["query"] = query
+        kwargs["op"] = "count"
         ret = self.query(query_str, *query_args, **kwargs)
         if ret:
             ret = int(ret[0]['ct'])
@@ -1036,20 +2145,44 @@ class SQLInterface(Interface):
         the reason they have to be NULL is adding fields to Postgres that can be NULL
         is really light, but if they have a default value, then it can be costly
         """
-        current_fields = self.get_fields(schema, **kwargs)
-        for field_name, field in schema.fields.items():
-            if field_name not in current_fields:
-                if field.required:
-                    raise ValueError('Cannot safely add {} on the fly because it is required'.format(field_name))
+        with self.transaction(**kwargs) as connection:
+            kwargs['connection'] = connection
+            current_fields = self.get_schema_cache(**kwargs).get_fields(schema)
+            if current_fields is None:
+                current_fields = self.get_fields(schema, **kwargs)
 
-                else:
-                    query_str = []
-                    query_str.append('ALTER TABLE')
-                    query_str.append('  {}'.format(schema))
-                    query_str.append('ADD COLUMN')
-                    query_str.append('  {}'.format(self.get_field_SQL(field_name, field)))
-                    query_str = os.linesep.join(query_str)
-                    self.query(query_str, ignore_result=True, **kwargs)
+            fields = {}
+            for field_name, field in schema.fields.items():
+                if field_name not in current_fields:
+                    if field.required:
+                        raise ValueError('Cannot safely add {} on the fly because it is required'.format(field_name))
+
+                    else:
+                        fields[field_name] = field
+
+            if fields:
+                queries = self._set_fields_SQL(schema, fields)
+                self._execute_batch(
+                    [(query_str, [], {"ignore_result": True}) for query_str in queries],
+                    **kwargs
+                )
+                self.schema_cache.add_fields(schema, fields.keys())
 
         return True
 
+    def _set_fields_SQL(self, schema, fields):
+        """return the queries that will add fields to the schema's table
+
+        fields -- dict -- {field_name: Field()} the fields to add
+        return -- list -- the query strings
+        """
+        ret = []
+        for field_name, field in fields.items():
+            query_str = []
+            query_str.append('ALTER TABLE')
+            query_str.append('  {}'.format(self._normalize_table_name(schema)))
+            query_str.append('ADD COLUMN')
+            query_str.append('  {}'.format(self.get_field_SQL(field_name, field)))
+            ret.append(os.linesep.join(query_str))
+        return ret
+
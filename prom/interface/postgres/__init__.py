@@ -11,6 +11,8 @@ import os
 import sys
 import decimal
 import datetime
+import json
+import time
 
 # third party
 import psycopg2
@@ -18,7 +20,8 @@ import psycopg2.extras
 import psycopg2.extensions
 
 # first party
-from ..base import SQLInterface, SQLConnection
+from ..base import SQLInterface, SQLConnection, Plan, PlanNode
+from .pool import ConnectionPool
 from ...compat import *
 from ...utils import get_objects
 from ...exception import UniqueError, InterfaceError
@@ -38,6 +41,20 @@ class Connection(SQLConnection, psycopg2.extensions.connection):
     http://initd.org/psycopg/docs/advanced.html
     http://initd.org/psycopg/docs/extensions.html#psycopg2.extensions.connection
     """
+
+    types_registered = False
+    """True once PostgreSQL.register_types() has been called on this connection"""
+
+    def in_failed_transaction(self):
+        """Postgres won't run anything else in a transaction after an error until
+        it is rolled back"""
+        return self.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR
+
+    @property
+    def python_encoding(self):
+        """the python codec name for the connection's client encoding"""
+        return psycopg2.extensions.encodings.get(self.encoding, "utf-8")
+
     def __init__(self, *args, **kwargs):
         super(Connection, self).__init__(*args, **kwargs)
 
@@ -63,22 +80,6 @@ class Connection(SQLConnection, psycopg2.extensions.connection):
                 )
             )
 
-        else:
-            def normalize_str(v, cur):
-                if isinstance(v, str) and v.startswith("\\x"):
-                    buf = psycopg2.BINARY(v, cur)
-                    v = bytes(buf).decode(cur.connection.encoding)
-
-                    #import binascii
-                    #pout.v(binascii.unhexlify(v[2:]))
-                    #v = v.encode(cur.connection.encoding)
-                    #v = bytes(v, encoding=cur.connection.encoding)
-                return v
-            psycopg2.extensions.register_type(
-                psycopg2.extensions.new_type(psycopg2.STRING.values, "STRING", normalize_str)
-            )
-
-
         # http://initd.org/psycopg/docs/connection.html#connection.set_client_encoding
         # https://www.postgresql.org/docs/current/static/multibyte.html
         # > The default is the encoding defined by the database
@@ -117,6 +118,15 @@ class PostgreSQL(SQLInterface):
 
         self.log("connecting using pool class {}".format(pool_class_name))
 
+        pool_kwargs = {}
+        if issubclass(pool_class, ConnectionPool):
+            options = connection_config.options
+            pool_kwargs["timeout"] = float(options.get("pool_timeout", 30.0))
+            pool_kwargs["max_lifetime"] = float(options.get("pool_max_lifetime", 3600.0))
+            pool_kwargs["max_idle"] = float(options.get("pool_max_idle", 600.0))
+            ping_idle = float(options.get("pool_ping_idle", 30.0))
+            pool_kwargs["ping_idle"] = None if ping_idle < 0.0 else ping_idle
+
         # http://initd.org/psycopg/docs/module.html#psycopg2.connect
         self.connection_pool = pool_class(
             minconn,
@@ -129,12 +139,19 @@ class PostgreSQL(SQLInterface):
             cursor_factory=psycopg2.extras.RealDictCursor,
             #cursor_factory=LoggingCursor,
             connection_factory=Connection,
+            **pool_kwargs
         )
 
         # hack for sync backwards compatibility with transactions
         if not async_conn:
             self._connection = self.connection_pool.getconn()
 
+    def max_concurrency(self):
+        if not int(self.connection_config.options.get('async', 1)):
+            # every query shares the one sync connection
+            return 1
+        return super(PostgreSQL, self).max_concurrency()
+
     def free_connection(self, connection):
         if not self.connected: return
         if self._connection:
@@ -155,12 +172,75 @@ class PostgreSQL(SQLInterface):
             connection = self.connection_pool.getconn()
             self.log("getting async connection {}", id(connection))
 
+        if not connection.types_registered:
+            self.register_types(connection)
+
         # change the connection readonly status if they don't match
         if connection.readonly != self.connection_config.readonly:
             # https://www.psycopg.org/docs/connection.html#connection.readonly
             connection.readonly = self.connection_config.readonly
         return connection
 
+    def register_types(self, connection):
+        """register prom's typecasters on connection
+
+        these are only registered for the connection and only for the type oids
+        that need them, so every other column (and any other psycopg2 code in the
+        process) goes through psycopg2's C typecasters untouched
+
+        https://www.psycopg.org/docs/advanced.html#type-casting-of-sql-types-into-python-objects
+        """
+        # bytea comes back as memoryview by default, we want bytes like SQLite
+        def cast_bytea(v, cur):
+            buf = psycopg2.BINARY(v, cur)
+            return buf if buf is None else bytes(buf)
+
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.new_type(psycopg2.BINARY.values, "PROM_BYTEA", cast_bytea),
+            connection
+        )
+
+        # older versions of prom would save bytes into text columns as their
+        # bytea hex representation (eg, \x666f6f), if you have rows like that
+        # you can turn this on to decode them when they are read
+        if int(self.connection_config.options.get("decode_hex_text", 0)):
+            def cast_hex_text(v, cur):
+                if v is not None and v.startswith("\\x"):
+                    try:
+                        v = bytes.fromhex(v[2:]).decode(cur.connection.python_encoding)
+
+                    except ValueError:
+                        pass
+                return v
+
+            psycopg2.extensions.register_type(
+                psycopg2.extensions.new_type(psycopg2.STRING.values, "PROM_HEX_TEXT", cast_hex_text),
+                connection
+            )
+
+        connection.types_registered = True
+
+    def _normalize_fields(self, schema, fields, **kwargs):
+        """bytes going into a text column would be adapted as bytea and saved as
+        the hex representation of the bytes (eg, \\x666f6f), so decode them first
+
+        :returns: dict, fields or a copy of fields with the bytes decoded
+        """
+        ret = fields
+        encoding = None
+        for field_name, field_val in fields.items():
+            if isinstance(field_val, (bytes, bytearray)) and field_name in schema.fields:
+                if issubclass(schema.fields[field_name].interface_type, basestring):
+                    if encoding is None:
+                        connection = kwargs.get("connection", None)
+                        encoding = connection.python_encoding if connection else "utf-8"
+
+                    if ret is fields:
+                        ret = dict(fields)
+                    ret[field_name] = field_val.decode(encoding)
+
+        return ret
+
     def _close(self):
         self.connection_pool.closeall()
         if self._connection:
@@ -186,6 +266,10 @@ class PostgreSQL(SQLInterface):
         return [r['tablename'] for r in ret]
 
     def _set_table(self, schema, **kwargs):
+        query_str = self._set_table_SQL(schema)
+        ret = self.query(query_str, ignore_result=True, **kwargs)
+
+    def _set_table_SQL(self, schema):
         """
         http://www.postgresql.org/docs/9.1/static/sql-createtable.html
         http://www.postgresql.org/docs/8.1/static/datatype.html
@@ -200,8 +284,103 @@ class PostgreSQL(SQLInterface):
 
         query_str.append(",{}".format(os.linesep).join(query_fields))
         query_str.append(')')
-        query_str = os.linesep.join(query_str)
-        ret = self.query(query_str, ignore_result=True, **kwargs)
+        return os.linesep.join(query_str)
+
+    def _set_fields_SQL(self, schema, fields):
+        """Postgres can add all the fields with one ALTER TABLE
+
+        https://www.postgresql.org/docs/current/sql-altertable.html
+        """
+        query_str = []
+        query_str.append('ALTER TABLE')
+        query_str.append('  {}'.format(self._normalize_table_name(schema)))
+        query_str.append(",{}".format(os.linesep).join(
+            'ADD COLUMN {}'.format(self.get_field_SQL(field_name, field))
+            for field_name, field in fields.items()
+        ))
+        return [os.linesep.join(query_str)]
+
+    def _explain(self, schema, query, **kwargs):
+        """
+        https://www.postgresql.org/docs/current/sql-explain.html
+        https://www.postgresql.org/docs/current/using-explain.html
+        """
+        options = ["FORMAT JSON"]
+        if kwargs.get("analyze", False):
+            options.append("ANALYZE")
+        if kwargs.get("buffers", False):
+            options.append("BUFFERS")
+
+        query_str, query_args = self.get_SQL(schema, query)
+        rows = self._query(
+            "EXPLAIN ({}) {}".format(", ".join(options), query_str),
+            query_args,
+            **kwargs
+        )
+
+        raw = rows[0]["QUERY PLAN"]
+        if isinstance(raw, basestring):
+            raw = json.loads(raw)
+
+        def create_node(d):
+            node_type = d["Node Type"]
+            if node_type in set(["Sort", "Incremental Sort"]):
+                node_type = PlanNode.SORT
+
+            elif node_type == "Seq Scan":
+                node_type = PlanNode.SEQ_SCAN
+
+            elif "Index Name" in d:
+                node_type = PlanNode.INDEX_SCAN
+
+            node = PlanNode(
+                node_type,
+                relation=d.get("Relation Name", None),
+                index=d.get("Index Name", None),
+                rows=d.get("Plan Rows", None),
+                cost=d.get("Total Cost", None),
+                actual_rows=d.get("Actual Rows", None),
+                actual_time=d.get("Actual Total Time", None),
+                detail=d,
+            )
+            for child in d.get("Plans", []):
+                node.children.append(create_node(child))
+            return node
+
+        return Plan([create_node(r["Plan"]) for r in raw], query_str, query_args, raw=raw)
+
+    def _get_catalog(self, **kwargs):
+        """get every table with its fields and indexes in one query"""
+        query_str = os.linesep.join([
+            "SELECT c.relname AS table_name, 'field' AS kind, a.attname AS name,",
+            "  NULL AS field_name, a.attnum AS seq",
+            "FROM pg_class c",
+            "LEFT JOIN pg_attribute a ON a.attrelid = c.oid",
+            "  AND a.attnum > 0 AND NOT a.attisdropped",
+            "WHERE c.relkind = 'r' AND pg_get_userbyid(c.relowner) = %s",
+            "  AND pg_table_is_visible(c.oid)",
+            "UNION ALL",
+            "SELECT c.relname AS table_name, 'index' AS kind, i.relname AS name,",
+            "  a.attname AS field_name, array_position(ix.indkey::int2[], a.attnum) AS seq",
+            "FROM pg_class c",
+            "JOIN pg_index ix ON ix.indrelid = c.oid",
+            "JOIN pg_class i ON i.oid = ix.indexrelid",
+            "JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = ANY(ix.indkey)",
+            "WHERE c.relkind = 'r' AND pg_get_userbyid(c.relowner) = %s",
+            "  AND pg_table_is_visible(c.oid)",
+            "ORDER BY table_name, kind, name, seq",
+        ])
+        username = self.connection_config.username
+
+        ret = {}
+        for r in self.query(query_str, username, username, **kwargs):
+            table = ret.setdefault(r['table_name'], {"fields": [], "indexes": {}})
+            if r['kind'] == 'field':
+                if r['name']:
+                    table["fields"].append(r['name'])
+            else:
+                table["indexes"].setdefault(r['name'], []).append(r['field_name'])
+        return ret
 
     def _delete_table(self, schema, **kwargs):
         query_str = 'DROP TABLE IF EXISTS {} CASCADE'.format(self._normalize_table_name(schema))
@@ -318,7 +497,7 @@ class PostgreSQL(SQLInterface):
 
         return ret
 
-    def _set_index(self, schema, name, fields, **index_options):
+    def _set_index_SQL(self, schema, name, fields, **index_options):
         """
         NOTE -- we set the index name using <table_name>_<name> format since indexes have to have
         a globally unique name in postgres
@@ -333,16 +512,15 @@ class PostgreSQL(SQLInterface):
                     field_name = 'UPPER({})'.format(self._normalize_name(field_name))
             index_fields.append(field_name)
 
-        query_str = 'CREATE {}INDEX {} ON {} USING BTREE ({})'.format(
+        return 'CREATE {}INDEX {} ON {} USING BTREE ({})'.format(
             'UNIQUE ' if index_options.get('unique', False) else '',
             self._normalize_name("{}_{}".format(schema, name)),
             self._normalize_table_name(schema),
             ', '.join(index_fields)
         )
 
-        return self.query(query_str, ignore_result=True, **index_options)
-
     def _insert(self, schema, fields, **kwargs):
+        fields = self._normalize_fields(schema, fields, **kwargs)
         field_formats = []
         field_names = []
         query_vals = []
@@ -372,6 +550,169 @@ class PostgreSQL(SQLInterface):
 
         return ret
 
+    def _insert_many(self, schema, fields_list, **kwargs):
+        """insert all the fields in fields_list using one INSERT statement, every
+        fields dict in fields_list needs to have the same keys
+
+        https://www.psycopg.org/docs/extras.html#psycopg2.extras.execute_values
+
+        return -- list -- the primary keys of the inserted rows, in the same order
+            as fields_list
+        """
+        fields_list = [self._normalize_fields(schema, fields, **kwargs) for fields in fields_list]
+        field_names = list(fields_list[0].keys())
+        query_vals = [[fields[field_name] for field_name in field_names] for fields in fields_list]
+
+        pk_name = schema.pk_name
+        query_str = 'INSERT INTO {} ({}) VALUES %s'.format(
+            self._normalize_table_name(schema),
+            ', '.join(map(self._normalize_name, field_names)),
+        )
+        if pk_name:
+            query_str += ' RETURNING {}'.format(self._normalize_name(pk_name))
+
+        rows = self._execute_many(
+            psycopg2.extras.execute_values,
+            query_str,
+            query_vals,
+            dict(kwargs, schema=schema, op="insert"),
+            page_size=len(query_vals),
+            fetch=bool(pk_name),
+        )
+
+        if pk_name:
+            ret = [r[pk_name] for r in rows]
+        else:
+            ret = [True] * len(fields_list)
+        return ret
+
+    def _update(self, schema, fields, query, **kwargs):
+        fields = self._normalize_fields(schema, fields, **kwargs)
+        return super(PostgreSQL, self)._update(schema, fields, query, **kwargs)
+
+    def _execute_operations(self, operations, **kwargs):
+        """consecutive inserts into the same table with the same fields are sent
+        to the db as one multi-row INSERT, everything else runs one statement at
+        a time (but still in the one transaction)"""
+        ret = []
+        i = 0
+        while i < len(operations):
+            operation = operations[i]
+            if operation.method_name == "insert":
+                schema = operation.schema
+                fields = operation.args[0]
+                j = i + 1
+                while j < len(operations):
+                    o = operations[j]
+                    if o.method_name != "insert" or str(o.schema) != str(schema):
+                        break
+                    if list(o.args[0].keys()) != list(fields.keys()):
+                        break
+                    j += 1
+
+                if j - i > 1 and fields:
+                    fields_list = [o.args[0] for o in operations[i:j]]
+                    ret.extend(self._insert_many(schema, fields_list, **kwargs))
+                    i = j
+                    continue
+
+            ret.extend(super(PostgreSQL, self)._execute_operations([operation], **kwargs))
+            i += 1
+
+        return ret
+
+    def _execute_batch(self, queries, **kwargs):
+        """consecutive queries with the same SQL whose results are ignored are
+        sent using psycopg2's execute_batch, which packs many statements into
+        each round trip
+
+        https://www.psycopg.org/docs/extras.html#psycopg2.extras.execute_batch
+        """
+        ret = []
+        i = 0
+        while i < len(queries):
+            query_str, query_args, query_options = queries[i]
+            j = i + 1
+            if query_options.get("ignore_result", False):
+                if not query_args:
+                    # statements without arguments (eg, DDL) can all be sent
+                    # in one round trip as one multi-statement query
+                    while j < len(queries):
+                        _, qa, qo = queries[j]
+                        if qa or not qo.get("ignore_result", False):
+                            break
+                        j += 1
+
+                    if j - i > 1:
+                        query_str = ";{}".format(os.linesep).join(q[0] for q in queries[i:j])
+                        ret.extend(super(PostgreSQL, self)._execute_batch(
+                            [(query_str, [], query_options)],
+                            **kwargs
+                        ) * (j - i))
+                        i = j
+                        continue
+
+                while j < len(queries):
+                    qs, _, qo = queries[j]
+                    if qs != query_str or not qo.get("ignore_result", False):
+                        break
+                    j += 1
+
+            if j - i > 1:
+                args_list = [q[1] for q in queries[i:j]]
+                self._execute_many(
+                    psycopg2.extras.execute_batch,
+                    query_str,
+                    args_list,
+                    dict(query_options, **kwargs),
+                )
+                ret.extend([True] * (j - i))
+
+            else:
+                ret.extend(super(PostgreSQL, self)._execute_batch([queries[i]], **kwargs))
+
+            i = j
+
+        return ret
+
+    def _execute_many(self, execute, query_str, args_list, query_options, **execute_kwargs):
+        """run query_str once for each args in args_list using one of psycopg2's
+        fast execution helpers, the statement is tagged and observed the same
+        way _query() does it so the observers see every statement
+
+        https://www.psycopg.org/docs/extras.html#fast-execution-helpers
+
+        :param execute: callable, execute_values or execute_batch
+        :param query_str: string, the SQL statement
+        :param args_list: list, the arguments for each run of the statement
+        :param query_options: dict, the options _query() would have gotten
+        :param **execute_kwargs: passed through to execute
+        :returns: whatever execute returns
+        """
+        if self.connection_config.options.get("tag_queries", 0):
+            query_str = self._tag_query(query_str, query_options)
+
+        self.log("{}{}{}", query_str, os.linesep, args_list)
+        with self.connection(query_options.get("connection", None)) as connection:
+            cur = connection.cursor()
+            event = self._query_event(query_str, args_list, query_options)
+            if event:
+                start = time.perf_counter()
+
+            try:
+                ret = execute(cur, query_str, args_list, **execute_kwargs)
+                if event:
+                    event.execute_time = time.perf_counter() - start
+                    event.rowcount = len(ret) if ret else len(args_list)
+                    event.finish()
+
+            except Exception as e:
+                if event: event.finish(e)
+                self.log(e)
+                raise
+
+        return ret
+
     def _normalize_field_SQL(self, schema, field_name, symbol):
         format_field_name = self._normalize_name(field_name)
         format_val_str = self.val_placeholder
@@ -386,6 +727,66 @@ class PostgreSQL(SQLInterface):
 
         return format_field_name, format_val_str
 
+    def _normalize_list_SQL(self, field_name, symbol, format_val_str, field_vals, field=None):
+        # the values are passed as one array so the statement is the same no
+        # matter how many values there are, NULL values keep IN (...) since
+        # psycopg can't guess the type of an array that is only NULLs
+        if format_val_str == self.val_placeholder and not any(v is None for v in field_vals):
+            array_type = self._normalize_array_type(field)
+            # a string for a field that isn't a string is cast by the db in an
+            # IN (...), but a text[] can't be compared to the field
+            if array_type is not None or not any(isinstance(v, basestring) for v in field_vals):
+                # https://www.postgresql.org/docs/current/functions-comparisons.html
+                format_str = '{} {}({}{})'.format(
+                    field_name,
+                    "= ANY" if symbol == "IN" else "<> ALL",
+                    format_val_str,
+                    "::{}[]".format(array_type) if array_type else ""
+                )
+                return format_str, [list(field_vals)]
+
+        return super(PostgreSQL, self)._normalize_list_SQL(
+            field_name,
+            symbol,
+            format_val_str,
+            field_vals,
+            field
+        )
+
+    def _normalize_array_type(self, field):
+        """return the type an array of values for field should be cast to
+
+        :param field: Field, the schema field the values are compared to
+        :returns: string, the type, an empty string if the array doesn't need a
+            cast, or None if the type isn't known
+        """
+        if not field:
+            return None
+
+        interface_type = field.interface_type
+        if issubclass(interface_type, basestring):
+            return ""
+
+        elif issubclass(interface_type, bool):
+            return "BOOL"
+
+        elif issubclass(interface_type, (int, long)):
+            return "BIGINT"
+
+        elif issubclass(interface_type, datetime.datetime):
+            return "TIMESTAMP WITHOUT TIME ZONE"
+
+        elif issubclass(interface_type, datetime.date):
+            return "DATE"
+
+        elif issubclass(interface_type, float):
+            return "DOUBLE PRECISION"
+
+        elif issubclass(interface_type, decimal.Decimal):
+            return "NUMERIC"
+
+        return None
+
     def _normalize_sort_SQL(self, field_name, field_vals, sort_dir_str):
         # this solution is based off:
         # http://postgresql.1045698.n5.nabble.com/ORDER-BY-FIELD-feature-td1901324.html
@@ -428,6 +829,16 @@ class PostgreSQL(SQLInterface):
 
         return fstrs
 
+    def _normalize_trunc_SQL(self, schema, trunc):
+        """
+        https://www.postgresql.org/docs/current/functions-datetime.html#FUNCTIONS-DATETIME-TRUNC
+        """
+        # the unit is one of Trunc.units so it is safe to put in the query
+        return "date_trunc('{}', {})".format(
+            trunc.unit,
+            self._normalize_name(schema.field_name(trunc.field_name))
+        )
+
     def _normalize_bounds_SQL(self, bounds, sql_options):
         offset = bounds.offset
         if sql_options.get('one_query', False):
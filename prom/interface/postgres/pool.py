@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import logging
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import AbstractConnectionPool, PoolError
+
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool(AbstractConnectionPool):
+    """A thread safe connection pool that validates and recycles its connections
+
+    This is safe to use with gevent also, since threading is monkey patched by
+    gevent the locks this pool uses will block the greenlet and not the thread
+
+    connections are handed out LIFO so the most recently used connections stay
+    warm and the connections that have been sitting the longest can be reaped
+    once there are more than minconn of them
+
+    https://github.com/psycopg/psycopg2/blob/master/lib/pool.py
+    """
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        """
+        :param minconn: int, how many connections to create on init and to keep
+            around even if they are idle
+        :param maxconn: int, the max connections this pool will ever have open
+        :param *args: passed through to psycopg2.connect()
+        :param **kwargs: passed through to psycopg2.connect() except for:
+            - timeout: float, how many seconds getconn() will wait for a connection
+                before raising a PoolError, 0 or None to wait forever
+            - max_lifetime: float, connections older than this many seconds will
+                be closed and replaced, 0 or None to never recycle
+            - max_idle: float, connections above minconn that have been idle this
+                many seconds will be closed, 0 or None to never close
+            - ping_idle: float, connections that have been idle this many seconds
+                will be checked with a SELECT 1 before being handed out, 0 to
+                check every time, None to never check
+        """
+        self.timeout = kwargs.pop("timeout", 30.0)
+        self.max_lifetime = kwargs.pop("max_lifetime", 3600.0)
+        self.max_idle = kwargs.pop("max_idle", 600.0)
+        self.ping_idle = kwargs.pop("ping_idle", 30.0)
+
+        self.minconn = int(minconn)
+        self.maxconn = int(maxconn)
+        if self.minconn > self.maxconn:
+            raise ValueError("minconn {} is larger than maxconn {}".format(
+                self.minconn,
+                self.maxconn
+            ))
+
+        self.closed = False
+        self.size = 0
+
+        self._args = args
+        self._kwargs = kwargs
+        self._pool = deque() # (connection, idle_start) tuples
+        self._used = {} # id(connection) -> connection
+        self._created = {} # id(connection) -> created timestamp
+        self._cond = threading.Condition()
+
+        for _ in range(self.minconn):
+            self.size += 1
+            conn = self._connect()
+            self._pool.append((conn, time.time()))
+
+    def _connect(self, key=None):
+        """create a new connection, the caller is responsible for having already
+        incremented .size"""
+        try:
+            conn = psycopg2.connect(*self._args, **self._kwargs)
+
+        except:
+            with self._cond:
+                self.size -= 1
+                self._cond.notify()
+            raise
+
+        self._created[id(conn)] = time.time()
+        return conn
+
+    def _close(self, conn):
+        """close conn, this does not touch .size"""
+        self._created.pop(id(conn), None)
+        try:
+            if not conn.closed:
+                conn.close()
+
+        except Exception as e:
+            logger.debug("Closing connection {} failed: {}".format(id(conn), e))
+
+    def _expired(self, conn, now):
+        if self.max_lifetime:
+            created = self._created.get(id(conn), now)
+            return (now - created) >= self.max_lifetime
+        return False
+
+    def _broken(self, conn):
+        """return True if conn should not go back into the pool"""
+        if conn.closed:
+            return True
+
+        if getattr(conn, "transaction_count", 0) > 0:
+            return True
+
+        try:
+            status = conn.get_transaction_status()
+
+        except Exception:
+            return True
+
+        return status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def _ping(self, conn):
+        """return True if conn can still talk to the db"""
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+
+        except Exception as e:
+            logger.warning("Connection {} failed validation: {}".format(id(conn), e))
+            return False
+
+    def _reap(self, now):
+        """remove connections above minconn that have been idle too long, this
+        needs to be called while holding the lock
+
+        :returns: list, the connections that should be closed
+        """
+        reaped = []
+        if self.max_idle:
+            pool = self._pool
+            while len(pool) > self.minconn and (now - pool[0][1]) >= self.max_idle:
+                conn, _ = pool.popleft()
+                reaped.append(conn)
+                self.size -= 1
+        return reaped
+
+    def getconn(self, key=None):
+        """return a connection, waiting up to .timeout seconds for one to become
+        available if the pool is at maxconn"""
+        start = time.time()
+        deadline = (start + self.timeout) if self.timeout else None
+
+        while True:
+            conn = None
+            idle_start = 0.0
+            with self._cond:
+                while True:
+                    if self.closed:
+                        raise PoolError("connection pool is closed")
+
+                    if self._pool:
+                        conn, idle_start = self._pool.pop()
+                        break
+
+                    if self.size < self.maxconn:
+                        self.size += 1
+                        break
+
+                    if deadline is None:
+                        self._cond.wait()
+
+                    else:
+                        remaining = deadline - time.time()
+                        if remaining <= 0.0:
+                            raise PoolError(
+                                "Timed out after {:.2f} seconds waiting for a connection, pool has {} connections".format(
+                                    time.time() - start,
+                                    self.size,
+                                )
+                            )
+                        self._cond.wait(remaining)
+
+            if conn is None:
+                conn = self._connect()
+
+            else:
+                now = time.time()
+                valid = not conn.closed and not self._expired(conn, now)
+                if valid and self.ping_idle is not None:
+                    if (now - idle_start) >= self.ping_idle:
+                        valid = self._ping(conn)
+
+                if not valid:
+                    self._discard(conn)
+                    continue
+
+            with self._cond:
+                self._used[id(conn)] = conn
+            return conn
+
+    def _discard(self, conn):
+        self._close(conn)
+        with self._cond:
+            self.size -= 1
+            self._cond.notify()
+
+    def putconn(self, conn, key=None, close=False):
+        """return conn to the pool, conn will be closed instead if it is broken,
+        too old, or was returned while still in a transaction"""
+        with self._cond:
+            self._used.pop(id(conn), None)
+
+        now = time.time()
+        if close or self.closed:
+            self._discard(conn)
+
+        elif self._broken(conn):
+            logger.warning("Discarding broken connection {} returned to pool".format(id(conn)))
+            self._discard(conn)
+
+        elif self._expired(conn, now):
+            self._discard(conn)
+
+        else:
+            with self._cond:
+                self._pool.append((conn, now))
+                reaped = self._reap(now)
+                self._cond.notify()
+
+            for conn in reaped:
+                self._close(conn)
+
+    def closeall(self):
+        """close all the idle connections, connections that are checked out will
+        be closed when they are returned"""
+        with self._cond:
+            if self.closed: raise PoolError("connection pool is closed")
+            self.closed = True
+            conns = [conn for conn, _ in self._pool]
+            self._pool.clear()
+            self.size -= len(conns)
+            self._cond.notify_all()
+
+        for conn in conns:
+            self._close(conn)
+
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Send reads to read replicas and everything else to the primary
+
+    from prom.interface import routing
+
+    routing.configure(
+        "postgres://user:pw@primary/db",
+        ["postgres://user:pw@replica1/db", "postgres://user:pw@replica2/db"],
+    )
+
+get, get_one, count, and explain (and so Query.get(), Query.one(), Query.count(),
+and Query.has()) go to a replica unless they are inside a transaction(), are
+using an explicit connection, or the same thread wrote something in the last
+read_your_writes seconds, everything else goes to the primary
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import time
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+
+import dsnparse
+
+from ..config import DsnConnection
+from ..compat import *
+from . import set_interface
+
+
+logger = logging.getLogger(__name__)
+
+
+class Replica(object):
+    """Keeps track of how busy and how healthy one replica interface is
+
+    a replica is ejected for eject_time seconds after max_failures reads in a
+    row fail on it but work on the primary, once that time is up it gets
+    another chance and one more failure ejects it again
+    """
+    def __init__(self, interface, max_failures=3, eject_time=30.0):
+        """
+        :param interface: Interface, the replica
+        :param max_failures: int, how many failures in a row eject the replica
+        :param eject_time: float, how many seconds an ejected replica is skipped
+        """
+        self.interface = interface
+        self.max_failures = int(max_failures)
+        self.eject_time = float(eject_time)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def is_healthy(self, now=None):
+        return self.ejected_until <= (now or time.time())
+
+    def start(self):
+        with self.lock:
+            self.active += 1
+
+    def stop(self):
+        with self.lock:
+            self.active -= 1
+
+    def succeeded(self):
+        if self.failures:
+            with self.lock:
+                self.failures = 0
+
+    def failed(self, e):
+        with self.lock:
+            self.failures += 1
+            ejected = self.failures >= self.max_failures
+            if ejected:
+                self.ejected_until = time.time() + self.eject_time
+
+        if ejected:
+            logger.warning("Ejecting replica {} for {} seconds after {} failures: {}".format(
+                self.interface.connection_config.interface_name,
+                self.eject_time,
+                self.failures,
+                e,
+            ))
+
+
+class RoutingInterface(object):
+    """Wraps a primary interface and its replicas and routes each call to one
+    of them
+
+    anything this class doesn't route itself is passed through to the primary
+    """
+    strategies = set(["round_robin", "least_loaded"])
+
+    def __init__(self, primary, replicas, **kwargs):
+        """
+        :param primary: Interface, all writes and transactions go here
+        :param replicas: list, the replica Interface instances
+        :param **kwargs: these default to the primary's dsn options of the same
+            name (eg, routing_strategy)
+            routing_strategy -- string -- round_robin or least_loaded
+            read_your_writes -- float -- how many seconds after a write the same
+                thread keeps reading from the primary (default 1.0)
+            replica_max_failures -- int -- failures in a row before a replica is
+                ejected (default 3)
+            replica_eject_time -- float -- how many seconds an ejected replica is
+                skipped (default 30.0)
+        """
+        self.primary = primary
+        options = primary.connection_config.options
+
+        def option(k, default):
+            return kwargs.get(k, options.get(k, default))
+
+        self.strategy = option("routing_strategy", "round_robin")
+        if self.strategy not in self.strategies:
+            raise ValueError("Unknown routing strategy {}, must be one of {}".format(
+                self.strategy,
+                ", ".join(sorted(self.strategies)),
+            ))
+
+        self.read_your_writes = float(option("read_your_writes", 1.0))
+        self.replica_max_failures = int(option("replica_max_failures", 3))
+        self.replica_eject_time = float(option("replica_eject_time", 30.0))
+        self.replicas = [
+            Replica(
+                r,
+                max_failures=self.replica_max_failures,
+                eject_time=self.replica_eject_time,
+            ) for r in replicas
+        ]
+
+        # holds state that is specific to the current thread (or greenlet if
+        # gevent has patched threading)
+        self.local = threading.local()
+        self.counter = itertools.count()
+
+    def __getattr__(self, k):
+        # __dict__ so this doesn't recurse if primary hasn't been set yet
+        try:
+            primary = self.__dict__["primary"]
+
+        except KeyError:
+            raise AttributeError(k)
+
+        return getattr(primary, k)
+
+    def get_interfaces(self):
+        """return the primary and all the replica interfaces"""
+        return [self.primary] + [r.interface for r in self.replicas]
+
+    def connect(self, *args, **kwargs):
+        for r in self.replicas:
+            r.interface.connect()
+        return self.primary.connect(*args, **kwargs)
+
+    def close(self):
+        for r in self.replicas:
+            r.interface.close()
+        return self.primary.close()
+
+    def spawn(self):
+        return type(self)(
+            self.primary.spawn(),
+            [r.interface.spawn() for r in self.replicas],
+            routing_strategy=self.strategy,
+            read_your_writes=self.read_your_writes,
+            replica_max_failures=self.replica_max_failures,
+            replica_eject_time=self.replica_eject_time,
+        )
+
+    def add_observer(self, observer):
+        for interface in self.get_interfaces():
+            interface.add_observer(observer)
+
+    def remove_observer(self, observer):
+        for interface in self.get_interfaces():
+            interface.remove_observer(observer)
+
+    def use_primary(self, connection=None, **kwargs):
+        """return True if a read with these arguments has to go to the primary"""
+        if connection is not None: return True
+        if getattr(self.local, "transactions", 0): return True
+
+        last_write = getattr(self.local, "last_write", None)
+        return last_write is not None and (time.time() - last_write) < self.read_your_writes
+
+    def get_replica(self):
+        """return the healthy replica the next read should go to, or None if
+        every replica has been ejected"""
+        now = time.time()
+        replicas = [r for r in self.replicas if r.is_healthy(now)]
+        if not replicas: return None
+
+        i = next(self.counter) % len(replicas)
+        if self.strategy == "least_loaded":
+            # rotate so ties don't always go to the first replica
+            return min(replicas[i:] + replicas[:i], key=lambda r: r.active)
+
+        return replicas[i]
+
+    def read(self, method_name, schema, query=None, **kwargs):
+        """run an interface read method on a replica, or the primary if it has
+        to go there or there aren't any healthy replicas"""
+        replica = None if self.use_primary(**kwargs) else self.get_replica()
+        if replica is None:
+            return getattr(self.primary, method_name)(schema, query, **kwargs)
+
+        replica.start()
+        try:
+            ret = getattr(replica.interface, method_name)(schema, query, **kwargs)
+
+        except Exception as e:
+            # if the primary can't run it either then the read was the problem
+            # and not the replica, so the replica only fails if this works
+            ret = getattr(self.primary, method_name)(schema, query, **kwargs)
+            replica.failed(e)
+
+        else:
+            replica.succeeded()
+
+        finally:
+            replica.stop()
+
+        return ret
+
+    def write(self, method_name, *args, **kwargs):
+        """run an interface method on the primary and start this thread's
+        read_your_writes window"""
+        try:
+            return getattr(self.primary, method_name)(*args, **kwargs)
+
+        finally:
+            self.local.last_write = time.time()
+
+    def get_one(self, schema, query=None, **kwargs):
+        return self.read("get_one", schema, query, **kwargs)
+
+    def get(self, schema, query=None, **kwargs):
+        return self.read("get", schema, query, **kwargs)
+
+    def count(self, schema, query=None, **kwargs):
+        return self.read("count", schema, query, **kwargs)
+
+    def explain(self, schema, query=None, **kwargs):
+        return self.read("explain", schema, query, **kwargs)
+
+    def query(self, query_str, *query_args, **query_options):
+        # there is no telling what a raw query does so it is treated as a write
+        return self.write("query", query_str, *query_args, **query_options)
+
+    def insert(self, schema, fields, **kwargs):
+        return self.write("insert", schema, fields, **kwargs)
+
+    def update(self, schema, fields, query, **kwargs):
+        return self.write("update", schema, fields, query, **kwargs)
+
+    def delete(self, schema, query, **kwargs):
+        return self.write("delete", schema, query, **kwargs)
+
+    def execute_operations(self, operations, **kwargs):
+        return self.write("execute_operations", operations, **kwargs)
+
+    def execute_batch(self, queries, **kwargs):
+        return self.write("execute_batch", queries, **kwargs)
+
+    @contextmanager
+    def transaction(self, connection=None, **kwargs):
+        """a transaction on the primary, every read inside it goes to the primary"""
+        self.local.transactions = getattr(self.local, "transactions", 0) + 1
+        try:
+            with self.primary.transaction(connection, **kwargs) as connection:
+                yield connection
+
+        finally:
+            self.local.transactions -= 1
+            self.local.last_write = time.time()
+
+    @contextmanager
+    def pipeline(self, **kwargs):
+        try:
+            with self.primary.pipeline(**kwargs) as pipeline:
+                yield pipeline
+
+        finally:
+            self.local.last_write = time.time()
+
+
+def configure(primary_dsn, replica_dsns, name=None, connection_class=DsnConnection, **kwargs):
+    """configure a RoutingInterface so it can be retrieved with get_interface()
+
+    :param primary_dsn: string, the primary's dsn, its options are used for the
+        routing options (eg, ?routing_strategy=least_loaded&read_your_writes=2)
+    :param replica_dsns: list, the dsns of the replicas
+    :param name: string, the connection name, defaults to the primary dsn's name
+    :param **kwargs: passed through to RoutingInterface
+    :returns: RoutingInterface
+    """
+    c = dsnparse.parse(primary_dsn, parse_class=connection_class)
+    replicas = [
+        dsnparse.parse(dsn, parse_class=connection_class).interface for dsn in replica_dsns
+    ]
+    inter = RoutingInterface(c.interface, replicas, **kwargs)
+    set_interface(inter, c.name if name is None else name)
+    return inter
+
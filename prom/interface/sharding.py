@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+"""
+Split an Orm's rows across several databases by the value of one of its fields
+
+    from prom.interface import sharding
+
+    sharding.configure([
+        "postgres://user:pw@host1/db",
+        "postgres://user:pw@host2/db",
+        "postgres://user:pw@host3/db",
+    ], name="tenants")
+
+    class Foo(prom.Orm):
+        connection_name = "tenants"
+        shard_key = "tenant_id"
+        tenant_id = prom.Field(int, True)
+
+Orm.shard_for() decides which shard a shard_key value lives on. Inserts go to
+the row's shard and queries that are filtered by the shard key (eq or in) only go
+to those shards, every other query is run on all the shards in parallel and the
+results are merged in the query's sort order with limit and offset applied after
+the merge.
+
+Primary keys are generated by each shard so they need to be unique across the
+shards (eg, uuids) if rows are going to be looked up by primary key alone
+"""
+from __future__ import unicode_literals, division, print_function, absolute_import
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import dsnparse
+
+from ..config import DsnConnection
+from ..query import Query
+from ..utils import merge_sorted
+from ..compat import *
+from . import set_interface
+from .base import ListCursor
+from .sqlite import SQLite
+
+
+class ShardedInterface(object):
+    """Wraps an interface for each shard and routes each call to the shards it
+    needs to run on
+
+    an Orm that uses this interface should set Orm.shard_key, Orms without a
+    shard key have every query run on every shard and can't be inserted
+    """
+    @property
+    def connection_config(self):
+        return self.shards[0].connection_config
+
+    @property
+    def connected(self):
+        return all(shard.connected for shard in self.shards)
+
+    def __init__(self, shards, **kwargs):
+        """
+        :param shards: list, the Interface of each shard, the order matters since
+            Orm.shard_for() returns an index into this list
+        :param **kwargs:
+            nulls_first -- boolean -- True if the shards sort NULL before other
+                values, this defaults to True for SQLite and False otherwise
+        """
+        if not shards:
+            raise ValueError("No shards")
+
+        self.shards = list(shards)
+        self.nulls_first = kwargs.get("nulls_first", isinstance(self.shards[0], SQLite))
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def connect(self, *args, **kwargs):
+        for shard in self.shards:
+            shard.connect()
+        return self.connected
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+
+        with self.executor_lock:
+            if self.executor:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+        return True
+
+    def spawn(self):
+        return type(self)([shard.spawn() for shard in self.shards], nulls_first=self.nulls_first)
+
+    def add_observer(self, observer):
+        for shard in self.shards:
+            shard.add_observer(observer)
+
+    def remove_observer(self, observer):
+        for shard in self.shards:
+            shard.remove_observer(observer)
+
+    def get_executor(self):
+        with self.executor_lock:
+            if not self.executor:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=len(self.shards),
+                    thread_name_prefix="prom-shard",
+                )
+            return self.executor
+
+    def get_shard(self, orm_class, shard_value):
+        """return the interface of the shard that rows of orm_class with
+        shard_value live on"""
+        return self.shards[orm_class.shard_for(shard_value, len(self.shards))]
+
+    def get_shard_values(self, schema, query=None, fields=None):
+        """find the shard key values a query is limited to
+
+        :param schema: Schema
+        :param query: Query, the where clause is checked for an eq or in on the
+            shard key
+        :param fields: dict, the fields being inserted, checked if query doesn't
+            have the shard key
+        :returns: list, the shard key values, or None if the rows could be on
+            any shard
+        """
+        orm_class = schema.orm_class
+        shard_key = getattr(orm_class, "shard_key", None)
+        if not shard_key: return None
+
+        shard_key = schema.field_name(shard_key)
+        if query:
+            for f in query.fields_where:
+                if f.name != shard_key or f.function_name or f.kwargs:
+                    continue
+
+                if isinstance(f.value, Query):
+                    continue
+
+                if f.operator == "eq":
+                    return [f.value]
+
+                elif f.operator == "in" and f.value:
+                    return list(f.value)
+
+        if fields and shard_key in fields:
+            return [fields[shard_key]]
+
+        return None
+
+    def find_shards(self, schema, query=None, fields=None):
+        """return the shard interfaces a call with these arguments has to run on"""
+        values = self.get_shard_values(schema, query, fields)
+        if values is None:
+            return self.shards
+
+        shard_count = len(self.shards)
+        orm_class = schema.orm_class
+        indexes = sorted(set(orm_class.shard_for(v, shard_count) for v in values))
+        return [self.shards[i] for i in indexes]
+
+    def fan_out(self, shards, method_name, *args, **kwargs):
+        """run method_name on every shard in shards at the same time
+
+        :returns: list, the result from each shard in shard order
+        """
+        if len(shards) == 1:
+            return [getattr(shards[0], method_name)(*args, **kwargs)]
+
+        executor = self.get_executor()
+        futures = [
+            executor.submit(getattr(shard, method_name), *args, **kwargs) for shard in shards
+        ]
+        try:
+            return [future.result() for future in futures]
+
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def check_merge(self, schema, query):
+        """raise ValueError if the results of query on each shard can't be
+        combined into the result of query on all the shards"""
+        if query.is_aggregate():
+            # the same group could be on more than one shard
+            raise ValueError("Aggregate queries can't be merged across shards")
+
+        if query.fields_partition:
+            # each partition has to be on one shard or it could get more than
+            # limit_per_group() rows
+            shard_key = getattr(schema.orm_class, "shard_key", None)
+            if not shard_key or schema.field_name(shard_key) not in query.fields_partition:
+                raise ValueError(
+                    "Partitioned queries have to be partitioned by the shard key to run across shards"
+                )
+
+    def merge(self, shards, schema, query, **kwargs):
+        """run a select on every shard and merge the results
+
+        every shard is asked for limit + offset rows sorted the same way, the
+        rows are merged with a k-way merge and then the offset and limit are
+        applied to the merged rows
+
+        :returns: list, the rows
+        """
+        self.check_merge(schema, query)
+
+        limit, offset = query.bounds.get()
+
+        shard_query = query.copy()
+        shard_query.bounds = type(query.bounds)()
+        if limit:
+            shard_query.bounds.limit = limit + offset
+
+        sort_fields = list(query.fields_sort)
+        select_names = set(query.fields_select.names())
+        if select_names:
+            # the merge needs the sort values, the iterator ignores extra fields
+            for f in sort_fields:
+                if f.name not in select_names:
+                    shard_query.select_field(f.name)
+                    select_names.add(f.name)
+
+        results = self.fan_out(shards, "get", schema, shard_query, **kwargs)
+
+        if sort_fields:
+            positions = []
+            for f in sort_fields:
+                # sorting by a list of values sorts by where the value is in the list
+                positions.append({v: i for i, v in enumerate(f.value)} if f.value else None)
+
+            def key(row):
+                ret = []
+                for f, position in zip(sort_fields, positions):
+                    v = row[f.name]
+                    ret.append(position.get(v, len(position)) if position is not None else v)
+                return tuple(ret)
+
+            rows = merge_sorted(
+                results,
+                key=key,
+                directions=tuple(f.direction for f in sort_fields),
+                nulls_first=self.nulls_first,
+            )
+
+        else:
+            rows = itertools.chain(*results)
+
+        return list(itertools.islice(rows, offset, (offset + limit) if limit else None))
+
+    def get(self, schema, query=None, **kwargs):
+        if not query: query = Query()
+        shards = self.find_shards(schema, query)
+        if len(shards) == 1:
+            return shards[0].get(schema, query, **kwargs)
+
+        cursor_result = kwargs.pop("cursor_result", False)
+        rows = self.merge(shards, schema, query, **kwargs)
+        return ListCursor(rows) if cursor_result else rows
+
+    def get_one(self, schema, query=None, **kwargs):
+        if not query: query = Query()
+        shards = self.find_shards(schema, query)
+        if len(shards) == 1:
+            return shards[0].get_one(schema, query, **kwargs)
+
+        query = query.copy()
+        query.bounds.limit = 1
+        query.bounds.paginate = False
+        rows = self.merge(shards, schema, query, **kwargs)
+        return rows[0] if rows else {}
+
+    def count(self, schema, query=None, **kwargs):
+        shards = self.find_shards(schema, query)
+        if len(shards) > 1 and query:
+            self.check_merge(schema, query)
+        return sum(self.fan_out(shards, "count", schema, query, **kwargs))
+
+    def explain(self, schema, query=None, **kwargs):
+        """the plan on the first shard the query would run on"""
+        shards = self.find_shards(schema, query)
+        return shards[0].explain(schema, query, **kwargs)
+
+    def insert(self, schema, fields, **kwargs):
+        values = self.get_shard_values(schema, fields=fields)
+        if values is None:
+            raise ValueError("Cannot insert into {} without a value for its shard key".format(schema))
+
+        shard = self.get_shard(schema.orm_class, values[0])
+        return shard.insert(schema, fields, **kwargs)
+
+    def update(self, schema, fields, query, **kwargs):
+        # the rows are on the shards of their current shard key values so only
+        # the query can say where they are
+        shards = self.find_shards(schema, query)
+
+        values = self.get_shard_values(schema, fields=fields)
+        if values is not None:
+            shard = self.get_shard(schema.orm_class, values[0])
+            if any(s is not shard for s in shards):
+                # the rows would have to move to another shard
+                raise ValueError(
+                    "Cannot update the shard key of rows in {} to a value on another shard".format(schema)
+                )
+
+        return sum(self.fan_out(shards, "update", schema, fields, query, **kwargs))
+
+    def delete(self, schema, query, **kwargs):
+        shards = self.find_shards(schema, query)
+        return sum(self.fan_out(shards, "delete", schema, query, **kwargs))
+
+    def query(self, query_str, *query_args, **query_options):
+        """run a raw query on every shard
+
+        :returns: list, each shard's result in shard order
+        """
+        return self.fan_out(self.shards, "query", query_str, *query_args, **query_options)
+
+    def transaction(self, *args, **kwargs):
+        raise ValueError(
+            "Transactions can't span shards, use get_shard() to get the interface of one shard"
+        )
+
+    def in_transaction(self):
+        return any(shard.in_transaction() for shard in self.shards)
+
+    def max_concurrency(self):
+        return min(shard.max_concurrency() for shard in self.shards)
+
+    def get_pipeline(self):
+        return None
+
+    def render(self, schema, query, **kwargs):
+        return self.shards[0].render(schema, query, **kwargs)
+
+    def set_table(self, schema, **kwargs):
+        return all([shard.set_table(schema, **kwargs) for shard in self.shards])
+
+    def set_tables(self, schemas, **kwargs):
+        ret = []
+        for shard in self.shards:
+            ret = shard.set_tables(schemas, **kwargs)
+        return ret
+
+    def set_index(self, schema, name, fields, **index_options):
+        return all([shard.set_index(schema, name, fields, **index_options) for shard in self.shards])
+
+    def has_table(self, table_name, **kwargs):
+        return all([shard.has_table(table_name, **kwargs) for shard in self.shards])
+
+    def get_tables(self, table_name="", **kwargs):
+        return self.shards[0].get_tables(table_name, **kwargs)
+
+    def get_fields(self, table_name, **kwargs):
+        return self.shards[0].get_fields(table_name, **kwargs)
+
+    def get_indexes(self, schema, **kwargs):
+        return self.shards[0].get_indexes(schema, **kwargs)
+
+    def delete_table(self, schema, **kwargs):
+        return all([shard.delete_table(schema, **kwargs) for shard in self.shards])
+
+    def unsafe_delete_table(self, schema, **kwargs):
+        return all([shard.unsafe_delete_table(schema, **kwargs) for shard in self.shards])
+
+    def delete_tables(self, **kwargs):
+        return all([shard.delete_tables(**kwargs) for shard in self.shards])
+
+    def unsafe_delete_tables(self):
+        return all([shard.unsafe_delete_tables() for shard in self.shards])
+
+
+def configure(dsns, name=None, connection_class=DsnConnection, **kwargs):
+    """configure a ShardedInterface so it can be retrieved with get_interface()
+
+    :param dsns: list, the dsn of each shard, in shard order
+    :param name: string, the connection name, defaults to the first dsn's name
+    :param **kwargs: passed through to ShardedInterface
+    :returns: ShardedInterface
+    """
+    cs = [dsnparse.parse(dsn, parse_class=connection_class) for dsn in dsns]
+    inter = ShardedInterface([c.interface for c in cs], **kwargs)
+    set_interface(inter, cs[0].name if name is None else name)
+    return inter
@@ -27,18 +27,29 @@ import decimal
 import datetime
 from distutils import dir_util
 import re
+import json
+import math
 import sqlite3
+import threading
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future
 try:
     import thread
 except ImportError:
     thread = None
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from datatypes import Datetime
 
 # first party
 from ..exception import UniqueError
 from ..compat import *
-from .base import SQLInterface, SQLConnection
+from .base import SQLInterface, SQLConnection, Plan, PlanNode
 
 
 class SQLiteRowDict(sqlite3.Row):
@@ -60,15 +71,158 @@ class SQLiteConnection(SQLConnection, sqlite3.Connection):
     to Postgres' connection instance so the common code can all be the same in the
     parent class
     """
+    transaction_mode = ""
+    """DEFERRED, IMMEDIATE, or EXCLUSIVE, empty uses SQLite's default (DEFERRED)
+
+    https://www.sqlite.org/lang_transaction.html
+    """
+
     def __init__(self, *args, **kwargs):
         super(SQLiteConnection, self).__init__(*args, **kwargs)
         self.closed = 0
+        self.readonly = False
 
     def close(self, *args, **kwargs):
         r = super(SQLiteConnection, self).close(*args, **kwargs)
         self.closed = 1
         return r
 
+    def _transaction_start(self):
+        cur = self.cursor()
+        if self.transaction_mode:
+            cur.execute("BEGIN {}".format(self.transaction_mode))
+        else:
+            cur.execute("BEGIN")
+
+
+class SQLiteWriter(object):
+    """Runs all the writes of an SQLite interface on one dedicated thread
+
+    SQLite only allows one writer at a time, so rather than having every thread
+    fight over the write lock (and getting "database is locked" errors) the
+    writes are queued and the writer thread commits everything that is waiting
+    in one BEGIN IMMEDIATE ... COMMIT (group commit). Each write still runs in
+    its own savepoint so one failing write won't take the others down with it.
+
+    you shouldn't create this directly, it is created by SQLite when the writer
+    dsn option is set
+
+    https://www.sqlite.org/lang_transaction.html
+    """
+    def __init__(self, interface, batch_size=100):
+        self.interface = interface
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+
+        # held by the writer thread while it commits a batch, or by any thread
+        # that has an explicit transaction open on the writer connection
+        self.lock = threading.RLock()
+
+        self.connection = self.create_connection()
+        self.thread = threading.Thread(
+            target=self.run,
+            name="{}.writer".format(interface.connection_config.interface_name),
+        )
+        self.thread.daemon = True
+        self.thread.start()
+
+    def create_connection(self):
+        connection = self.interface.create_connection(self.interface.connection_config)
+        connection.transaction_mode = "IMMEDIATE"
+        return connection
+
+    def get_connection(self):
+        """return the writer connection, this should only be called while holding
+        .lock"""
+        connection = self.connection
+        if connection.closed:
+            connection = self.create_connection()
+            self.connection = connection
+
+        readonly = self.interface.connection_config.readonly
+        if connection.readonly != readonly:
+            self.interface._readonly_connection(connection, readonly)
+
+        return connection
+
+    def submit(self, method_name, *args, **kwargs):
+        """queue a write
+
+        :param method_name: str, the interface method to call (eg, "insert")
+        :param *args: passed to the interface method
+        :param **kwargs: passed to the interface method
+        :returns: concurrent.futures.Future, will hold the result of the write
+            once it has been committed
+        """
+        future = Future()
+        self.queue.put((future, method_name, args, kwargs))
+        return future
+
+    def run(self):
+        running = True
+        while running:
+            jobs = [self.queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in jobs:
+                running = False
+                jobs = [job for job in jobs if job is not None]
+
+            if jobs:
+                with self.lock:
+                    self.commit(jobs)
+
+    def commit(self, jobs):
+        """run all the jobs in one transaction and resolve their futures"""
+        jobs = [job for job in jobs if job[0].set_running_or_notify_cancel()]
+        if not jobs: return
+
+        results = []
+        try:
+            connection = self.get_connection()
+            name = connection.transaction_name()
+            connection.transaction_start(name)
+
+        except Exception as e:
+            for job in jobs:
+                job[0].set_exception(e)
+            return
+
+        try:
+            for future, method_name, args, kwargs in jobs:
+                kwargs["connection"] = connection
+                try:
+                    r = getattr(self.interface, method_name)(*args, **kwargs)
+                    results.append((future, r, None))
+
+                except Exception as e:
+                    results.append((future, None, e))
+
+            connection.transaction_stop(name)
+
+        except Exception as e:
+            connection.transaction_fail(name)
+            for job in jobs:
+                job[0].set_exception(e)
+
+        else:
+            self.interface.log("Writer committed {} writes", len(results))
+            for future, r, e in results:
+                if e is None:
+                    future.set_result(r)
+                else:
+                    future.set_exception(e)
+
+    def close(self):
+        """finish any queued writes and then stop the writer thread"""
+        self.queue.put(None)
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+
 
 class TimestampType(object):
     """External sqlite3 databases can store the TIMESTAMP type as unix timestamps,
@@ -84,6 +238,34 @@ class TimestampType(object):
     def adapt(val):
         return val.isoformat(b" ") if is_py2 else val.isoformat(" ")
 
+    @staticmethod
+    def decode(val):
+        """Used by SQLiteRowDecoder, this tries the format prom writes (see adapt)
+        first and only falls back to convert() for legacy formats"""
+        val = StringType.adapt(val)
+        if isinstance(val, basestring):
+            try:
+                ret = datetime.datetime.fromisoformat(val)
+
+            except (ValueError, AttributeError):
+                ret = TimestampType.convert(val)
+
+            else:
+                if ret.tzinfo is not None:
+                    # like convert() we only accept UTC
+                    if ret.utcoffset():
+                        ret = TimestampType.convert(val)
+                    else:
+                        ret = ret.replace(tzinfo=None)
+
+        elif isinstance(val, float):
+            ret = datetime.datetime.fromtimestamp(val)
+
+        else:
+            ret = TimestampType.convert("{}".format(val))
+
+        return ret
+
     @staticmethod
     def convert(val):
         val = StringType.adapt(val)
@@ -162,11 +344,31 @@ class BooleanType(object):
         return bool(int(val))
 
 
+class DateType(object):
+    @staticmethod
+    def decode(val):
+        val = StringType.adapt(val)
+        try:
+            ret = datetime.date.fromisoformat(val)
+
+        except (ValueError, TypeError, AttributeError):
+            ret = TimestampType.decode(val).date()
+
+        return ret
+
+
 class NumericType(object):
     @staticmethod
     def adapt(val):
         return float(str(val))
 
+    @staticmethod
+    def decode(val):
+        if isinstance(val, float):
+            # go through str so we get 1.1 instead of 1.100000000000000088817...
+            val = str(val)
+        return decimal.Decimal(StringType.adapt(val))
+
     @staticmethod
     def convert(val):
         if is_py2:
@@ -188,12 +390,137 @@ class StringType(object):
         return val
 
 
+class SQLiteRowDecoder(object):
+    """Decodes the raw values SQLite returns using the types of the schema's fields
+
+    SQLite's PARSE_DECLTYPES runs the registered converter for every typed column
+    of every row, this instead only converts the columns of the schema that need
+    it and converts a whole batch of rows at a time
+
+    you shouldn't create this directly, use SQLite.get_decoder()
+    """
+    def __init__(self, schema):
+        self.field_count = len(schema.fields)
+        self.converters = {}
+        for field_name, field in schema.fields.items():
+            converter = self.get_converter(field.interface_type)
+            if converter:
+                self.converters[field_name] = converter
+
+    def get_converter(self, interface_type):
+        """return the callable that will convert a raw value into interface_type,
+        or None if the raw value is already correct"""
+        converter = None
+        if issubclass(interface_type, bool):
+            converter = BooleanType.convert
+
+        elif issubclass(interface_type, datetime.datetime):
+            converter = TimestampType.decode
+
+        elif issubclass(interface_type, datetime.date):
+            converter = DateType.decode
+
+        elif issubclass(interface_type, decimal.Decimal):
+            converter = NumericType.decode
+
+        elif issubclass(interface_type, basestring):
+            converter = StringType.adapt
+
+        return converter
+
+    def decode_rows(self, rows):
+        """decode a batch of rows
+
+        :param rows: list, the sqlite3.Row instances fetched from the cursor
+        :returns: list, a dict for each row
+        """
+        if not rows: return []
+
+        names = rows[0].keys()
+        converters = [(i, name, self.converters.get(name)) for i, name in enumerate(names)]
+        if not any(converter for _, _, converter in converters):
+            return [dict(zip(names, row)) for row in rows]
+
+        ret = []
+        for row in rows:
+            d = {}
+            for i, name, converter in converters:
+                v = row[i]
+                d[name] = v if converter is None or v is None else converter(v)
+            ret.append(d)
+        return ret
+
+    def decode_row(self, row):
+        return self.decode_rows([row])[0] if row else row
+
+
+class SQLiteCursor(object):
+    """Wraps a cursor so fetched rows are decoded in batches
+
+    this is returned from a query that has both cursor_result and schema
+    """
+    def __init__(self, cursor, decoder):
+        self.cursor = cursor
+        self.decoder = decoder
+        self.rows = deque()
+
+    def __getattr__(self, k):
+        return getattr(self.cursor, k)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.rows:
+            self.rows.extend(self.decoder.decode_rows(
+                self.cursor.fetchmany(max(self.cursor.arraysize, 100))
+            ))
+
+        if not self.rows:
+            raise StopIteration()
+
+        return self.rows.popleft()
+
+    next = __next__
+
+    def fetchone(self):
+        try:
+            return next(self)
+        except StopIteration:
+            return None
+
+    def fetchmany(self, size=None):
+        size = self.cursor.arraysize if size is None else size
+        ret = []
+        while self.rows and len(ret) < size:
+            ret.append(self.rows.popleft())
+        if len(ret) < size:
+            ret.extend(self.decoder.decode_rows(self.cursor.fetchmany(size - len(ret))))
+        return ret
+
+    def fetchall(self):
+        ret = list(self.rows)
+        self.rows.clear()
+        ret.extend(self.decoder.decode_rows(self.cursor.fetchall()))
+        return ret
+
+
 class SQLite(SQLInterface):
 
     val_placeholder = '?'
 
     _connection = None
 
+    writer = None
+    """SQLiteWriter instance if the writer dsn option is on"""
+
+    EXPLAIN_SCAN_REGEX = re.compile(
+        r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+\S+)?"
+        r"(?:\s+USING\s+(?:AUTOMATIC\s+)?(?:PARTIAL\s+)?(?:COVERING\s+)?INDEX\s+(\S+)"
+        r"|\s+USING\s+(INTEGER PRIMARY KEY|PRIMARY KEY))?"
+    )
+    """parses the SCAN and SEARCH lines of EXPLAIN QUERY PLAN"""
+
     @classmethod
     def configure(cls, connection_config):
         dsn = getattr(connection_config, 'dsn', '')
@@ -219,14 +546,83 @@ class SQLite(SQLInterface):
         return connection_config
 
     def _connect(self, connection_config):
+        self.register_types()
+
+        # connections are held by the threads that created them, this is just
+        # so close() can find them all, it won't keep dead threads' connections
+        # from being garbage collected
+        self.connections = weakref.WeakSet()
+        self.connections_lock = threading.Lock()
+        self._connection = None
+        self.decoders = weakref.WeakKeyDictionary()
+
+        if self.is_memory(connection_config):
+            # every connection to an in memory db would get its own brand new
+            # db so all the threads have to share the one connection
+            self._connection = self.create_connection(connection_config)
+
+        else:
+            # make sure we can actually connect, this connection will be used
+            # by the current thread
+            self.get_connection()
+
+            if int(connection_config.options.get("writer", 0)):
+                self.writer = SQLiteWriter(
+                    self,
+                    batch_size=int(connection_config.options.get("writer_batch_size", 100)),
+                )
+
+    def is_memory(self, connection_config):
+        """return True if connection_config points to an in memory db"""
+        path = connection_config.path
+        return path == ":memory:" or path.startswith("file::memory:") or "mode=memory" in path
+
+    @classmethod
+    def register_types(cls):
+        """register the adapters and converters, sqlite3 keeps these globally
+        so they only need to be registered once and then every connection will
+        use them
+
+        https://docs.python.org/2/library/sqlite3.html#default-adapters-and-converters
+        """
+        # for some reason this is needed in python 3.6 in order for saved bytes
+        # to be ran through the converter, not sure why
+        sqlite3.register_converter(b'TEXT' if is_py2 else 'TEXT', StringType.adapt)
+
+        sqlite3.register_adapter(decimal.Decimal, NumericType.adapt)
+        sqlite3.register_converter(b'NUMERIC' if is_py2 else 'NUMERIC', NumericType.convert)
+
+        sqlite3.register_adapter(bool, BooleanType.adapt)
+        sqlite3.register_converter(b'BOOLEAN' if is_py2 else 'BOOLEAN', BooleanType.convert)
+
+        # sadly, it doesn't look like these work for child classes so each class
+        # has to be adapted even if its parent is already registered
+        sqlite3.register_adapter(datetime.datetime, TimestampType.adapt)
+        sqlite3.register_adapter(Datetime, TimestampType.adapt)
+        sqlite3.register_converter(b'TIMESTAMP' if is_py2 else 'TIMESTAMP', TimestampType.convert)
+
+    def create_connection(self, connection_config):
+        """create a new raw db connection and configure it
+
+        you shouldn't need to call this directly, use get_connection()
+
+        :param connection_config: config.Connection
+        :returns: SQLiteConnection
+        """
         path = connection_config.path
 
-        # https://docs.python.org/2/library/sqlite3.html#default-adapters-and-converters
         options = {
             'isolation_level': None,
-            'detect_types': sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES,
+            # the values of schema queries are decoded by SQLiteRowDecoder, so the
+            # converters only run when the column name asks for them, eg,
+            # SELECT foo AS "foo [TIMESTAMP]"
+            'detect_types': sqlite3.PARSE_COLNAMES,
             'factory': SQLiteConnection,
-            'check_same_thread': True, # https://stackoverflow.com/a/2578401/5006
+            # connections are only ever used by the thread that created them (or
+            # by every thread for an in memory db) but this allows close() to
+            # close all the connections from whatever thread it was called in
+            # https://stackoverflow.com/a/2578401/5006
+            'check_same_thread': False,
         }
         option_keys = list(options.keys()) + ['timeout', 'cached_statements']
         for k in option_keys:
@@ -234,7 +630,7 @@ class SQLite(SQLInterface):
                 options[k] = connection_config.options[k]
 
         try:
-            self._connection = sqlite3.connect(path, **options)
+            connection = sqlite3.connect(path, **options)
 
         except sqlite3.DatabaseError as e:
             path_d = os.path.dirname(path)
@@ -244,37 +640,85 @@ class SQLite(SQLInterface):
             else:
                 # let's try and make the directory path and connect again
                 dir_util.mkpath(path_d)
-                self._connection = sqlite3.connect(path, **options)
+                connection = sqlite3.connect(path, **options)
 
-        # https://docs.python.org/2/library/sqlite3.html#row-objects
-        self._connection.row_factory = SQLiteRowDict
-        # https://docs.python.org/2/library/sqlite3.html#sqlite3.Connection.text_factory
-        self._connection.text_factory = StringType.adapt
+        try:
+            self.configure_connection(connection, connection_config)
 
-        # for some reason this is needed in python 3.6 in order for saved bytes
-        # to be ran through the converter, not sure why
-        sqlite3.register_converter(b'TEXT' if is_py2 else 'TEXT', StringType.adapt)
+        except Exception:
+            connection.close()
+            raise
 
-        sqlite3.register_adapter(decimal.Decimal, NumericType.adapt)
-        sqlite3.register_converter(b'NUMERIC' if is_py2 else 'NUMERIC', NumericType.convert)
+        with self.connections_lock:
+            self.connections.add(connection)
 
-        sqlite3.register_adapter(bool, BooleanType.adapt)
-        sqlite3.register_converter(b'BOOLEAN' if is_py2 else 'BOOLEAN', BooleanType.convert)
+        self.log("Created connection {} for thread {}", id(connection), self._get_thread())
+        return connection
 
-        # sadly, it doesn't look like these work for child classes so each class
-        # has to be adapted even if its parent is already registered
-        sqlite3.register_adapter(datetime.datetime, TimestampType.adapt)
-        sqlite3.register_adapter(Datetime, TimestampType.adapt)
-        sqlite3.register_converter(b'TIMESTAMP' if is_py2 else 'TIMESTAMP', TimestampType.convert)
+    def configure_connection(self, connection, connection_config):
+        """Set all the things on a new connection
+
+        WAL journaling lets readers keep reading while a writer is writing, these
+        can be tuned through dsn options:
+
+            * journal_mode -- defaults to WAL
+            * synchronous -- defaults to NORMAL, which is safe when using WAL
+            * busy_timeout -- milliseconds to wait on a locked db
+            * cache_size -- pages, or KiB if negative
+            * mmap_size -- bytes
+
+        https://www.sqlite.org/wal.html
+        https://www.sqlite.org/pragma.html
+        """
+        # https://docs.python.org/2/library/sqlite3.html#row-objects
+        connection.row_factory = SQLiteRowDict
+        # https://docs.python.org/2/library/sqlite3.html#sqlite3.Connection.text_factory
+        connection.text_factory = StringType.adapt
+
+        options = connection_config.options
+        pragmas = [
+            # turn on foreign keys
+            # http://www.sqlite.org/foreignkeys.html
+            ("foreign_keys", "ON"),
+        ]
+
+        if not self.is_memory(connection_config):
+            pragmas.append(("journal_mode", options.get("journal_mode", "WAL")))
+            pragmas.append(("synchronous", options.get("synchronous", "NORMAL")))
+
+        for name in ["busy_timeout", "cache_size", "mmap_size"]:
+            if name in options:
+                pragmas.append((name, int(options[name])))
+
+        for name, val in pragmas:
+            self._query(
+                'PRAGMA {} = {}'.format(name, val),
+                ignore_result=True,
+                connection=connection
+            )
 
-        # turn on foreign keys
-        # http://www.sqlite.org/foreignkeys.html
-        self._query('PRAGMA foreign_keys = ON', ignore_result=True);
-        self.readonly(self.connection_config.readonly)
+        self._readonly_connection(connection, connection_config.readonly)
 
     def get_connection(self):
         if not self.connected: self.connect()
-        return self._connection
+
+        connection = self._connection
+        if connection is None:
+            # if this thread has a writer transaction open then everything should
+            # go through that so this thread can see its uncommitted writes
+            connection = getattr(self.local, "writer_connection", None)
+
+        if connection is None:
+            connection = getattr(self.local, "connection", None)
+            if connection is None or connection.closed:
+                connection = self.create_connection(self.connection_config)
+                self.local.connection = connection
+
+        # change the connection readonly status if they don't match
+        if connection.readonly != self.connection_config.readonly:
+            self._readonly_connection(connection, self.connection_config.readonly)
+
+        return connection
 
     def _get_thread(self):
         if thread:
@@ -284,16 +728,109 @@ class SQLite(SQLInterface):
         return ret
 
     def _close(self):
-        self._connection.close()
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+            self.local.writer_connection = None
+
+        with self.connections_lock:
+            connections = list(self.connections)
+            self.connections = weakref.WeakSet()
+
+        for connection in connections:
+            connection.close()
+
         self._connection = None
+        self.local.connection = None
 
     def _readonly(self, readonly):
+        """readonly setting is handled when you grab the connection from get_connection()
+        so this method does nothing"""
+        pass
+
+    def _readonly_connection(self, connection, readonly):
         self._query(
             # https://stackoverflow.com/a/49630725/5006
             'PRAGMA query_only = {}'.format("ON" if readonly else "OFF"),
-            ignore_result=True
+            ignore_result=True,
+            connection=connection
+        )
+        connection.readonly = readonly
+
+    def use_writer(self, **kwargs):
+        """return True if a write with these kwargs should be sent to the writer
+        thread"""
+        if not self.connected: self.connect()
+        return (
+            self.writer is not None
+            and not kwargs.get("connection", None)
+            and not getattr(self.local, "writer_connection", None)
         )
 
+    @contextmanager
+    def transaction(self, connection=None, **kwargs):
+        """if the writer is on then an explicit transaction will lock the writer
+        and run on the writer connection in the current thread, so everything in
+        the transaction, including reads, is serialized with the other writes"""
+        if connection is None and self.use_writer():
+            with self.writer.lock:
+                connection = self.writer.get_connection()
+                self.local.writer_connection = connection
+                try:
+                    with super(SQLite, self).transaction(connection, **kwargs) as connection:
+                        yield connection
+
+                finally:
+                    self.local.writer_connection = None
+
+        else:
+            with super(SQLite, self).transaction(connection, **kwargs) as connection:
+                yield connection
+
+    def insert(self, schema, fields, **kwargs):
+        if self.use_writer(**kwargs):
+            return self.writer.submit("insert", schema, fields, **kwargs).result()
+        return super(SQLite, self).insert(schema, fields, **kwargs)
+
+    def update(self, schema, fields, query, **kwargs):
+        if self.use_writer(**kwargs):
+            return self.writer.submit("update", schema, fields, query, **kwargs).result()
+        return super(SQLite, self).update(schema, fields, query, **kwargs)
+
+    def delete(self, schema, query, **kwargs):
+        if self.use_writer(**kwargs):
+            return self.writer.submit("delete", schema, query, **kwargs).result()
+        return super(SQLite, self).delete(schema, query, **kwargs)
+
+    def execute_operations(self, operations, **kwargs):
+        if self.use_writer(**kwargs):
+            return self.writer.submit("execute_operations", operations, **kwargs).result()
+        return super(SQLite, self).execute_operations(operations, **kwargs)
+
+    def get_decoder(self, schema):
+        """return the cached SQLiteRowDecoder for schema"""
+        decoder = self.decoders.get(schema, None)
+        if decoder is None or decoder.field_count != len(schema.fields):
+            decoder = SQLiteRowDecoder(schema)
+            self.decoders[schema] = decoder
+        return decoder
+
+    def _query(self, query_str, query_args=None, **query_options):
+        ret = super(SQLite, self)._query(query_str, query_args, **query_options)
+
+        schema = query_options.get("schema", None)
+        if schema is not None and not query_options.get("ignore_result", False):
+            if query_options.get("cursor_result", False):
+                ret = SQLiteCursor(ret, self.get_decoder(schema))
+
+            elif query_options.get('fetchone', query_options.get('one_result', False)):
+                ret = self.get_decoder(schema).decode_row(ret)
+
+            elif not query_options.get("count_result", False):
+                ret = self.get_decoder(schema).decode_rows(ret)
+
+        return ret
+
     def _get_tables(self, table_name, **kwargs):
         query_str = 'SELECT tbl_name FROM sqlite_master WHERE type = ?'
         query_args = ['table']
@@ -405,6 +942,10 @@ class SQLite(SQLInterface):
         return '{} {}'.format(self._normalize_name(field_name), field_type)
 
     def _set_table(self, schema, **kwargs):
+        query_str = self._set_table_SQL(schema)
+        ret = self._query(query_str, ignore_result=True, **kwargs)
+
+    def _set_table_SQL(self, schema):
         """
         http://sqlite.org/lang_createtable.html
         """
@@ -417,14 +958,13 @@ class SQLite(SQLInterface):
 
         query_str.append(",{}".format(os.linesep).join(query_fields))
         query_str.append(')')
-        query_str = os.linesep.join(query_str)
-        ret = self._query(query_str, ignore_result=True, **kwargs)
+        return os.linesep.join(query_str)
 
-    def _set_index(self, schema, name, fields, **index_options):
+    def _set_index_SQL(self, schema, name, fields, **index_options):
         """
         https://www.sqlite.org/lang_createindex.html
         """
-        query_str = "CREATE {}INDEX IF NOT EXISTS '{}_{}' ON {} ({})".format(
+        return "CREATE {}INDEX IF NOT EXISTS '{}_{}' ON {} ({})".format(
             'UNIQUE ' if index_options.get('unique', False) else '',
             schema,
             name,
@@ -432,23 +972,88 @@ class SQLite(SQLInterface):
             ', '.join((self._normalize_name(f) for f in fields))
         )
 
-        return self._query(query_str, ignore_result=True, **index_options)
-
     def _get_indexes(self, schema, **kwargs):
         """return all the indexes for the given schema"""
         # http://www.sqlite.org/pragma.html#schema
-        # http://www.mail-archive.com/sqlite-users@sqlite.org/msg22055.html
+        # https://www.sqlite.org/pragma.html#pragfunc
         # http://stackoverflow.com/questions/604939/
+        query_str = os.linesep.join([
+            'SELECT il.name AS index_name, ii.name AS field_name',
+            'FROM pragma_index_list(?) AS il JOIN pragma_index_info(il.name) AS ii',
+            'ORDER BY il.seq, ii.seqno',
+        ])
+
         ret = {}
-        rs = self._query('PRAGMA index_list({})'.format(self._normalize_table_name(schema)), **kwargs)
-        if rs:
-            for r in rs:
-                iname = r['name']
-                ret.setdefault(iname, [])
-                indexes = self._query('PRAGMA index_info({})'.format(r['name']), **kwargs)
-                for idict in indexes:
-                    ret[iname].append(idict['name'])
+        for r in self._query(query_str, [str(schema)], **kwargs):
+            ret.setdefault(r['index_name'], []).append(r['field_name'])
+        return ret
+
+    def _explain(self, schema, query, **kwargs):
+        """
+        SQLite doesn't estimate rows or costs, and it can't analyze, so the nodes
+        only say what tables and indexes are used
+
+        https://www.sqlite.org/eqp.html
+        """
+        query_str, query_args = self.get_SQL(schema, query)
+        rows = self._query("EXPLAIN QUERY PLAN {}".format(query_str), query_args, **kwargs)
+
+        nodes = {}
+        roots = []
+        for r in rows:
+            detail = r["detail"]
+            m = self.EXPLAIN_SCAN_REGEX.match(detail)
+            if m:
+                index = m.group(3) or m.group(4)
+                node = PlanNode(
+                    PlanNode.INDEX_SCAN if index else PlanNode.SEQ_SCAN,
+                    relation=m.group(2),
+                    index=index,
+                    detail=detail,
+                )
+
+            elif detail.startswith("USE TEMP B-TREE"):
+                node = PlanNode(PlanNode.SORT, detail=detail)
+
+            else:
+                node = PlanNode(detail, detail=detail)
+
+            nodes[r["id"]] = node
+            parent = nodes.get(r["parent"], None)
+            if parent is None:
+                roots.append(node)
+            else:
+                parent.children.append(node)
+
+        return Plan(roots, query_str, query_args, raw=[dict(r) for r in rows])
+
+    def _get_catalog(self, **kwargs):
+        """get every table with its fields and indexes in one query using the
+        pragma table-valued functions
+
+        https://www.sqlite.org/pragma.html#pragfunc
+        """
+        query_str = os.linesep.join([
+            "SELECT m.name AS table_name, 'field' AS kind, f.name AS name,",
+            "  NULL AS field_name, f.cid AS seq",
+            "FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS f",
+            "WHERE m.type = 'table'",
+            "UNION ALL",
+            "SELECT m.name AS table_name, 'index' AS kind, il.name AS name,",
+            "  ii.name AS field_name, ii.seqno AS seq",
+            "FROM sqlite_master AS m JOIN pragma_index_list(m.name) AS il",
+            "  JOIN pragma_index_info(il.name) AS ii",
+            "WHERE m.type = 'table'",
+            "ORDER BY table_name, kind, name, seq",
+        ])
 
+        ret = {}
+        for r in self._query(query_str, **kwargs):
+            table = ret.setdefault(r['table_name'], {"fields": [], "indexes": {}})
+            if r['kind'] == 'field':
+                table["fields"].append(r['name'])
+            else:
+                table["indexes"].setdefault(r['name'], []).append(r['field_name'])
         return ret
 
     def _insert(self, schema, fields, **kwargs):
@@ -593,6 +1198,113 @@ class SQLite(SQLInterface):
 
         return fstrs
 
+    def _normalize_list_SQL(self, field_name, symbol, format_val_str, field_vals, field=None):
+        """lists longer than the in_list_threshold option (default 100) are
+        passed as one JSON array parameter and read back with json_each(), this
+        keeps big lists under SQLite's bound variable limit and means the
+        statement doesn't change with the length of the list
+
+        https://www.sqlite.org/json1.html#jeach
+        """
+        threshold = int(self.connection_config.options.get("in_list_threshold", 100))
+        if len(field_vals) > threshold and format_val_str == self.val_placeholder:
+            vals = self._normalize_json_vals(field_vals)
+            if vals is not None:
+                format_str = '{} {} (SELECT value FROM json_each({}))'.format(
+                    field_name,
+                    symbol,
+                    format_val_str
+                )
+                return format_str, [json.dumps(vals)]
+
+        return super(SQLite, self)._normalize_list_SQL(
+            field_name,
+            symbol,
+            format_val_str,
+            field_vals,
+            field
+        )
+
+    def _normalize_json_vals(self, field_vals):
+        """run field_vals through the same adapters sqlite3 would use if they
+        were bound on their own
+
+        :returns: list, the adapted values, or None if a value can't be
+            represented in JSON (eg, bytes) so the list has to be bound normally
+        """
+        ret = []
+        for v in field_vals:
+            adapter = sqlite3.adapters.get((type(v), sqlite3.PrepareProtocol), None)
+            if adapter:
+                v = adapter(v)
+
+            if isinstance(v, (bytes, bytearray)):
+                return None
+
+            elif v is None or isinstance(v, basestring):
+                ret.append(v)
+
+            elif isinstance(v, (int, long)):
+                ret.append(int(v))
+
+            elif isinstance(v, float) and math.isfinite(v):
+                ret.append(v)
+
+            else:
+                return None
+
+        return ret
+
+    def _normalize_trunc_SQL(self, schema, trunc):
+        """
+        SQLite doesn't have date_trunc() so this formats the datetime with the
+        parts below the unit zeroed out, weeks start on Monday like Postgres
+
+        http://www.sqlite.org/lang_datefunc.html
+        """
+        k_opts = {
+            'year': "strftime('%Y-01-01 00:00:00', {})",
+            'month': "strftime('%Y-%m-01 00:00:00', {})",
+            # move to the next Sunday (unless it is Sunday) and then back to Monday
+            'week': "strftime('%Y-%m-%d 00:00:00', {}, 'weekday 0', '-6 days')",
+            'day': "strftime('%Y-%m-%d 00:00:00', {})",
+            'hour': "strftime('%Y-%m-%d %H:00:00', {})",
+            'minute': "strftime('%Y-%m-%d %H:%M:00', {})",
+        }
+        return k_opts[trunc.unit].format(
+            self._normalize_name(schema.field_name(trunc.field_name))
+        )
+
+    def _normalize_group_SQL(self, schema, field):
+        select_str, group_str = super(SQLite, self)._normalize_group_SQL(schema, field)
+        if field.is_alias:
+            # strftime() returns a string, the column type makes PARSE_COLNAMES
+            # convert it to a datetime
+            select_str = '{} AS {}'.format(
+                group_str,
+                self._normalize_name("{} [TIMESTAMP]".format(field.name))
+            )
+        return select_str, group_str
+
+    def _normalize_partition_SQL(self, schema, query, from_str, where_str, where_args):
+        """
+        window functions were added in SQLite 3.25
+
+        https://www.sqlite.org/windowfunctions.html
+        """
+        if sqlite3.sqlite_version_info < (3, 25, 0):
+            raise ValueError("Partitioned queries need SQLite 3.25 or later, this is {}".format(
+                sqlite3.sqlite_version
+            ))
+
+        return super(SQLite, self)._normalize_partition_SQL(
+            schema,
+            query,
+            from_str,
+            where_str,
+            where_args
+        )
+
     def _normalize_sort_SQL(self, field_name, field_vals, sort_dir_str):
         """
         allow sorting by a set of values
@@ -2,7 +2,9 @@
 from __future__ import unicode_literals, division, print_function, absolute_import
 import inspect
 import sys
+import zlib
 import datetime
+from concurrent.futures import Future
 
 from datatypes.collections import Pool
 
@@ -102,6 +104,12 @@ class Orm(object):
     iterator_class = Iterator
     """the class this Orm will use for iterating through results returned from db"""
 
+    shard_key = None
+    """the name of the field that decides which shard a row lives on when the
+    interface is a prom.interface.sharding.ShardedInterface, see shard_for(). The
+    shard key of a saved orm can't be changed since the row would have to move
+    to another shard"""
+
     _id = Field(long, True, pk=True)
 
     class _created(Field):
@@ -185,6 +193,17 @@ class Orm(object):
                 modified_fields.add(field_name)
         return modified_fields
 
+    @classmethod
+    def shard_for(cls, shard_value, shard_count):
+        """return the index of the shard that rows with shard_value in their
+        shard_key field live on, override this to route rows yourself
+
+        :param shard_value: mixed, the value of the shard_key field
+        :param shard_count: int, how many shards there are
+        :returns: int, between 0 and shard_count - 1
+        """
+        return zlib.crc32(String(shard_value).encode("utf-8")) % shard_count
+
     @classmethod
     def pool(cls, maxsize=0):
         """
@@ -244,6 +263,7 @@ class Orm(object):
         :param **fields_kwargs: dict, if you would like to pass the fields as key=val
         """
         self._interface_pk = None
+        self._interface_shard_value = None
         self._interface_hydrate = False
 
         fields = self.make_dict(fields, fields_kwargs)
@@ -324,6 +344,9 @@ class Orm(object):
 
         # this marks that this was repopulated from the interface (database)
         self._interface_pk = self.pk
+        if self.shard_key:
+            # the row stays on this value's shard until it is saved
+            self._interface_shard_value = getattr(self, self.shard_key)
 
     def to_interface(self):
         """Get all the fields that need to be saved
@@ -355,24 +378,40 @@ class Orm(object):
         """persist the field values of this orm"""
         ret = True
 
-        schema = self.schema
         fields = self.to_interface()
 
         q = self.query
         q.set(fields)
         pk = q.insert()
-        if pk:
-            fields = q.fields_set.fields
-            pk_name = schema.pk_name
-            if pk_name:
-                fields[pk_name] = pk
-                self.from_interface(fields)
+        if isinstance(pk, Future):
+            # the insert was queued in an interface pipeline, so we won't know
+            # the primary key until the pipeline is flushed
+            def callback(future):
+                if not future.cancelled() and not future.exception():
+                    self.insert_pk(q, future.result())
+            pk.add_done_callback(callback)
+
+        elif pk:
+            self.insert_pk(q, pk)
 
         else:
             ret = False
 
         return ret
 
+    def insert_pk(self, query, pk):
+        """called after .insert() has received the primary key of the new row
+        from the interface
+
+        :param query: Query, the query used to insert the fields
+        :param pk: mixed, the primary key of the new row
+        """
+        fields = query.fields_set.fields
+        pk_name = self.schema.pk_name
+        if pk_name:
+            fields[pk_name] = pk
+            self.from_interface(fields)
+
     def update(self):
         """re-persist the updated field values of this orm that has a primary key"""
         ret = True
@@ -383,11 +422,18 @@ class Orm(object):
 
         pk = self._interface_pk
         if pk:
-            q.is_field(self.schema.pk.name, pk)
+            self._where_pk(q, pk)
 
         else:
             raise ValueError("Cannot update an unhydrated orm instance")
 
+        if self.shard_key and getattr(self, self.shard_key) != self._interface_shard_value:
+            # the update would go to the new value's shard and the row is on
+            # the old value's shard
+            raise ValueError("Cannot change the shard key {} of a saved orm".format(
+                self.shard_key
+            ))
+
         if q.update():
             fields = q.fields_set.fields
             self.from_interface(fields)
@@ -420,13 +466,13 @@ class Orm(object):
         q = self.query
         pk = self._interface_pk
         if pk:
-            pk_name = self.schema.pk.name
-            self.query.is_field(pk_name, pk).delete()
+            self._where_pk(q, pk).delete()
 
             for field_name, field in self.schema.fields.items():
                 setattr(self, field_name, field.idel(self, getattr(self, field_name)))
 
             self._interface_pk = None
+            self._interface_shard_value = None
             self._interface_hydrate = False
 
             ret = True
@@ -439,7 +485,21 @@ class Orm(object):
         pk = self._interface_pk
         if not pk:
             raise ValueError("Unable to refetch orm via hydrated primary key")
-        return self.query.eq_pk(pk).one()
+        return self._where_pk(self.query, pk).one()
+
+    def _where_pk(self, query, pk):
+        """add the where clause that finds this orm's row to query, this is the
+        primary key and, if the orm is sharded, the shard key value the row was
+        saved with so the query only goes to the row's shard
+
+        :param query: Query
+        :param pk: mixed, the primary key
+        :returns: Query
+        """
+        query.is_field(self.schema.pk.name, pk)
+        if self.shard_key:
+            query.is_field(self.shard_key, self._interface_shard_value)
+        return query
 
     def is_modified(self, field_name=""):
         """true if a field, or any field, has been changed from its original value, false otherwise
@@ -559,3 +619,48 @@ class Orm(object):
         """install the Orm's table using the Orm's schema"""
         return cls.interface.set_table(cls.schema)
 
+
+
+def install_all(orm_classes):
+    """install the tables of all the orm_classes, creating referenced tables
+    before the tables that reference them
+
+    each interface gets all of its missing tables and indexes created in one
+    transaction (see Interface.set_tables())
+
+    :param orm_classes: list, the Orm children to install
+    :returns: list, the Schema instances whose tables were created
+    """
+    # topologically sort the schemas so foreign keys always point at a table
+    # that already exists
+    schemas = []
+    visiting = set()
+    visited = set()
+
+    def visit(schema):
+        table_name = str(schema)
+        if table_name in visited: return
+        if table_name in visiting:
+            raise ValueError("Foreign key cycle found at table {}".format(table_name))
+
+        visiting.add(table_name)
+        for field_name, field in schema.ref_fields.items():
+            ref_schema = field.schema
+            if str(ref_schema) != table_name:
+                visit(ref_schema)
+
+        visiting.discard(table_name)
+        visited.add(table_name)
+        schemas.append(schema)
+
+    for orm_class in orm_classes:
+        visit(orm_class.schema)
+
+    groups = {}
+    for schema in schemas:
+        groups.setdefault(schema.orm_class.interface, []).append(schema)
+
+    ret = []
+    for interface, group_schemas in groups.items():
+        ret.extend(interface.set_tables(group_schemas))
+    return ret
@@ -6,19 +6,24 @@ from __future__ import unicode_literals, division, print_function, absolute_impo
 import copy
 from collections import defaultdict, OrderedDict
 import datetime
+import functools
 import logging
 import os
 from contextlib import contextmanager
 import math
 import inspect
+import sys
 import time
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from decorators import deprecated
 from datatypes.collections import ListIterator
 
-from . import decorators
+from . import decorators, instrument
 from .utils import make_list, get_objects, make_dict, make_hash
+from .config import JoinSchema
 from .interface import get_interfaces
 from .compat import *
 
@@ -26,6 +31,197 @@ from .compat import *
 logger = logging.getLogger(__name__)
 
 
+class Row(dict):
+    """A row returned from an aggregate query (see Query.aggregate() and
+    Query.group_by()), the values can be accessed as keys or attributes"""
+    def __getattr__(self, k):
+        try:
+            return self[k]
+
+        except KeyError:
+            raise AttributeError(k)
+
+
+class Aggregate(object):
+    """An aggregate function of a field that the db computes, see Query.aggregate()"""
+    function_name = ""
+    """the SQL function (eg, SUM)"""
+
+    def __init__(self, field_name, distinct=False):
+        """
+        :param field_name: string, the field to aggregate
+        :param distinct: bool, True to only aggregate the distinct values
+        """
+        self.field_name = field_name
+        self.distinct = distinct
+
+    def __repr__(self):
+        return "{}({}{})".format(
+            self.function_name,
+            "DISTINCT " if self.distinct else "",
+            self.field_name
+        )
+
+
+class Count(Aggregate):
+    function_name = "COUNT"
+
+    def __init__(self, field_name="*", distinct=False):
+        super(Count, self).__init__(field_name, distinct=distinct)
+
+
+class Sum(Aggregate):
+    function_name = "SUM"
+
+
+class Avg(Aggregate):
+    function_name = "AVG"
+
+
+class Min(Aggregate):
+    function_name = "MIN"
+
+
+class Max(Aggregate):
+    function_name = "MAX"
+
+
+class Trunc(object):
+    """Truncate a datetime field to the start of its year, month, week (Monday),
+    day, hour, or minute so rows can be grouped into time buckets, see
+    Query.group_by()"""
+    units = set(["year", "month", "week", "day", "hour", "minute"])
+
+    def __init__(self, field_name, unit="day"):
+        """
+        :param field_name: string, a datetime field
+        :param unit: string, one of .units
+        """
+        if unit not in self.units:
+            raise ValueError("Unknown unit {}, must be one of {}".format(
+                unit,
+                ", ".join(sorted(self.units))
+            ))
+
+        self.field_name = field_name
+        self.unit = unit
+
+    def __repr__(self):
+        return "{}({}, {})".format(type(self).__name__, self.field_name, self.unit)
+
+
+class Join(object):
+    """A table that is joined to a query's table, see Query.join()"""
+    @property
+    def schema(self):
+        return self.orm_class.schema
+
+    def __init__(self, query, orm_class, on=None, name=None, left=False):
+        """
+        :param query: Query, the query orm_class is being joined to
+        :param orm_class: Orm, the joined orm
+        :param on: string, the query's field that holds orm_class's primary key,
+            defaults to the query's foreign key field that references orm_class
+        :param name: string, the name the joined instance will be set to on the
+            query's orm instances and the prefix of the joined fields (eg,
+            bar.name), defaults to on without _id or orm_class's lowercased name
+        :param left: bool, True for a LEFT JOIN so rows without a joined row
+            are still returned (their joined instance will be None)
+        """
+        schema = query.schema
+        if not schema:
+            raise ValueError("Query has no schema to join {} to".format(orm_class.__name__))
+
+        if on:
+            on = schema.field_name(on)
+
+        else:
+            for field_name, field in schema.fields.items():
+                if field.is_ref() and field.schema is orm_class.schema:
+                    on = field_name
+                    break
+
+            if not on:
+                raise ValueError("Did not find a foreign key reference for {} in {}".format(
+                    orm_class.__name__,
+                    schema,
+                ))
+
+        if not name:
+            name = on[:-3] if on.endswith("_id") else orm_class.__name__.lower()
+
+        if schema.has_field(name) or name in query.joins.names():
+            raise ValueError("Join name {} is already used in {}".format(name, schema))
+
+        self.orm_class = orm_class
+        self.on = on
+        self.name = name
+        self.left = left
+
+    def __repr__(self):
+        return "{}JOIN {} AS {} ON {}".format(
+            "LEFT " if self.left else "",
+            self.schema,
+            self.name,
+            self.on
+        )
+
+
+class Tree(object):
+    """The rows above or below a row in a tree of rows that reference their
+    parent row, see Query.descendants() and Query.ancestors()"""
+    def __init__(self, query, pk, via=None, max_depth=None, ancestors=False):
+        """
+        :param query: Query, the query whose rows make up the tree
+        :param pk: mixed, the primary key of the row to start at
+        :param via: string, the field that holds the parent row's primary key,
+            defaults to the query's foreign key field that references its own table
+        :param max_depth: int, how many levels to go, None for all of them
+        :param ancestors: bool, True to go up the tree instead of down
+        """
+        schema = query.schema
+        if not schema:
+            raise ValueError("Query has no schema to traverse")
+
+        if via:
+            via = schema.field_name(via)
+
+        else:
+            for field_name, field in schema.fields.items():
+                if field.is_ref() and field.schema is schema:
+                    via = field_name
+                    break
+
+            if not via:
+                raise ValueError("Did not find a foreign key reference to {} in {}".format(
+                    schema,
+                    schema,
+                ))
+
+        if max_depth is not None:
+            max_depth = int(max_depth)
+            if max_depth < 1:
+                raise ValueError("Max depth has to be at least 1")
+
+        self.pk = pk
+        self.via = via
+        self.max_depth = max_depth
+        self.ancestors = ancestors
+
+    def __repr__(self):
+        return "{}({}, via={}, max_depth={})".format(
+            "ancestors" if self.ancestors else "descendants",
+            self.pk,
+            self.via,
+            self.max_depth
+        )
+
+
+class Joins(list):
+    def names(self):
+        return [j.name for j in self]
+
+
 class Iterator(ListIterator):
     """The main iterator for all query methods that return iterators
 
@@ -76,6 +272,8 @@ class Iterator(ListIterator):
             self._cursor = cursor
             self._cursor_i = 0
             self.field_names = self.query.fields_select.names()
+            # set if the interface has observers, see prom.instrument
+            self._event = getattr(cursor, "event", None)
 
         return cursor
 
@@ -83,6 +281,9 @@ class Iterator(ListIterator):
         """put all the pieces together to build a generator of the results"""
         self._cursor = None
         self._cursor_i = 0
+        self._event = None
+        # how many rows the db returned, set once the cursor is exhausted
+        self._fetched = None
 
     def __iter__(self):
         self.reset()
@@ -103,14 +304,43 @@ class Iterator(ListIterator):
             if self._cursor_i == self.query.bounds.limit:
                 raise StopIteration()
 
-        o = self.hydrate(cursor_next())
-        self._cursor_i += 1
+        o = self._hydrate(self._fetch(cursor_next))
         while not self.ifilter(o):
-            o = self.hydrate(cursor_next())
-            self._cursor_i += 1
+            if self._event is not None:
+                self._event.filtered += 1
+            o = self._hydrate(self._fetch(cursor_next))
+        return o
+
+    def _fetch(self, cursor_next):
+        """return the next row from the cursor and keep track of how many rows
+        have been fetched"""
+        try:
+            d = cursor_next()
+
+        except StopIteration:
+            self._fetched = self._cursor_i
+            raise
+
+        self._cursor_i += 1
+        return d
+
+    def _hydrate(self, d):
+        """wrapper around .hydrate() that times it if the query is being observed"""
+        event = self._event
+        if event is None:
+            return self.hydrate(d)
+
+        start = time.perf_counter()
+        o = self.hydrate(d)
+        event.hydrate_time += time.perf_counter() - start
+        event.hydrated += 1
         return o
 
     def count(self):
+        if self._fetched is not None:
+            # every row has been fetched so there is no need to ask the db
+            return self._fetched
+
         cursor = self.cursor()
         count = cursor.rowcount
 
@@ -185,12 +415,40 @@ class Iterator(ListIterator):
         :param field_name: string, the field name you want the values of
         :returns: generator, the field_name values
         """
+        if self.query.is_aggregate():
+            # aggregate rows aren't selected by field
+            return (r[field_name] for r in self.copy())
+
         it = self.copy()
         it.query.fields_select.clear()
         it.query.select_field(field_name)
         return it
         #return (getattr(o, k) for o in self)
 
+    def partitions(self):
+        """group the rows by the values of the query's partition fields (see
+        Query.partition_by())
+
+        :returns: OrderedDict, the keys are the partition values (a tuple if there
+            is more than one partition field) in the order they were first seen,
+            the values are lists of the partition's rows in the order they were
+            returned
+        """
+        field_names = self.query.fields_partition.names()
+        if not field_names:
+            raise ValueError("Query is not partitioned")
+
+        ret = OrderedDict()
+        for o in self:
+            if isinstance(o, dict):
+                k = tuple(o[fn] for fn in field_names)
+            else:
+                k = tuple(getattr(o, fn) for fn in field_names)
+
+            ret.setdefault(k if len(k) > 1 else k[0], []).append(o)
+
+        return ret
+
     def __repr__(self):
         format_str = "[ ... {} ... ]"
         format_args = [self.__class__.__name__]
@@ -223,19 +481,62 @@ class Iterator(ListIterator):
             one field then just that value will be returned
         """
         r = None
-        if self.field_names:
+        if self.query.is_aggregate():
+            r = Row(d)
+
+        elif self.field_names:
             field_vals = [d.get(fn, None) for fn in self.field_names]
             r = field_vals if len(self.field_names) > 1 else field_vals[0]
 
         else:
             orm_class = self.orm_class
             if orm_class:
-                r = orm_class.hydrate(d)
+                if self.query.tree:
+                    d = dict(d)
+                    depth = d.pop("_depth", None)
+                    d.pop("_path", None)
+
+                if self.query.joins:
+                    r = self.hydrate_joins(d)
+                else:
+                    r = orm_class.hydrate(d)
+
+                if self.query.tree:
+                    r._depth = depth
+
             else:
                 r = d
 
         return r
 
+    def hydrate_joins(self, d):
+        """hydrate the query's orm and each joined orm from the same row, the
+        joined orms are set on the query's orm using their join names
+
+        :param d: dict, the joined fields are named <JOIN NAME>.<FIELD NAME>
+        :returns: Orm
+        """
+        fields = {}
+        joined_fields = defaultdict(dict)
+        for k, v in d.items():
+            join_name, _, field_name = k.rpartition(".")
+            if join_name:
+                joined_fields[join_name][field_name] = v
+            else:
+                fields[k] = v
+
+        o = self.orm_class.hydrate(fields)
+        for join in self.query.joins:
+            jfields = joined_fields.get(join.name, {})
+            # a LEFT JOIN without a matching row has a NULL primary key
+            if jfields.get(join.schema.pk_name, None) is None:
+                setattr(o, join.name, None)
+
+            else:
+                setattr(o, join.name, join.orm_class.hydrate(jfields))
+
+        return o
+
 
 class Bounds(object):
 
@@ -381,19 +682,26 @@ class Bounds(object):
 class Field(object):
     @property
     def schema(self):
-        return self.query.schema if self.query else None
+        return self.query.join_schema if self.query else None
 
     def __init__(self, query, field_name, field_val=None, **kwargs):
         self.query = query
         self.operator = kwargs.pop("operator", None)
         self.is_list = kwargs.pop("is_list", False)
         self.direction = kwargs.pop("direction", None) # 1 = ASC, -1 = DESC
+        # True if the name is an aggregate or group by alias instead of a field
+        self.is_alias = kwargs.pop("is_alias", False)
         self.kwargs = kwargs
 
         self.set_name(field_name)
         self.set_value(field_val)
 
     def set_name(self, field_name):
+        if self.is_alias:
+            self.function_name = ""
+            self.name = field_name
+            return
+
         field_name, function_name = self.parse(field_name, self.schema)
         self.function_name = function_name
         self.name = field_name
@@ -411,10 +719,16 @@ class Field(object):
 
         self.value = field_val
 
+    def is_empty_list(self):
+        """return True if this is an in or nin field without any values"""
+        if not self.is_list or self.kwargs or isinstance(self.value, Query):
+            return False
+        return not self.value
+
     def iquery(self, field_val):
         query = self.query
         schema = self.schema
-        if query and schema:
+        if query and schema and not self.is_alias:
             schema_field = getattr(schema, self.name)
             field_val = schema_field.iquery(query, field_val)
         return field_val
@@ -487,6 +801,11 @@ class Query(object):
     fields_select_class = Fields
     fields_where_class = Fields
     fields_sort_class = Fields
+    fields_group_class = Fields
+    fields_aggregate_class = Fields
+    fields_having_class = Fields
+    fields_partition_class = Fields
+    joins_class = Joins
     bounds_class = Bounds
     iterator_class = Iterator
 
@@ -515,6 +834,20 @@ class Query(object):
         if not self.orm_class: return None
         return self.orm_class.schema
 
+    @property
+    def join_schema(self):
+        """the schema with the fields of the joined tables (eg, bar.name) and
+        the _depth of a tree query, this is just .schema if the query doesn't
+        have any joins and isn't a tree query"""
+        schema = self.schema
+        if schema and (self.joins or self.tree):
+            schema = JoinSchema.get_instance(
+                schema,
+                [(j.name, j.schema) for j in self.joins],
+                [("_depth", int)] if self.tree else None
+            )
+        return schema
+
     @property
     def schemas(self):
         """Find and return all the schemas that are needed for this query to complete
@@ -529,6 +862,9 @@ class Query(object):
         if s:
             schemas.append(s)
 
+        for j in self.joins:
+            schemas.append(j.schema)
+
         for f in self.fields_where:
             if isinstance(f.value, Query):
                 s = f.value.schema
@@ -552,6 +888,12 @@ class Query(object):
         self.fields_select = self.fields_select_class()
         self.fields_where = self.fields_where_class()
         self.fields_sort = self.fields_sort_class()
+        self.fields_group = self.fields_group_class()
+        self.fields_aggregate = self.fields_aggregate_class()
+        self.fields_having = self.fields_having_class()
+        self.fields_partition = self.fields_partition_class()
+        self.joins = self.joins_class()
+        self.tree = None
         self.bounds = self.bounds_class()
 
     def ref(self, orm_classpath):
@@ -587,6 +929,7 @@ class Query(object):
         :example:
             self.gt_foo() # (<gt_field>, None, "foo")
             self.one_pk(value) # (<eq_field>, <one>, "pk")
+            self.having_gt_total() # (<gt_field> with having=True, None, "total")
 
         :returns: tuple, (<FIELD_METHOD>, <QUERY_METHOD>, <FIELD_NAME>)
         """
@@ -617,6 +960,10 @@ class Query(object):
                 field_method = self.in_field
                 query_method = getattr(self, name)
 
+            elif name == "having":
+                field_method, query_method, field_name = self.find_methods(field_name)
+                field_method = functools.partial(field_method, having=True)
+
             else:
                 query_method = None
                 field_method_name = "{}_field".format(name)
@@ -658,8 +1005,14 @@ class Query(object):
 
     def append_operation(self, operator, field_name, field_val=None, **kwargs):
         kwargs["operator"] = operator
-        f = self.create_field(field_name, field_val, **kwargs)
-        self.fields_where.append(f)
+        if kwargs.pop("having", False):
+            kwargs["is_alias"] = self.is_alias(field_name)
+            f = self.create_field(field_name, field_val, **kwargs)
+            self.fields_having.append(f)
+
+        else:
+            f = self.create_field(field_name, field_val, **kwargs)
+            self.fields_where.append(f)
         return self
 
     def append_sort(self, direction, field_name, field_val=None, **kwargs):
@@ -681,6 +1034,7 @@ class Query(object):
 
         kwargs["direction"] = direction
         kwargs["is_list"] = True
+        kwargs["is_alias"] = self.is_alias(field_name)
         f = self.create_field(field_name, field_val, **kwargs)
         self.fields_sort.append(f)
         return self
@@ -704,6 +1058,218 @@ class Query(object):
             self.select_field(field_name)
         return self
 
+    def aggregate(self, **aggregates):
+        """have the db compute aggregates instead of returning rows, the query
+        will then return Row instances with the aggregate values (and the group
+        by values) instead of Orm instances
+
+        :example:
+            r = Foo.query.is_status("paid").aggregate(total=Sum("amount"), n=Count()).one()
+            r.total, r.n
+
+            # the aggregate names can be used to sort and in having conditions
+            q = Foo.query.group_by("status").aggregate(n=Count()).having_gt_n(5).desc_n()
+            for r in q.get():
+                r.status, r.n
+
+        :param **aggregates: the names the values will have in the rows and the
+            Aggregate (eg, Count, Sum, Avg, Min, Max) to compute for each one
+        :returns: self, for fluid interface
+        """
+        for alias, aggregate in aggregates.items():
+            if not isinstance(aggregate, Aggregate):
+                raise TypeError("{} is not an Aggregate".format(alias))
+            self.fields_aggregate.append(self.create_field(alias, aggregate, is_alias=True))
+        return self
+
+    def group_by(self, *field_names, **buckets):
+        """group the rows by the values of fields and compute the aggregates
+        (see .aggregate()) for each group
+
+        :example:
+            # how many rows were created each day
+            q = Foo.query.group_by(day=Trunc("_created", "day")).aggregate(n=Count())
+            for r in q.asc_day().get():
+                r.day, r.n
+
+        :param *field_names: the fields to group by
+        :param **buckets: the names the values will have in the rows and the
+            Trunc time bucket to group by
+        :returns: self, for fluid interface
+        """
+        for field_name in make_list(field_names):
+            self.fields_group.append(self.create_field(field_name))
+
+        for alias, bucket in buckets.items():
+            if not isinstance(bucket, Trunc):
+                raise TypeError("{} is not a Trunc".format(alias))
+            self.fields_group.append(self.create_field(alias, bucket, is_alias=True))
+        return self
+
+    def descendants(self, pk, via=None, max_depth=None):
+        """only return the rows below the pk row in a tree of rows that reference
+        their parent row, the whole tree is walked in one query
+
+        :example:
+            class Node(Orm):
+                parent_id = Field("module.Node", False)
+
+            for n in Node.query.descendants(root.pk).asc__depth().get():
+                n._depth # 1 for the root's children, 2 for their children, etc.
+
+        each returned orm has the _depth it was found at, _depth can also be used
+        in where and sort methods like any other field. If the rows have a cycle
+        (a row is its own ancestor) the walk stops when it gets back to a row
+        it already went through, so it always finishes
+
+        :param pk: mixed, the primary key of the row at the top
+        :param via: string, the field that holds the parent's primary key,
+            defaults to the foreign key field that references this query's table
+        :param max_depth: int, how many levels down to go, None for all of them
+        :returns: self, for fluid interface
+        """
+        self.tree = Tree(self, pk, via=via, max_depth=max_depth)
+        return self
+
+    def ancestors(self, pk, via=None, max_depth=None):
+        """only return the rows above the pk row, its parent has a _depth of 1,
+        the parent's parent has a _depth of 2, and so on, see .descendants()
+
+        :param pk: mixed, the primary key of the row at the bottom
+        :param via: string, the field that holds the parent's primary key
+        :param max_depth: int, how many levels up to go, None for all of them
+        :returns: self, for fluid interface
+        """
+        self.tree = Tree(self, pk, via=via, max_depth=max_depth, ancestors=True)
+        return self
+
+    def partition_by(self, *field_names):
+        """split the rows into a partition for each value of field_names, used
+        with .limit_per_group() to get the first rows of every partition in
+        one query
+
+        :example:
+            # the 3 latest events of each user
+            q = Event.query.in_user_id(user_ids).partition_by("user_id").desc__created()
+            for user_id, events in q.limit_per_group(3).get().partitions().items():
+                pass
+
+        :param *field_names: the fields to partition by
+        :returns: self, for fluid interface
+        """
+        for field_name in make_list(field_names):
+            self.fields_partition.append(self.create_field(field_name))
+        return self
+
+    def limit_per_group(self, limit):
+        """only return the first limit rows (in this query's sort order) of each
+        partition, see .partition_by()
+
+        :param limit: int, how many rows of each partition to return
+        :returns: self, for fluid interface
+        """
+        limit = int(limit)
+        if limit < 1:
+            raise ValueError("Limit per group has to be at least 1")
+        self.fields_partition.options["limit"] = limit
+        return self
+
+    def is_aggregate(self):
+        """return True if this query returns aggregate rows instead of Orm rows"""
+        return bool(self.fields_aggregate or self.fields_group)
+
+    def is_empty(self):
+        """return True if the where clause can't match any rows, so the query
+        can be answered without asking the db
+
+        this only catches the obvious cases, an in with an empty list or two eqs
+        on the same field with different values
+
+        :returns: boolean
+        """
+        if self.fields_aggregate and not self.fields_group:
+            # an aggregate without groups always returns one row
+            return False
+
+        eqs = {}
+        schema = self.join_schema
+        for f in self.fields_where:
+            if f.kwargs or f.function_name or isinstance(f.value, Query):
+                continue
+
+            if f.operator == "in":
+                if f.is_empty_list():
+                    return True
+
+            elif f.operator == "eq":
+                if schema and not f.is_alias:
+                    schema_field = schema.fields.get(f.name)
+                    if schema_field and schema_field.options.get("ignore_case", False):
+                        # the db decides which values are equal
+                        continue
+
+                if f.name in eqs:
+                    v = eqs[f.name]
+                    if v is None or f.value is None:
+                        if v is not f.value:
+                            return True
+
+                    elif type(v) is type(f.value) and v != f.value:
+                        return True
+
+                else:
+                    eqs[f.name] = f.value
+
+        return False
+
+    def get_alias(self, field_name):
+        """return the Aggregate or Trunc that field_name is the name of, or None
+        if field_name isn't the name of an aggregate or time bucket"""
+        for fields in (self.fields_aggregate, self.fields_group):
+            for f in fields:
+                if f.is_alias and f.name == field_name:
+                    return f.value
+        return None
+
+    def is_alias(self, field_name):
+        return self.get_alias(field_name) is not None
+
+    def join(self, orm_class, on=None, name=None, left=False):
+        """join another orm's table to this query's table so each returned orm
+        has the joined orm from the same row set on it
+
+        :example:
+            class Bar(Orm):
+                name = Field(str)
+
+            class Foo(Orm):
+                bar_id = Field(Bar)
+
+            for foo in Foo.query.join(Bar).is_field("bar.name", "che").asc("bar.name").get():
+                foo.bar.name # "che", no extra query
+
+        the joined fields are named <JOIN NAME>.<FIELD NAME> and can be used
+        anywhere a field name can (eg, where, sort, select, and group by)
+
+        :param orm_class: string|type, the Orm class or its full python class path
+        :param on: string, the field of this query that holds orm_class's
+            primary key, defaults to the foreign key field that references orm_class
+        :param name: string, the name the joined orm is set to, defaults to on
+            without _id (eg, bar_id is joined as bar)
+        :param left: bool, True to return rows that don't have a joined row,
+            their joined orm is None
+        :returns: self, for fluid interface
+        """
+        if isinstance(orm_class, basestring):
+            orm_module, orm_class = get_objects(orm_class)
+
+        self.joins.append(Join(self, orm_class, on=on, name=name, left=left))
+        return self
+
+    def left_join(self, orm_class, on=None, name=None):
+        """see .join()"""
+        return self.join(orm_class, on=on, name=name, left=True)
+
     def set_field(self, field_name, field_val):
         """
         set a field into .fields_set attribute
@@ -733,9 +1299,9 @@ class Query(object):
     def ne_field(self, field_name, field_val, **field_kwargs):
         return self.not_field(field_name, field_val, **field_kwargs)
 
-    def between_field(self, field_name, low, high):
-        self.gte_field(field_name, low)
-        self.lte_field(field_name, high)
+    def between_field(self, field_name, low, high, **field_kwargs):
+        self.gte_field(field_name, low, **field_kwargs)
+        self.lte_field(field_name, high, **field_kwargs)
         return self
 
     def lte_field(self, field_name, field_val=None, **field_kwargs):
@@ -915,11 +1481,27 @@ class Query(object):
         return self.has()
 
     def insert(self):
-        """persist the .fields"""
+        """persist the .fields
+
+        if the interface has an open pipeline then this will return a Future
+        that will resolve to the primary key when the pipeline is flushed
+        """
+        pipeline = self.interface.get_pipeline()
+        if pipeline is not None:
+            return pipeline.insert(self.schema, self.fields_set.fields)
+
         return self.interface.insert(self.schema, self.fields_set.fields)
 
     def update(self):
-        """persist the .fields using .fields_where"""
+        """persist the .fields using .fields_where
+
+        if the interface has an open pipeline then this will return a Future
+        that will resolve to the updated row count when the pipeline is flushed
+        """
+        pipeline = self.interface.get_pipeline()
+        if pipeline is not None:
+            return pipeline.update(self.schema, self.fields_set.fields, self)
+
         return self.interface.update(
             self.schema,
             self.fields_set.fields,
@@ -927,7 +1509,15 @@ class Query(object):
         )
 
     def delete(self):
-        """remove fields matching the where criteria"""
+        """remove fields matching the where criteria
+
+        if the interface has an open pipeline then this will return a Future
+        that will resolve to the deleted row count when the pipeline is flushed
+        """
+        pipeline = self.interface.get_pipeline()
+        if pipeline is not None:
+            return pipeline.delete(self.schema, self)
+
         return self.execute('delete')
 
     def render(self, **kwargs):
@@ -938,6 +1528,19 @@ class Query(object):
         """
         return self.interface.render(self.schema, self, **kwargs)
 
+    def explain(self, analyze=False, buffers=False):
+        """Ask the db how it would run this query
+
+        unlike .render() the values are bound by the db driver, so this
+        explains exactly the query that .get() would run
+
+        :param analyze: bool, actually run the query so the plan has real row
+            counts and times (Postgres only)
+        :param buffers: bool, include buffer usage, needs analyze (Postgres only)
+        :returns: interface.base.Plan
+        """
+        return self.execute('explain', analyze=analyze, buffers=buffers)
+
     def raw(self, query_str, *query_args, **query_options):
         """
         use the interface.query() method to pass in your own raw query without
@@ -979,3 +1582,142 @@ class Query(object):
         ret = self.__unicode__()
         return ByteString(ret) if is_py2 else ret
 
+
+def use_greenlets():
+    """return True if gevent has patched threading, so gather() should spawn
+    greenlets instead of threads"""
+    monkey = sys.modules.get("gevent.monkey", None)
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def gather(*operations, **kwargs):
+    """run independent query operations at the same time, each one on its own
+    connection, so the total time is about the time of the slowest one instead
+    of the sum of all of them
+
+    :example:
+        foos, bar_count, che = prom.gather(
+            Foo.query.is_bar(1),
+            Bar.query.count,
+            Che.query.is_pk(5).one,
+        )
+
+    Operations are run on threads, or on greenlets if gevent has patched
+    threading, and no more of them run at once than the interfaces'
+    max_concurrency() allows. If an operation fails the operations that haven't
+    started yet are cancelled and the first error is raised
+
+    :param *operations: Query|method, a Query runs .get(), otherwise a method of
+        a Query that doesn't take any arguments (eg, query.count, query.one,
+        query.has). None of the operations can use an interface that has a
+        transaction open on this thread since they wouldn't run in the transaction
+    :param **kwargs:
+        max_workers -- int -- the most operations to run at the same time, this
+            defaults to the smallest max_concurrency() of the interfaces
+    :returns: list, the result of each operation in the same order as operations,
+        .get() results are fetched into a list since an Iterator would otherwise
+        run its query when it was iterated
+    """
+    calls = []
+    interfaces = []
+    for operation in operations:
+        if isinstance(operation, Query):
+            query = operation
+            method_name = "get"
+
+        else:
+            query = getattr(operation, "__self__", None)
+            if not isinstance(query, Query):
+                raise TypeError("{} is not a Query or a Query method".format(operation))
+            method_name = operation.__name__
+
+        interface = query.interface
+        if interface.in_transaction():
+            raise ValueError(
+                "Cannot gather {}.{}() because it wouldn't run in this thread's transaction".format(
+                    query.orm_class.__name__,
+                    method_name,
+                )
+            )
+
+        if interface not in interfaces:
+            interfaces.append(interface)
+
+        # every operation gets its own copy so operations on the same query
+        # don't change each other (eg, count() temporarily clears the bounds)
+        q = query.copy()
+        q.interface = interface
+        calls.append(getattr(q, method_name))
+
+    if not calls: return []
+
+    max_workers = kwargs.get("max_workers", 0)
+    if not max_workers:
+        max_workers = min(interface.max_concurrency() for interface in interfaces)
+    max_workers = min(int(max_workers), len(calls))
+
+    def run(call):
+        ret = call()
+        if isinstance(ret, Iterator):
+            ret = list(ret)
+        return ret
+
+    if max_workers <= 1:
+        return [run(call) for call in calls]
+
+    context = instrument.current_context()
+    results = [None] * len(calls)
+    errors = []
+    pending = iter(enumerate(calls))
+    lock = threading.Lock()
+    done = threading.Event()
+    running = [max_workers]
+
+    def work():
+        try:
+            with instrument.use_context(context):
+                while True:
+                    with lock:
+                        item = None if errors else next(pending, None)
+                    if item is None: break
+
+                    i, call = item
+                    try:
+                        results[i] = run(call)
+
+                    except Exception:
+                        with lock:
+                            errors.append(sys.exc_info())
+                        # the caller doesn't have to wait for the other workers
+                        done.set()
+                        break
+
+        finally:
+            with lock:
+                running[0] -= 1
+                if not running[0]:
+                    done.set()
+
+    if use_greenlets():
+        import gevent
+        for _ in range(max_workers):
+            gevent.spawn(work)
+        done.wait()
+
+    else:
+        executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="prom-gather",
+        )
+        try:
+            for _ in range(max_workers):
+                executor.submit(work)
+            done.wait()
+
+        finally:
+            executor.shutdown(wait=False)
+
+    if errors:
+        reraise(*errors[0])
+
+    return results
@@ -153,3 +153,54 @@ def make_hash(*mixed):
     # http://stackoverflow.com/questions/5297448/how-to-get-md5-sum-of-a-string
     return String(s).md5()
 
+
+class SortKey(object):
+    """Wraps the sort values of a row so rows can be compared using a different
+    direction for each value
+
+    None sorts after every other value when ascending (like Postgres), or before
+    every other value if nulls_first is True (like SQLite)
+    """
+    __slots__ = ["values", "directions", "nulls_first"]
+
+    def __init__(self, values, directions, nulls_first=False):
+        """
+        :param values: tuple, the sort values of the row
+        :param directions: tuple, 1 for ascending or -1 for descending for each value
+        :param nulls_first: boolean, True if None is less than everything
+        """
+        self.values = values
+        self.directions = directions
+        self.nulls_first = nulls_first
+
+    def __lt__(self, other):
+        for v1, v2, direction in zip(self.values, other.values, self.directions):
+            if v1 == v2: continue
+
+            if v1 is None:
+                lt = self.nulls_first
+            elif v2 is None:
+                lt = not self.nulls_first
+            else:
+                lt = v1 < v2
+            return lt if direction > 0 else not lt
+
+        return False
+
+
+def merge_sorted(iterables, key=None, directions=None, nulls_first=False):
+    """k-way merge of iterables that are each already sorted into one sorted
+    iterator, only one value from each iterable is held in memory at a time
+
+    :param iterables: list, the sorted iterables
+    :param key: callable, returns a tuple of the sort values of a value
+    :param directions: tuple, 1 for ascending or -1 for descending for each sort
+        value, defaults to all ascending
+    :param nulls_first: boolean, True if None sorts before everything else
+    :returns: generator
+    """
+    if key and directions:
+        sort_key = lambda v: SortKey(key(v), directions, nulls_first)
+    else:
+        sort_key = key
+    return heapq.merge(*iterables, key=sort_key)
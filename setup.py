@@ -52,7 +52,7 @@ def read(path):
 
 vpath = os.path.join(name, "__init__.py")
 if os.path.isfile(vpath):
-    kwargs["packages"] = find_packages(exclude=["tests", "tests.*", "*_test*", "example*"])
+    kwargs["packages"] = find_packages(exclude=["tests", "tests.*", "*_test*", "example*", "benchmarks", "benchmarks.*"])
 
     dpath = os.path.join(name, "data")
     if os.path.isdir(dpath):
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import time
+
+from . import BaseTestCase, EnvironTestCase
+from prom.compat import *
+from prom.bench.load import parse_mix, is_lock_error, Load, Worker, Keys
+
+
+class LoadTest(EnvironTestCase):
+    def test_parse_mix(self):
+        mix = parse_mix("get=40, one=30,save")
+        self.assertEqual([("get", 40.0), ("one", 30.0), ("save", 1.0)], mix)
+
+        with self.assertRaises(ValueError):
+            parse_mix("get=40,nope=10")
+
+        with self.assertRaises(ValueError):
+            parse_mix("get=0")
+
+    def test_is_lock_error(self):
+        self.assertTrue(is_lock_error(ValueError("database is locked")))
+        self.assertTrue(is_lock_error(ValueError("deadlock detected")))
+        self.assertFalse(is_lock_error(ValueError("no such table")))
+
+    def test_worker_errors(self):
+        # without an orm class every operation fails
+        w = Worker(None, Keys([]), parse_mix("count=1"), seed=0)
+        w.run(time.time() + 0.1)
+        self.assertLess(0, w.errors["count"])
+        self.assertEqual(0, w.latency["count"].count)
+        self.assertEqual({"AttributeError": w.errors["count"]}, dict(w.error_classes))
+
+    def test_run(self):
+        i = self.get_interface()
+        load = Load(i, workers=2, duration=0.5, rows=10, mix="get=1,one=1,count=1,save=1,delete=1")
+        try:
+            report = load.run()
+
+        finally:
+            load.teardown()
+
+        self.assertLess(0, report["ops"])
+        self.assertEqual(0, report["errors"])
+        self.assertEqual({}, report["error_classes"])
+        self.assertEqual(2, report["workers"])
+        for op, r in report["operations"].items():
+            self.assertLess(0, r["count"])
+            self.assertLessEqual(r["p50"], r["p999"])
+        self.assertLess(0, report["pool_wait"]["count"])
+        self.assertFalse(i.has_table(load.orm_class.table_name))
+
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import threading
+from io import StringIO
+
+from . import BaseTestCase, EnvironTestCase
+from prom.compat import *
+from prom.instrument import (
+    fingerprint,
+    Histogram,
+    Observer,
+    MetricsRegistry,
+    SlowQueryLog,
+    Profile,
+    call_site,
+    detect_n_plus_one,
+    assert_max_queries,
+)
+from prom.exception import NPlusOneError
+
+
+class FingerprintTest(BaseTestCase):
+    def test_literals(self):
+        fp1 = fingerprint("SELECT * FROM foo WHERE bar = 'one' AND che = 10")
+        fp2 = fingerprint("SELECT *\n  FROM foo\n  WHERE bar = 'two''s' AND che = 2.5")
+        self.assertEqual(fp1, fp2)
+        self.assertEqual("SELECT * FROM foo WHERE bar = ? AND che = ?", fp1)
+
+    def test_in_list(self):
+        fp1 = fingerprint("SELECT * FROM foo WHERE bar IN (%s, %s, %s)")
+        fp2 = fingerprint("SELECT * FROM foo WHERE bar IN (?)")
+        self.assertEqual(fp1, fp2)
+
+    def test_comments(self):
+        fp1 = fingerprint("SELECT * FROM foo WHERE bar = %s /* op=get,request_id=1 */")
+        fp2 = fingerprint("SELECT * FROM foo WHERE bar = %s /* op=get,request_id=2 */")
+        self.assertEqual(fp1, fp2)
+        self.assertEqual("SELECT * FROM foo WHERE bar = ?", fp1)
+
+    def test_identifiers(self):
+        fp = fingerprint('SELECT "foo_1"::text FROM table_2 WHERE "_id" = %s')
+        self.assertEqual('SELECT "foo_1"::text FROM table_2 WHERE "_id" = ?', fp)
+
+
+class HistogramTest(BaseTestCase):
+    def test_percentile(self):
+        h = Histogram()
+        self.assertEqual(0.0, h.percentile(50))
+
+        for v in range(1, 1001):
+            h.record(v / 1000.0)
+
+        self.assertEqual(1000, h.count)
+        self.assertAlmostEqual(0.5, h.percentile(50), delta=0.5 * 0.05)
+        self.assertAlmostEqual(0.99, h.percentile(99), delta=0.99 * 0.05)
+        self.assertEqual(1.0, h.percentile(100))
+        self.assertEqual(0.001, h.min)
+
+    def test_jsonable(self):
+        h = Histogram()
+        h.record(0.1)
+        d = h.jsonable()
+        self.assertEqual(1, d["count"])
+        self.assertEqual(0.1, d["p99"])
+
+
+class ObserverTest(EnvironTestCase):
+    def test_query_events(self):
+        events = []
+        class Collector(Observer):
+            def query_end(self, event):
+                events.append(event)
+
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+
+        i = orm_class.interface
+        observer = Collector()
+        i.add_observer(observer)
+
+        # list() would also run a count query to get the length
+        orms = [o for o in orm_class.query.is_foo(None).get()]
+        self.assertEqual(1, len(events))
+        self.assertEqual("SELECT", events[0].operation)
+        self.assertEqual(0, events[0].rowcount)
+
+        orms = [o for o in orm_class.query.get()]
+        self.assertEqual(2, len(events))
+        e = events[1]
+        self.assertEqual(5, e.rowcount)
+        self.assertEqual(5, e.hydrated)
+        self.assertLess(0.0, e.build_time)
+        self.assertLess(0.0, e.execute_time)
+        self.assertLess(0.0, e.hydrate_time)
+        self.assertEqual(str(orm_class.schema), str(e.schema))
+
+        orm_class.query.count()
+        self.assertEqual(3, len(events))
+
+        i.remove_observer(observer)
+        orm_class.query.count()
+        self.assertEqual(3, len(events))
+
+    def test_query_error(self):
+        events = []
+        class Collector(Observer):
+            def query_end(self, event):
+                events.append(event)
+
+        i = self.get_interface()
+        i.add_observer(Collector())
+        with self.assertRaises(Exception):
+            i.query("SELECT * FROM this_table_does_not_exist")
+
+        self.assertEqual(1, len(events))
+        self.assertIsNotNone(events[0].error)
+
+    def test_metrics_registry(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+
+        metrics = MetricsRegistry()
+        orm_class.interface.add_observer(metrics)
+
+        for pk in range(1, 4):
+            orm_class.query.is_pk(pk).one()
+        # list() would also run a count query to get the length
+        [o for o in orm_class.query.in_pk([1, 2, 3]).get()]
+        [o for o in orm_class.query.in_pk([1, 2]).get()]
+
+        stats = metrics.top(10, key="count")
+        self.assertEqual(2, len(stats))
+        self.assertEqual(3, stats[0].count)
+        self.assertEqual(2, stats[1].count)
+        self.assertEqual(3, stats[0].hydrated)
+        self.assertEqual(5, stats[1].rows)
+        self.assertEqual(8, metrics.rows_hydrated)
+
+        d = metrics.jsonable()
+        self.assertEqual(2, len(d["queries"]))
+        self.assertLess(0, d["queries"][0]["latency"]["p50"])
+
+    def test_slow_query_log(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 1)
+
+        slow = SlowQueryLog(threshold=0.0)
+        orm_class.interface.add_observer(slow)
+        orm_class.query.one()
+        self.assertEqual(1, len(slow.entries))
+
+        slow.threshold = 100.0
+        orm_class.query.one()
+        self.assertEqual(1, len(slow.entries))
+
+    def test_slow_query_threshold_option(self):
+        i = self.create_interface()
+        i.connection_config.options["slow_query_threshold"] = "0.5"
+        i.connect()
+        self.assertEqual(0.5, i.slow_query_log.threshold)
+        self.assertEqual(1, len(i.observers))
+
+        # reconnecting doesn't add another one
+        i.close()
+        i.connect()
+        self.assertEqual(1, len(i.observers))
+
+
+class ProfileTest(EnvironTestCase):
+    def test_call_site(self):
+        module, lineno, function = call_site()
+        self.assertEqual(__name__, module)
+        self.assertEqual("test_call_site", function)
+
+    def test_profile(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+        i = orm_class.interface
+
+        with Profile(i) as p:
+            for pk in range(1, 4):
+                orm_class.query.is_pk(pk).one()
+            # list() would also run a count query to get the length
+            orms = [o for o in orm_class.query.ifilter(lambda o: o.pk > 2).get()]
+            self.assertEqual(3, len(orms))
+
+        self.assertFalse(p in i.observers)
+
+        entries = p.summary(key="count")
+        self.assertEqual(2, len(entries))
+        self.assertEqual(3, entries[0].count)
+        self.assertEqual(__name__, entries[0].site[0])
+        self.assertEqual("test_profile", entries[0].site[2])
+        self.assertEqual(5, entries[1].rows)
+        self.assertEqual(5, entries[1].hydrated)
+        self.assertEqual(2, entries[1].filtered)
+        self.assertLess(0.0, entries[1].hydrate_time)
+
+        r = p.rollup()
+        self.assertEqual(4, r["queries"])
+        self.assertEqual(8, r["hydrated"])
+        self.assertEqual(2, r["filtered"])
+        self.assertLessEqual(r["total_time"], r["seconds"])
+
+        # queries after the block aren't recorded
+        orm_class.query.one()
+        self.assertEqual(4, p.rollup()["queries"])
+
+        out = StringIO()
+        p.print_summary(stream=out)
+        self.assertTrue("test_profile" in out.getvalue())
+
+    def test_profile_other_thread(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 1)
+
+        with Profile(orm_class.interface, trace_memory=False) as p:
+            t = threading.Thread(target=orm_class.query.one)
+            t.start()
+            t.join()
+
+        self.assertEqual(0, p.rollup()["queries"])
+        self.assertEqual(0, p.rollup()["allocated"])
+
+
+class NPlusOneTest(EnvironTestCase):
+    def test_detect(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+        i = orm_class.interface
+
+        with detect_n_plus_one(i, threshold=3) as d:
+            # the same values over and over isn't an N+1
+            for _ in range(5):
+                orm_class.query.is_pk(1).one()
+            self.assertEqual(0, len(d.detections))
+
+            for pk in range(1, 6):
+                orm_class.query.is_pk(pk).one()
+
+        self.assertEqual(1, len(d.detections))
+        e = d.detections[0]
+        self.assertEqual("test_detect", e.site[2])
+        self.assertEqual(orm_class, e.query.orm_class)
+        self.assertTrue(orm_class.__name__ in String(e))
+
+    def test_strict(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+        i = orm_class.interface
+
+        d = detect_n_plus_one(i, threshold=2, strict=True)
+        with self.assertRaises(NPlusOneError):
+            with d:
+                for pk in range(1, 6):
+                    orm_class.query.is_pk(pk).one()
+
+        self.assertEqual(1, len(d.detections))
+        self.assertFalse(d in i.observers)
+
+    def test_assert_max_queries(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 2)
+        i = orm_class.interface
+
+        with assert_max_queries(2, i) as counter:
+            # list() would also run a count query to get the length
+            it = orm_class.query.get()
+            orms = [o for o in it]
+            # the length of an exhausted iterator doesn't need a query
+            self.assertEqual(2, len(it))
+        self.assertEqual(1, counter.count)
+
+        with self.assertRaises(AssertionError):
+            with assert_max_queries(1, i):
+                orm_class.query.is_pk(1).one()
+                orm_class.query.is_pk(2).one()
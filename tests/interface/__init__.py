@@ -46,6 +46,119 @@ class BaseTestInterface(BaseTestCase):
                 with i.transaction():
                     raise RuntimeError()
 
+    def test_transaction_name(self):
+        i = self.get_interface()
+        with i.connection() as connection:
+            names = set(connection.transaction_name() for _ in range(100))
+        self.assertEqual(100, len(names))
+
+    def test_transaction_read_savepoints(self):
+        i, s = self.get_table()
+        pk = self.insert(i, s, 1)[0]
+
+        i.connection_config.options["savepoint_reads"] = 0
+        with i.transaction() as connection:
+            names = []
+            transaction_started = connection._transaction_started
+            def _transaction_started(name):
+                names.append(name)
+                return transaction_started(name)
+            connection._transaction_started = _transaction_started
+
+            self.assertEqual(1, i.count(s, connection=connection))
+            self.assertEqual(
+                pk,
+                i.get_one(s, query.Query().is__id(pk), connection=connection)["_id"]
+            )
+            self.assertEqual([], names)
+
+            connection._transaction_started = transaction_started
+
+        i.connection_config.options["savepoint_reads"] = 1
+        with i.transaction() as connection:
+            names = []
+            transaction_started = connection._transaction_started
+            def _transaction_started(name):
+                names.append(name)
+                return transaction_started(name)
+            connection._transaction_started = _transaction_started
+
+            self.assertEqual(1, connection.transaction_count)
+            self.assertEqual(1, i.count(s, connection=connection))
+            self.assertEqual(1, len(names))
+
+            connection._transaction_started = transaction_started
+
+    def test_elide_transactions(self):
+        i, s = self.get_table()
+        i.connection_config.options["elide_transactions"] = 1
+
+        with i.connection() as connection:
+            begins = []
+            transaction_start = connection._transaction_start
+            def _transaction_start():
+                begins.append(1)
+                return transaction_start()
+            connection._transaction_start = _transaction_start
+
+            pk = i.insert(s, {"foo": 1, "bar": "1"}, connection=connection)
+            q = query.Query().is__id(pk)
+            self.assertEqual(1, i.update(s, {"foo": 2}, q, connection=connection))
+            self.assertEqual(1, i.delete(s, q, connection=connection))
+            self.assertEqual([], begins)
+
+            # inside a transaction the writes still get their savepoints
+            with i.transaction(connection=connection):
+                i.insert(s, {"foo": 3, "bar": "3"}, connection=connection)
+            self.assertEqual([1], begins)
+
+            connection._transaction_start = transaction_start
+
+    def test_elide_transactions_table_recovery(self):
+        i = self.get_interface()
+        s = self.get_schema()
+        i.connection_config.options["elide_transactions"] = 1
+
+        pk = i.insert(s, {"foo": 1, "bar": "1"})
+        self.assertTrue(pk)
+        self.assertEqual(1, i.count(s))
+
+    def test_tag_queries(self):
+        from prom.instrument import Observer, fingerprint
+
+        i, s = self.get_table()
+        pk = self.insert(i, s, 1)[0]
+
+        events = []
+        class Collector(Observer):
+            def query_start(self, event):
+                events.append(event)
+        i.add_observer(Collector())
+
+        i.connection_config.options["tag_queries"] = 1
+        with prom.tag_queries(request_id="abc 123*/"):
+            self.assertEqual(pk, i.get_one(s, query.Query().is__id(pk))["_id"])
+        query_str = events[-1].query_str
+        self.assertTrue("op=get_one" in query_str)
+        self.assertTrue("site={}:".format(__name__) in query_str)
+        self.assertTrue("request_id=abc_123_" in query_str)
+        self.assertEqual(1, query_str.count("*/"))
+
+        with prom.tag_queries(request_id="def"):
+            i.get_one(s, query.Query().is__id(pk))
+        self.assertEqual(fingerprint(query_str), events[-1].fingerprint)
+
+        i.connection_config.options["tag_queries"] = "static"
+        with prom.tag_queries(request_id="abc"):
+            self.assertEqual(1, i.count(s))
+        query_str = events[-1].query_str
+        self.assertTrue("op=count" in query_str)
+        self.assertFalse("request_id" in query_str)
+
+        i.connection_config.options["tag_queries"] = 0
+        i.count(s)
+        self.assertFalse("/*" in events[-1].query_str)
+
     def test_set_table(self):
         i = self.get_interface()
         s = self.get_schema()
@@ -113,6 +226,61 @@ class BaseTestInterface(BaseTestCase):
         r = i.get_tables(str(s))
         self.assertTrue(str(s) in r)
 
+    def test_set_tables(self):
+        i = self.get_interface()
+        s1 = self.get_schema()
+        s2 = self.get_schema(
+            one=Field(int, True),
+            s1_id=Field(s1, False),
+            ione=Index("one", unique=True),
+        )
+
+        r = i.set_tables([s1, s2])
+        self.assertEqual([s1, s2], r)
+        self.assertTrue(i.has_table(s1))
+        self.assertTrue(i.has_table(s2))
+        self.assertEqual(["one"], list(i.get_indexes(s2).values())[0])
+
+        # tables that already exist are skipped
+        r = i.set_tables([s1, s2])
+        self.assertEqual([], r)
+
+    def test_schema_cache(self):
+        i, s = self.get_table()
+
+        cache = i.get_schema_cache()
+        self.assertTrue(s in cache)
+        self.assertEqual(set(s.fields.keys()), cache.get_fields(s))
+
+        # tables created somewhere else are found even though the cache was
+        # already loaded
+        s2 = self.get_schema()
+        i2 = self.create_interface()
+        i2.set_table(s2)
+        self.assertFalse(s2 in cache)
+        self.assertTrue(i.has_table(s2))
+        self.assertTrue(s2 in cache)
+
+        i.delete_table(s)
+        self.assertFalse(s in cache)
+        self.assertFalse(i.has_table(s))
+
+        # tables dropped somewhere else are found to be gone
+        i2._delete_table(s2)
+        self.assertTrue(s2 in cache)
+        self.assertFalse(i.has_table(s2))
+        self.assertFalse(s2 in cache)
+
+    def test__get_catalog(self):
+        i, s = self.get_table()
+        catalog = i._get_catalog()
+        self.assertTrue(str(s) in catalog)
+        self.assertEqual(set(s.fields.keys()), set(catalog[str(s)]["fields"]))
+        self.assertEqual(
+            sorted(i.get_indexes(s).values()),
+            sorted(catalog[str(s)]["indexes"].values())
+        )
+
     def test_query_modified_table(self):
         i = self.get_interface()
         s = prom.Schema(
@@ -344,14 +512,16 @@ class BaseTestInterface(BaseTestCase):
         q.in__id(range(1, 5))
         sql, sql_args = i.get_SQL(s, q)
         self.assertTrue('_id' in sql)
-        self.assertEqual(4, len(sql_args))
+        # some interfaces bind the list as one value
+        in_args_count = len(sql_args)
+        self.assertLess(0, in_args_count)
 
         q.gt_foo(5)
 
         sql, sql_args = i.get_SQL(s, q)
         self.assertTrue('foo' in sql)
         self.assertTrue('AND' in sql)
-        self.assertEqual(5, len(sql_args))
+        self.assertEqual(in_args_count + 1, len(sql_args))
 
         q.asc_foo().desc_bar()
         sql, sql_args = i.get_SQL(s, q)
@@ -1150,6 +1320,97 @@ class BaseTestInterface(BaseTestCase):
         self.assertEqual(text, d["group"])
         self.assertEqual(pk, d["_id"])
 
+    def test_execute_batch(self):
+        i, s = self.get_table()
+        insert_sql = 'INSERT INTO {} ("foo", "bar") VALUES ({}, {})'.format(
+            s,
+            i.val_placeholder,
+            i.val_placeholder,
+        )
+        update_sql = 'UPDATE {} SET "bar" = {} WHERE "foo" = {}'.format(
+            s,
+            i.val_placeholder,
+            i.val_placeholder,
+        )
+
+        r = i.execute_batch([
+            (insert_sql, [1, "one"], {"ignore_result": True}),
+            (insert_sql, [2, "two"], {"ignore_result": True}),
+            (insert_sql, [3, "three"], {"ignore_result": True}),
+            (update_sql, ["four", 3], {"count_result": True}),
+        ])
+        self.assertEqual(4, len(r))
+        self.assertEqual(1, r[3])
+        self.assertEqual(3, i.count(s, query.Query()))
+        self.assertEqual(1, i.count(s, query.Query().is_bar("four")))
+
+    def test_pipeline(self):
+        i, s = self.get_table()
+
+        with i.pipeline() as p:
+            p.insert(s, {"foo": 1, "bar": "one"})
+            p.insert(s, {"foo": 2, "bar": "two"})
+            f = p.update(s, {"bar": "three"}, query.Query().is_foo(2))
+            self.assertEqual(0, i.count(s, query.Query()))
+            self.assertFalse(f.done())
+
+        self.assertEqual(1, f.result())
+        self.assertEqual(2, i.count(s, query.Query()))
+        self.assertEqual(1, i.count(s, query.Query().is_bar("three")))
+
+        # an error should rollback every queued operation
+        with self.assertRaises(InterfaceError):
+            with i.pipeline() as p:
+                f1 = p.insert(s, {"foo": 3, "bar": "three"})
+                f2 = p.insert(s, {"foo": None, "bar": "four"})
+
+        self.assertIsNotNone(f1.exception())
+        self.assertEqual(2, i.count(s, query.Query()))
+
+    def test_pipeline_table_recovery(self):
+        i = self.get_interface()
+        s = self.get_schema()
+
+        with i.pipeline() as p:
+            f1 = p.insert(s, {"foo": 1, "bar": "one"})
+            f2 = p.insert(s, {"foo": 2, "bar": "two"})
+
+        self.assertLess(0, f1.result())
+        self.assertLess(f1.result(), f2.result())
+
+    def test_batch_observed(self):
+        from prom.instrument import Observer
+
+        i, s = self.get_table()
+        events = []
+        class Collector(Observer):
+            def query_end(self, event):
+                events.append(event)
+        i.add_observer(Collector())
+        i.connection_config.options["tag_queries"] = 1
+
+        with prom.tag_queries(request_id="abc"):
+            with i.pipeline() as p:
+                for foo in range(3):
+                    p.insert(s, {"foo": foo, "bar": str(foo)})
+
+            insert_sql = 'INSERT INTO {} ("foo", "bar") VALUES ({}, {})'.format(
+                s,
+                i.val_placeholder,
+                i.val_placeholder,
+            )
+            i.execute_batch([
+                (insert_sql, [foo, str(foo)], {"ignore_result": True}) for foo in range(3, 6)
+            ])
+
+        # however the interface batches the statements, every one is observed
+        events = [e for e in events if e.operation == "INSERT"]
+        self.assertLessEqual(2, len(events))
+        for e in events:
+            self.assertTrue("op=insert" in e.query_str)
+            self.assertTrue("request_id=abc" in e.query_str)
+            self.assertIsNone(e.error)
+
 #     def test_size_error(self):
 #         """This does fail but I'm not sure if it is an interface problem, meaning
 #         I should fix it by registering an adapter/converter for byte strings to be
@@ -143,6 +143,105 @@ class InterfacePostgresTest(BaseTestInterface):
         with self.assertRaises(KeyError):
             fstr, fargs = orm_class.query.in_ts(bogus=5).render(placeholder=True)
 
+    def test__normalize_list_SQL(self):
+        i, s = self.get_table()
+        _ids = self.insert(i, s, 5)
+
+        q = query.Query().in__id(_ids[:3])
+        fstr, fargs = i.render(s, q, placeholder=True)
+        self.assertTrue('"_id" = ANY(%s::BIGINT[])' in fstr)
+        self.assertEqual([_ids[:3]], fargs)
+        self.assertEqual(3, i.count(s, q))
+
+        q = query.Query().nin__id(_ids[:3])
+        fstr, fargs = i.render(s, q, placeholder=True)
+        self.assertTrue('"_id" <> ALL(%s::BIGINT[])' in fstr)
+        self.assertEqual(2, i.count(s, q))
+
+        # strings (eg, from request params) are cast to the field's type
+        q = query.Query().in__id([String(_id) for _id in _ids[:2]])
+        self.assertEqual(2, i.count(s, q))
+
+        # psycopg can't type an array of only NULLs so these stay a list
+        q = query.Query().in_bar(["1", None])
+        fstr, fargs = i.render(s, q, placeholder=True)
+        self.assertTrue('"bar" IN (%s, %s)' in fstr)
+
+        i, s = self.get_table(d=Field(datetime.datetime, True))
+        for day in range(1, 4):
+            i.insert(s, {"d": datetime.datetime(2020, 1, day)})
+        q = query.Query().in_d(["2020-01-01 00:00:00", "2020-01-02 00:00:00"])
+        self.assertEqual(2, i.count(s, q))
+        q = query.Query().nin_d(["2020-01-01 00:00:00"])
+        self.assertEqual(2, i.count(s, q))
+
+    def test_transaction_read_table_error(self):
+        """a failed read without a savepoint aborts the Postgres transaction so
+        it can't be recovered"""
+        i = self.get_interface()
+        s = self.get_schema()
+        i.connection_config.options["savepoint_reads"] = 0
+
+        with self.assertRaises(prom.InterfaceError):
+            with i.transaction() as connection:
+                # the read has to run on the transaction's connection, the pool
+                # would hand a new read its own connection
+                i.count(s, connection=connection)
+        self.assertFalse(i.has_table(s))
+
+    def test_explain(self):
+        i, s = self.get_table()
+        self.insert(i, s, 5)
+
+        q = query.Query().is_foo(1)
+        plan = i.explain(s, q)
+        self.assertLess(0, plan.rows)
+        self.assertLess(0.0, plan.cost)
+        self.assertIsNone(plan.nodes[0].actual_rows)
+
+        plan = i.explain(s, q, analyze=True, buffers=True)
+        self.assertIsNotNone(plan.nodes[0].actual_rows)
+        self.assertTrue("Shared Hit Blocks" in plan.nodes[0].detail)
+
+        q = query.Query().asc_bar()
+        plan = i.explain(s, q)
+        self.assertTrue(plan.has_sort())
+
+        # 5 rows is too small for postgres to bother with the index on its own
+        with i.transaction() as connection:
+            i.query("SET LOCAL enable_seqscan = off", ignore_result=True, connection=connection)
+            plan = i.explain(s, query.Query().is_foo(1), connection=connection)
+            self.assertTrue(plan.uses_index("ifoobar"))
+            self.assertFalse(plan.has_seq_scan())
+
+    def test_bytes_text(self):
+        i, s = self.get_table()
+
+        pk = i.insert(s, {"foo": 1, "bar": b"bytes value"})
+        d = i.get_one(s, Query().is__id(pk))
+        self.assertEqual("bytes value", d["bar"])
+
+        # text that just happens to look like hex shouldn't be touched
+        pk = i.insert(s, {"foo": 2, "bar": "\\x666f6f"})
+        d = i.get_one(s, Query().is__id(pk))
+        self.assertEqual("\\x666f6f", d["bar"])
+
+    def test_decode_hex_text(self):
+        i, s = self.get_table()
+        i.query(
+            "INSERT INTO {} (foo, bar) VALUES (1, %s::bytea::text)".format(s),
+            b"legacy value",
+            ignore_result=True
+        )
+
+        d = i.get_one(s, Query().is_foo(1))
+        self.assertTrue(d["bar"].startswith("\\x"))
+
+        i.close()
+        i.connection_config.options["decode_hex_text"] = 1
+        d = i.get_one(s, Query().is_foo(1))
+        self.assertEqual("legacy value", d["bar"])
+
     def test_no_db_error(self):
         # we want to replace the db with a bogus db error
         i, s = self.get_table()
@@ -157,6 +256,113 @@ class InterfacePostgresTest(BaseTestInterface):
             rd = i.insert(s, fields)
 
 
+class InterfacePostgresPoolTest(InterfacePostgresTest):
+    @classmethod
+    def create_interface(cls):
+        orig_url = os.environ["PROM_POSTGRES_DSN"]
+        query_str = '?pool_minconn=1&pool_maxconn=3&pool_timeout=1&pool_class=prom.interface.postgres.pool.ConnectionPool'
+        os.environ["PROM_POSTGRES_DSN"] += query_str
+        try:
+            i = super(InterfacePostgresPoolTest, cls).create_interface()
+
+        finally:
+            os.environ["PROM_POSTGRES_DSN"] = orig_url
+
+        return i
+
+    def test_prewarm(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        self.assertEqual(1, pool.size)
+        self.assertEqual(1, len(pool._pool))
+
+    def test_timeout(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        conns = [pool.getconn() for _ in range(pool.maxconn)]
+
+        start = time.time()
+        with self.assertRaises(prom.InterfaceError):
+            i.query("SELECT 1")
+        self.assertLess(time.time() - start, 2.0)
+
+        for conn in conns:
+            pool.putconn(conn)
+
+        r = i.query("SELECT 1 AS foo")
+        self.assertEqual(1, r[0]["foo"])
+
+    def test_discard_in_transaction(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        conn = pool.getconn()
+        conn.transaction_start("p1")
+        pool.putconn(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(0, pool.size)
+
+        conn = pool.getconn()
+        self.assertFalse(conn.closed)
+        pool.putconn(conn)
+        self.assertEqual(1, pool.size)
+
+    def test_discard_closed(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        conn = pool.getconn()
+        conn.close()
+        pool.putconn(conn)
+        self.assertEqual(0, pool.size)
+
+        r = i.query("SELECT 1 AS foo")
+        self.assertEqual(1, r[0]["foo"])
+
+    def test_max_lifetime(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        conn = pool.getconn()
+        pool.putconn(conn)
+        pool.max_lifetime = 0.1
+        time.sleep(0.2)
+
+        conn2 = pool.getconn()
+        self.assertTrue(conn.closed)
+        self.assertNotEqual(id(conn), id(conn2))
+        pool.putconn(conn2)
+
+    def test_max_idle(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        pool.max_idle = 0.1
+        conns = [pool.getconn() for _ in range(pool.maxconn)]
+        for conn in conns:
+            pool.putconn(conn)
+        self.assertEqual(pool.maxconn, pool.size)
+
+        time.sleep(0.2)
+        pool.putconn(pool.getconn())
+        self.assertEqual(pool.minconn, pool.size)
+
+    def test_ping(self):
+        i = self.get_interface()
+        pool = i.connection_pool
+        pool.ping_idle = 0.0
+        conn = pool.getconn()
+        other = pool.getconn()
+        pid = conn.get_backend_pid()
+        pool.putconn(conn)
+
+        other.cursor().execute("SELECT pg_terminate_backend(%s)", [pid])
+
+        # conn is the only idle connection so it will fail validation and be
+        # replaced with a fresh connection
+        conn2 = pool.getconn()
+        self.assertTrue(conn.closed)
+        self.assertNotEqual(pid, conn2.get_backend_pid())
+        pool.putconn(conn2)
+        pool.putconn(other)
+
+
 @skipIf(gevent is None, "Skipping Gevent test because gevent module not installed")
 class XInterfacePostgresGeventTest(InterfacePostgresTest):
     """this class has an X to start so that it will run last when all tests are run"""
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import tempfile
+from uuid import uuid4
+
+from prom.interface.routing import RoutingInterface
+from prom.config import DsnConnection
+from prom.compat import *
+
+from .. import BaseTestCase
+
+
+class RoutingInterfaceTest(BaseTestCase):
+    def create_router(self, replica_count=2, **kwargs):
+        """create a router with SQLite files standing in for the primary and
+        the replicas, the replicas get 2, 3, ... rows and the primary starts
+        empty so the count says which interface answered"""
+        interfaces = []
+        for _ in range(replica_count + 1):
+            path = os.path.join(tempfile.gettempdir(), "{}.sqlite".format(uuid4()))
+            config = DsnConnection("prom.interface.sqlite.SQLite://{}".format(path))
+            inter = config.interface
+            self.connections.add(inter)
+            interfaces.append(inter)
+
+        router = RoutingInterface(interfaces[0], interfaces[1:], **kwargs)
+        orm_class = self.get_orm_class(interface=router)
+        orm_class.install()
+        for i, inter in enumerate(interfaces[1:], 1):
+            inter.set_table(orm_class.schema)
+            for _ in range(i + 1):
+                # to_interface() fills in the _created and _updated fields
+                inter.insert(orm_class.schema, orm_class(foo=1, bar="1").to_interface())
+
+        return router, orm_class
+
+    def test_round_robin(self):
+        router, orm_class = self.create_router(read_your_writes=0)
+        counts = [orm_class.query.count() for _ in range(4)]
+        self.assertEqual(set([2, 3]), set(counts))
+        self.assertNotEqual(counts[0], counts[1])
+
+        # writes go to the primary
+        orm_class.create(foo=2, bar="2")
+        self.assertEqual(1, router.primary.count(orm_class.schema))
+
+    def test_least_loaded(self):
+        router, orm_class = self.create_router(routing_strategy="least_loaded")
+        router.replicas[0].active = 5
+        for _ in range(3):
+            self.assertIs(router.replicas[1], router.get_replica())
+
+        with self.assertRaises(ValueError):
+            RoutingInterface(router.primary, [], routing_strategy="nope")
+
+    def test_read_your_writes(self):
+        router, orm_class = self.create_router(read_your_writes=60)
+        self.assertLess(0, orm_class.query.count())
+
+        o = orm_class.create(foo=2, bar="2")
+        self.assertEqual(1, orm_class.query.count())
+        self.assertEqual(o.pk, orm_class.query.one().pk)
+
+    def test_transaction(self):
+        router, orm_class = self.create_router(read_your_writes=0)
+        with router.transaction() as connection:
+            orm_class.create(foo=2, bar="2")
+            self.assertEqual(1, orm_class.query.count())
+            self.assertEqual(1, router.count(orm_class.schema, connection=connection))
+
+        self.assertNotEqual(1, orm_class.query.count())
+
+    def test_eject(self):
+        router, orm_class = self.create_router(
+            read_your_writes=0,
+            replica_max_failures=2,
+            replica_eject_time=60,
+        )
+        orm_class.create(foo=2, bar="2")
+
+        bad = router.replicas[0]
+        def count(*args, **kwargs):
+            raise RuntimeError("replica is down")
+        bad.interface.count = count
+
+        # the failed reads are run on the primary instead
+        counts = [orm_class.query.count() for _ in range(4)]
+        self.assertEqual([1, 1, 3, 3], sorted(counts))
+        self.assertFalse(bad.is_healthy())
+
+        counts = [orm_class.query.count() for _ in range(4)]
+        self.assertEqual([3, 3, 3, 3], counts)
+
+        # errors the primary also has aren't the replica's fault
+        good = router.replicas[1]
+        good.interface.count = count
+        router.primary.count = count
+        with self.assertRaises(RuntimeError):
+            orm_class.query.count()
+        self.assertEqual(0, good.failures)
+
+    def test_spawn(self):
+        router, orm_class = self.create_router(
+            routing_strategy="least_loaded",
+            read_your_writes=5,
+            replica_max_failures=2,
+            replica_eject_time=60,
+        )
+
+        r = router.spawn()
+        self.assertIsNot(router.primary, r.primary)
+        self.assertEqual(2, len(r.replicas))
+        self.assertEqual("least_loaded", r.strategy)
+        self.assertEqual(5.0, r.read_your_writes)
+        for replica in r.replicas:
+            self.assertEqual(2, replica.max_failures)
+            self.assertEqual(60.0, replica.eject_time)
+
+    def test_observers(self):
+        from prom.instrument import MetricsRegistry
+
+        router, orm_class = self.create_router(read_your_writes=0)
+        metrics = MetricsRegistry()
+        router.add_observer(metrics)
+        for inter in router.get_interfaces():
+            self.assertTrue(metrics in inter.observers)
+
+        router.remove_observer(metrics)
+        for inter in router.get_interfaces():
+            self.assertFalse(metrics in inter.observers)
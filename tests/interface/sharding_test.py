@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals, division, print_function, absolute_import
+import os
+import tempfile
+from uuid import uuid4
+
+from prom.interface.sharding import ShardedInterface
+from prom.instrument import Observer
+from prom.config import DsnConnection
+from prom.compat import *
+
+from .. import BaseTestCase
+
+
+class ShardedInterfaceTest(BaseTestCase):
+    def create_sharded(self, shard_count=3, rows=0):
+        """create a sharded interface using a SQLite file for each shard and an
+        orm class sharded on foo with rows rows"""
+        shards = []
+        for _ in range(shard_count):
+            path = os.path.join(tempfile.gettempdir(), "{}.sqlite".format(uuid4()))
+            config = DsnConnection("prom.interface.sqlite.SQLite://{}".format(path))
+            inter = config.interface
+            self.connections.add(inter)
+            shards.append(inter)
+
+        inter = ShardedInterface(shards)
+        orm_class = self.get_orm_class(interface=inter, shard_key="foo")
+        orm_class.install()
+        for i in range(rows):
+            orm_class.create(foo=i % 10, bar="{:03}".format(i))
+        return inter, orm_class
+
+    def test_insert(self):
+        inter, orm_class = self.create_sharded(rows=30)
+        s = orm_class.schema
+
+        counts = [shard.count(s) for shard in inter.shards]
+        self.assertEqual(30, sum(counts))
+        for i, shard in enumerate(inter.shards):
+            for d in shard.get(s):
+                self.assertEqual(i, orm_class.shard_for(d["foo"], 3))
+
+        with self.assertRaises(ValueError):
+            inter.insert(s, {"bar": "1"})
+
+    def test_routing(self):
+        inter, orm_class = self.create_sharded(rows=30)
+
+        queries = []
+        class Collector(Observer):
+            def query_start(self, event):
+                # new connections run setup queries (eg, PRAGMA) on their thread
+                if event.operation == "SELECT":
+                    queries.append(event)
+        inter.add_observer(Collector())
+
+        self.assertEqual(3, orm_class.query.is_foo(3).count())
+        self.assertEqual(1, len(queries))
+
+        # list() would also run a count query to get the length
+        self.assertEqual(3, len([o for o in orm_class.query.is_foo(4).get()]))
+        self.assertEqual(2, len(queries))
+
+        self.assertEqual(30, orm_class.query.count())
+        self.assertEqual(5, len(queries))
+
+        self.assertEqual(6, orm_class.query.in_foo([3, 4]).count())
+
+    def test_merge(self):
+        inter, orm_class = self.create_sharded(rows=30)
+
+        bars = ["{:03}".format(i) for i in range(30)]
+        self.assertEqual(bars, list(orm_class.query.asc_bar().get().bar))
+        self.assertEqual(bars[3:8], list(orm_class.query.asc_bar().limit(5).offset(3).get().bar))
+        self.assertEqual(bars[::-1][:4], list(orm_class.query.desc_bar().limit(4).get().bar))
+
+        rows = list(orm_class.query.desc_foo().asc_bar().get())
+        expected = sorted(rows, key=lambda o: (-o.foo, o.bar))
+        self.assertEqual([o.bar for o in expected], [o.bar for o in rows])
+
+        it = orm_class.query.asc_bar().limit(10).page(2).get()
+        self.assertEqual(bars[10:20], list(it.bar))
+        self.assertTrue(it.has_more())
+
+        self.assertEqual("000", orm_class.query.asc_bar().one().bar)
+        self.assertEqual(["000", "001"], list(orm_class.query.select_bar().asc_bar().limit(2).get()))
+
+    def test_orm(self):
+        inter, orm_class = self.create_sharded(rows=10)
+        o = orm_class.create(foo=5, bar="five")
+
+        # primary keys are per shard so the orm has to use the shard key too
+        o.bar = "six"
+        o.save()
+        self.assertEqual("six", o.requery().bar)
+        self.assertEqual(1, orm_class.query.is_bar("six").count())
+
+        # the row can't move to another shard
+        foo = next(foo for foo in range(10) if orm_class.shard_for(foo, 3) != orm_class.shard_for(5, 3))
+        o.foo = foo
+        with self.assertRaises(ValueError):
+            o.save()
+        self.assertEqual(1, orm_class.query.is_foo(5).is_bar("six").count())
+
+        # but it's still found on its own shard
+        self.assertEqual("six", o.requery().bar)
+        o.delete()
+        self.assertEqual(10, orm_class.query.count())
+
+    def test_update(self):
+        inter, orm_class = self.create_sharded(rows=30)
+
+        self.assertEqual(3, orm_class.query.is_foo(5).set_bar("five").update())
+        self.assertEqual(30, orm_class.query.gte_foo(0).set_bar("all").update())
+        self.assertEqual(30, orm_class.query.is_bar("all").count())
+
+        # rows can't move to another shard
+        foo = next(foo for foo in range(10, 100) if orm_class.shard_for(foo, 3) != orm_class.shard_for(5, 3))
+        with self.assertRaises(ValueError):
+            orm_class.query.is_foo(5).set_foo(foo).update()
+
+        with self.assertRaises(ValueError):
+            orm_class.query.is_bar("all").set_foo(foo).update()
+        self.assertEqual(0, orm_class.query.is_foo(foo).count())
+
+        # but they can get a new value on the same shard
+        foo = next(foo for foo in range(10, 100) if orm_class.shard_for(foo, 3) == orm_class.shard_for(5, 3))
+        self.assertEqual(3, orm_class.query.is_foo(5).set_foo(foo).update())
+        self.assertEqual(3, orm_class.query.is_foo(foo).count())
+
+    def test_error(self):
+        inter, orm_class = self.create_sharded(rows=10)
+        def count(*args, **kwargs):
+            raise RuntimeError("shard is down")
+        inter.shards[1].count = count
+
+        with self.assertRaises(RuntimeError):
+            orm_class.query.count()
+
+        with self.assertRaises(ValueError):
+            with inter.transaction():
+                pass
@@ -2,14 +2,17 @@
 from __future__ import unicode_literals, division, print_function, absolute_import
 import os
 import datetime
+import decimal
+import sqlite3
+import threading
 
 import testdata
 
 from prom import query, InterfaceError
-from prom.interface.sqlite import SQLite, TimestampType
+from prom.interface.sqlite import SQLite, TimestampType, SQLiteRowDecoder
 from prom.interface import configure
 from prom.model import Orm
-from prom.config import Field
+from prom.config import Field, Schema
 from prom.compat import *
 
 from . import BaseTestInterface, BaseTestCase
@@ -53,6 +56,54 @@ class TimestampTypeTest(BaseTestCase):
         self.assertEqual("2020-03-25T19:34:05.057035Z", dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ"))
 
 
+    def test_decode(self):
+        dt = TimestampType.decode("2020-03-25 19:34:05.057035")
+        self.assertEqual(datetime.datetime(2020, 3, 25, 19, 34, 5, 57035), dt)
+
+        dt = TimestampType.decode("2020-03-25T19:34:05.00005Z")
+        self.assertEqual(50, dt.microsecond)
+        self.assertIsNone(dt.tzinfo)
+
+        dt = TimestampType.decode(b"2020-03-25 19:34:05")
+        self.assertEqual(datetime.datetime(2020, 3, 25, 19, 34, 5), dt)
+
+        dt = TimestampType.decode(-62167219200)
+        self.assertEqual(datetime.datetime.min, dt)
+
+        with self.assertRaises(ValueError):
+            TimestampType.decode("2020-03-25 19:34:05+01:00")
+
+
+class SQLiteRowDecoderTest(BaseTestCase):
+    def test_decode_rows(self):
+        s = Schema(
+            "decoder_table",
+            ts=Field(datetime.datetime),
+            d=Field(datetime.date),
+            b=Field(bool),
+            n=Field(decimal.Decimal),
+            t=Field(str),
+            i=Field(int),
+        )
+        decoder = SQLiteRowDecoder(s)
+
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(" ".join([
+            "SELECT '2020-03-25 19:34:05.000001' AS ts, '2020-03-25' AS d, 1 AS b,",
+            "1.1 AS n, CAST('foo' AS BLOB) AS t, 5 AS i, 'extra' AS e",
+        ])).fetchall()
+
+        r = decoder.decode_rows(rows)[0]
+        self.assertEqual(datetime.datetime(2020, 3, 25, 19, 34, 5, 1), r["ts"])
+        self.assertEqual(datetime.date(2020, 3, 25), r["d"])
+        self.assertIs(True, r["b"])
+        self.assertEqual(decimal.Decimal("1.1"), r["n"])
+        self.assertEqual("foo", r["t"])
+        self.assertEqual(5, r["i"])
+        self.assertEqual("extra", r["e"])
+
+
 class InterfaceTest(BaseTestCase):
     """This is testing the actual interface, not the db connection or anything"""
     def test_change_interface(self):
@@ -144,7 +195,7 @@ class InterfaceSQLiteTest(BaseTestInterface):
         d = i.get_one(s, q)
         self.assertGreater(len(d), 0)
 
-        i._connection.close()
+        i.get_connection().close()
 
         _id = self.insert(i, s, 1)[0]
         q = query.Query()
@@ -152,6 +203,192 @@ class InterfaceSQLiteTest(BaseTestInterface):
         d = i.get_one(s, q)
         self.assertGreater(len(d), 0)
 
+    def test_explain(self):
+        i, s = self.get_table()
+        self.insert(i, s, 5)
+
+        q = query.Query().is__id(1)
+        plan = i.explain(s, q)
+        self.assertFalse(plan.has_seq_scan())
+        self.assertTrue(plan.uses_index())
+        self.assertIsNone(plan.rows)
+
+        q = query.Query().is_foo(1).asc_bar()
+        plan = i.explain(s, q)
+        self.assertTrue(plan.uses_index("ifoobar"))
+        self.assertFalse(plan.has_sort())
+
+        # bar isn't indexed on this table so sorting by it always needs a sort
+        # step, a rowid sort might not depending on the SQLite version
+        i, s = self.get_table(foo=Field(int, True), bar=Field(str, True))
+        self.insert(i, s, 5)
+        q = query.Query().is_foo(1).asc_bar()
+        plan = i.explain(s, q)
+        self.assertTrue(plan.has_seq_scan(s))
+        self.assertTrue(plan.has_sort())
+
+    def test_in_list(self):
+        i, s = self.get_table()
+        _ids = self.insert(i, s, 5)
+
+        # more values than SQLite allows bound variables
+        vals = list(range(-40000, 0)) + _ids[:3]
+        q = query.Query().in__id(vals)
+        fstr, fargs = i.render(s, q, placeholder=True)
+        self.assertTrue("json_each" in fstr)
+        self.assertEqual(1, len(fargs))
+        self.assertEqual(3, i.count(s, q))
+        self.assertEqual(2, i.count(s, query.Query().nin__id(vals)))
+
+        q = query.Query().in__id(_ids[:3])
+        fstr, fargs = i.render(s, q, placeholder=True)
+        self.assertFalse("json_each" in fstr)
+        self.assertEqual(3, len(fargs))
+
+    def test_thread_connections(self):
+        i, s = self.get_table()
+        self.insert(i, s, 5)
+
+        connections = []
+        counts = []
+        def target():
+            connections.append(i.get_connection())
+            counts.append(i.count(s))
+
+        threads = [threading.Thread(target=target) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([5] * 4, counts)
+        self.assertEqual(4, len(set(id(c) for c in connections)))
+        self.assertFalse(i.get_connection() in connections)
+
+        i.close()
+        for c in connections:
+            self.assertTrue(c.closed)
+
+    def test_connection_pragmas(self):
+        i = self.create_interface()
+        config = i.connection_config
+        config.options.update({
+            "synchronous": "OFF",
+            "busy_timeout": 1234,
+            "cache_size": -4000,
+        })
+        i.connect(config)
+
+        self.assertEqual("wal", i.query("PRAGMA journal_mode")[0]["journal_mode"])
+        self.assertEqual(0, i.query("PRAGMA synchronous")[0]["synchronous"])
+        self.assertEqual(1234, i.query("PRAGMA busy_timeout")[0]["timeout"])
+        self.assertEqual(-4000, i.query("PRAGMA cache_size")[0]["cache_size"])
+        self.assertEqual(1, i.query("PRAGMA foreign_keys")[0]["foreign_keys"])
+
+    def test_thread_readonly(self):
+        i, s = self.get_table()
+        i.readonly(True)
+
+        errors = []
+        def target():
+            try:
+                self.insert(i, s, 1)
+            except InterfaceError as e:
+                errors.append(e)
+
+        t = threading.Thread(target=target)
+        t.start()
+        t.join()
+        self.assertEqual(1, len(errors))
+
+        i.readonly(False)
+        self.insert(i, s, 1)
+
+    def get_writer_interface(self):
+        i = self.create_interface()
+        config = i.connection_config
+        config.options["writer"] = 1
+        i.connect(config)
+        return i
+
+    def test_writer(self):
+        i = self.get_writer_interface()
+        s = self.get_schema()
+        self.assertIsNotNone(i.writer)
+
+        errors = []
+        def target(x):
+            try:
+                for y in range(10):
+                    i.insert(s, {"foo": (x * 10) + y, "bar": "{}-{}".format(x, y)})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=target, args=(x,)) for x in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual(50, i.count(s))
+
+        pk = i.insert(s, {"foo": 100, "bar": "100"})
+        q = query.Query().is__id(pk)
+        self.assertEqual(1, i.update(s, {"foo": 101}, q))
+        self.assertEqual(101, i.get_one(s, q)["foo"])
+        self.assertEqual(1, i.delete(s, q))
+        self.assertEqual(50, i.count(s))
+
+    def test_writer_group_commit(self):
+        i = self.get_writer_interface()
+        s = self.get_schema()
+        i.set_table(s)
+
+        # hold the writer so the writes queue up and get committed in batches
+        with i.writer.lock:
+            futures = [
+                i.writer.submit("insert", s, {"foo": x, "bar": str(x)}) for x in range(5)
+            ]
+            futures.append(i.writer.submit("insert", s, {"_id": 100, "foo": 5, "bar": "5"}))
+            futures.append(i.writer.submit("insert", s, {"_id": 100, "foo": 6, "bar": "6"}))
+
+        pks = [f.result() for f in futures[:-1]]
+        self.assertEqual(6, len(set(pks)))
+
+        # the failed write only takes itself down
+        with self.assertRaises(InterfaceError):
+            futures[-1].result()
+        self.assertEqual(6, i.count(s))
+
+    def test_writer_transaction(self):
+        i = self.get_writer_interface()
+        s = self.get_schema()
+        i.set_table(s)
+
+        with i.transaction() as connection:
+            self.assertIs(i.writer.connection, connection)
+            i.insert(s, {"foo": 1, "bar": "1"})
+            self.assertEqual(1, i.count(s))
+
+        with self.assertRaises(ValueError):
+            with i.transaction():
+                i.insert(s, {"foo": 2, "bar": "2"})
+                raise ValueError()
+
+        self.assertEqual(1, i.count(s))
+
+    def test_transaction_read_table_recovery(self):
+        """SQLite transactions survive a missing table error, so a read without
+        a savepoint can still create the table"""
+        i = self.get_interface()
+        s = self.get_schema()
+        i.connection_config.options["savepoint_reads"] = 0
+
+        with i.transaction() as connection:
+            self.assertEqual(0, i.count(s, connection=connection))
+        self.assertTrue(i.has_table(s))
+
     def test_no_connection(self):
         """noop, this doesn't really apply to SQLite"""
         pass
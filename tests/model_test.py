@@ -988,6 +988,23 @@ class OrmTest(EnvironTestCase):
 
         self.assertEqual(0, TransTorm1.query.count())
 
+    def test_install_all(self):
+        Foo = self.get_orm_class()
+        Bar = self.get_orm_class(foo_id=Field(Foo, True))
+        Che = self.get_orm_class(bar_id=Field(Bar, True))
+
+        # referenced tables are created first no matter the order passed in
+        r = prom.install_all([Che, Bar, Foo])
+        self.assertEqual([Foo.schema, Bar.schema, Che.schema], r)
+
+        f = Foo.create(foo=1, bar="1")
+        b = Bar.create(foo_id=f.pk)
+        c = Che.create(bar_id=b.pk)
+        self.assertEqual(b.pk, Che.query.one().bar_id)
+
+        r = prom.install_all([Foo, Bar, Che])
+        self.assertEqual([], r)
+
     def test_non_int_primary_key(self):
         class Nipk(Orm):
             table_name = "non_int_pk_1"
@@ -179,6 +179,18 @@ class QueryTest(EnvironTestCase):
         self.assertRegex(r, r"foo[^=]+=\s*1")
         self.assertRegex(r, r"bar[^=]+=\s*'two'")
 
+    def test_explain(self):
+        orm_class = self.get_orm_class()
+        self.insert(orm_class, 5)
+
+        plan = orm_class.query.explain()
+        self.assertTrue(plan.has_seq_scan(orm_class.table_name))
+        self.assertEqual([orm_class.table_name], plan.seq_scans())
+        self.assertTrue(str(plan))
+
+        plan = orm_class.query.is_bar("two").explain()
+        self.assertEqual(["two"], plan.query_args)
+
     def test_find_methods_1(self):
         q = self.get_query()
 
@@ -737,6 +749,29 @@ class QueryTest(EnvironTestCase):
         self.assertEqual(o._created, o2._created)
         self.assertEqual(o._updated, o2._updated)
 
+    def test_pipeline(self):
+        orm_class = self.get_orm_class()
+        o = orm_class(foo=1, bar="value 1")
+        fields = orm_class(foo=2, bar="value 2").to_interface()
+
+        with orm_class.interface.pipeline():
+            pk = orm_class.query.set(fields).insert()
+            o.save()
+            self.assertIsNone(o.pk)
+            self.assertFalse(pk.done())
+
+        self.assertLess(0, pk.result())
+        self.assertLess(pk.result(), o.pk)
+
+        with orm_class.interface.pipeline():
+            count = orm_class.query.set_foo(3).is_pk(o.pk).update()
+            deleted = orm_class.query.is_pk(pk.result()).delete()
+
+        self.assertEqual(1, count.result())
+        self.assertEqual(1, deleted.result())
+        self.assertEqual(3, orm_class.query.one_pk(o.pk).foo)
+        self.assertEqual(1, orm_class.query.count())
+
     def test_update_bubble_up(self):
         """
         https://github.com/jaymon/prom/issues/11
@@ -787,6 +822,260 @@ class QueryTest(EnvironTestCase):
         self.assertTrue(o._id in _ids)
         self.assertFalse(o.is_modified())
 
+    def test_gather(self):
+        orm_class = self.get_orm_class()
+        pks = self.insert(orm_class, 5)
+
+        q = orm_class.query.is_pk(pks[0])
+        os, count, o, has = prom.gather(orm_class.query.asc_pk(), q.count, q.one, q.has)
+        self.assertEqual(pks, [o.pk for o in os])
+        self.assertEqual(1, count)
+        self.assertEqual(pks[0], o.pk)
+        self.assertTrue(has)
+        self.assertEqual([], prom.gather())
+
+        # the queries run on other threads still belong to this thread
+        with prom.profile(orm_class.interface) as p:
+            prom.gather(orm_class.query.count, orm_class.query.one, max_workers=2)
+        # a new connection can run setup queries (eg, PRAGMA) on its thread, only
+        # the statements on the table belong to the gathered queries
+        entries = [e for e in p.summary(0) if str(orm_class.schema) in e.fingerprint]
+        self.assertEqual(2, sum(e.count for e in entries))
+        self.assertEqual(1, len([e for e in entries if "count(*)" in e.fingerprint]))
+
+        with self.assertRaises(TypeError):
+            prom.gather(lambda: 1)
+
+        with self.assertRaises(ValueError):
+            prom.gather(orm_class.query.count, orm_class.query.value, max_workers=2)
+
+        with orm_class.interface.transaction():
+            with self.assertRaises(ValueError):
+                prom.gather(orm_class.query.count)
+
+    def test_aggregate(self):
+        orm_class = self.get_orm_class(
+            status=prom.Field(str, True),
+            amount=prom.Field(int, True),
+        )
+        for i in range(10):
+            orm_class.create(status="paid" if i % 2 else "due", amount=i)
+
+        r = orm_class.query.aggregate(total=prom.Sum("amount"), n=prom.Count()).one()
+        self.assertEqual(45, r.total)
+        self.assertEqual(10, r["n"])
+
+        r = orm_class.query.lt_amount(4).aggregate(
+            high=prom.Max("amount"),
+            statuses=prom.Count("status", distinct=True),
+        ).one()
+        self.assertEqual(3, r.high)
+        self.assertEqual(2, r.statuses)
+
+        q = orm_class.query.group_by("status").aggregate(total=prom.Sum("amount"))
+        rows = list(q.copy().desc_total().get())
+        self.assertEqual(["paid", "due"], [r.status for r in rows])
+        self.assertEqual([25, 20], [r.total for r in rows])
+        self.assertEqual(2, q.copy().count())
+
+        rows = list(q.copy().having_gt_total(20).get())
+        self.assertEqual(["paid"], [r.status for r in rows])
+        rows = list(q.copy().having_in_total([20, 21]).get())
+        self.assertEqual(["due"], [r.status for r in rows])
+        self.assertEqual([20], list(q.copy().is_status("due").get().total))
+
+        with self.assertRaises(TypeError):
+            orm_class.query.aggregate(total="amount")
+
+    def test_group_by_trunc(self):
+        orm_class = self.get_orm_class(
+            amount=prom.Field(int, True),
+            ts=prom.Field(datetime.datetime, True),
+        )
+        # Monday, 2024-03-04 at 10am
+        start = datetime.datetime(2024, 3, 4, 10)
+        for i in range(10):
+            orm_class.create(amount=i, ts=start + datetime.timedelta(hours=12 * i))
+
+        q = orm_class.query.group_by(day=prom.Trunc("ts", "day")).aggregate(
+            n=prom.Count(),
+            total=prom.Sum("amount"),
+        )
+        rows = list(q.asc_day().get())
+        self.assertEqual(5, len(rows))
+        self.assertEqual(datetime.datetime(2024, 3, 4), rows[0].day)
+        self.assertEqual(datetime.datetime(2024, 3, 8), rows[-1].day)
+        self.assertEqual([2] * 5, [r.n for r in rows])
+        self.assertEqual([1, 5, 9, 13, 17], [r.total for r in rows])
+
+        q = orm_class.query.group_by(week=prom.Trunc("ts", "week")).aggregate(n=prom.Count())
+        r = q.one()
+        self.assertEqual(datetime.datetime(2024, 3, 4), r.week)
+        self.assertEqual(10, r.n)
+
+        with self.assertRaises(ValueError):
+            prom.Trunc("ts", "fortnight")
+
+    def test_join(self):
+        bar_class = self.get_orm_class(
+            name=prom.Field(str, True),
+            ts=prom.Field(datetime.datetime, True),
+        )
+        foo_class = self.get_orm_class(
+            bar_id=prom.Field(bar_class, False),
+            che=prom.Field(int, True),
+        )
+        ts = datetime.datetime(2024, 3, 4, 10)
+        b1 = bar_class.create(name="b1", ts=ts)
+        b2 = bar_class.create(name="b2", ts=ts)
+        foo_class.create(bar_id=b1.pk, che=1)
+        foo_class.create(bar_id=b2.pk, che=2)
+        foo_class.create(bar_id=b2.pk, che=3)
+        foo_class.create(bar_id=None, che=4)
+
+        with prom.profile(foo_class.interface) as p:
+            fs = [f for f in foo_class.query.join(bar_class).desc("bar.name").asc_che().get()]
+        self.assertEqual(1, p.rollup()["queries"])
+
+        self.assertEqual([2, 3, 1], [f.che for f in fs])
+        self.assertEqual(["b2", "b2", "b1"], [f.bar.name for f in fs])
+        self.assertEqual(ts, fs[0].bar.ts)
+        self.assertEqual(b2.pk, fs[0].bar.pk)
+        self.assertFalse(fs[0].is_modified())
+
+        q = foo_class.query.join(bar_class, on="bar_id", name="b").is_field("b.name", "b2")
+        self.assertEqual(2, q.count())
+        self.assertEqual([2, 3], sorted(q.get().che))
+        self.assertEqual(["b2", "b2"], list(q.copy().select("b.name").get()))
+
+        fs = list(foo_class.query.left_join(bar_class).asc_che().get())
+        self.assertEqual(4, len(fs))
+        self.assertIsNone(fs[-1].bar)
+
+        with self.assertRaises(ValueError):
+            foo_class.query.join(foo_class)
+
+        with self.assertRaises(ValueError):
+            foo_class.query.join(bar_class, name="che")
+
+        with self.assertRaises(ValueError):
+            foo_class.query.join(bar_class).is_field("bar.name", "b2").delete()
+
+    def test_limit_per_group(self):
+        orm_class = self.get_orm_class(
+            user_id=prom.Field(int, True),
+            n=prom.Field(int, True),
+        )
+        for user_id in range(1, 4):
+            for n in range(user_id + 1):
+                orm_class.create(user_id=user_id, n=n)
+
+        q = orm_class.query.partition_by("user_id").desc_n().limit_per_group(2)
+        with prom.profile(orm_class.interface) as p:
+            partitions = q.copy().get().partitions()
+        self.assertEqual(1, p.rollup()["queries"])
+        self.assertEqual([1, 2, 3], sorted(partitions.keys()))
+        self.assertEqual([1, 0], [o.n for o in partitions[1]])
+        self.assertEqual([3, 2], [o.n for o in partitions[3]])
+
+        self.assertEqual(6, q.count())
+        self.assertEqual(2, q.copy().gt_user_id(1).is_n(2).count())
+        self.assertEqual([3, 2, 2], list(q.copy().desc_n().limit(3).get().n))
+
+        o = q.copy().select("*").gt_user_id(2).one()
+        self.assertEqual(3, o.n)
+
+        with self.assertRaises(ValueError):
+            orm_class.query.partition_by("user_id").count()
+
+        with self.assertRaises(ValueError):
+            orm_class.query.limit_per_group(0)
+
+    def test_descendants_ancestors(self):
+        orm_class = self.get_orm_class(
+            parent_id=prom.Field(int, False),
+            name=prom.Field(str, True),
+        )
+        # 1 -> (2 -> (4 -> 7, 5), 3 -> 6)
+        parents = {"1": None, "2": "1", "3": "1", "4": "2", "5": "2", "6": "3", "7": "4"}
+        pks = {}
+        for name in sorted(parents.keys()):
+            parent = parents[name]
+            pks[name] = orm_class.create(
+                name=name,
+                parent_id=pks[parent] if parent else None
+            ).pk
+
+        q = orm_class.query.descendants(pks["1"], via="parent_id").asc__depth().asc_name()
+        with prom.profile(orm_class.interface) as p:
+            rows = [(o.name, o._depth) for o in q.copy().get()]
+        self.assertEqual(1, p.rollup()["queries"])
+        self.assertEqual(
+            [("2", 1), ("3", 1), ("4", 2), ("5", 2), ("6", 2), ("7", 3)],
+            rows
+        )
+
+        self.assertEqual(6, q.count())
+        self.assertEqual(["2", "3"], list(q.copy().lt__depth(2).get().name))
+        self.assertEqual(["4"], list(q.copy().is_name("4").get().name))
+        q = orm_class.query.descendants(pks["1"], via="parent_id").gte__depth(2)
+        self.assertEqual(["7", "6"], list(q.desc_name().limit(2).get().name))
+
+        q = orm_class.query.descendants(pks["2"], via="parent_id", max_depth=1)
+        self.assertEqual(["4", "5"], sorted(q.get().name))
+
+        q = orm_class.query.ancestors(pks["7"], via="parent_id").asc__depth()
+        self.assertEqual([("4", 1), ("2", 2), ("1", 3)], [(o.name, o._depth) for o in q.get()])
+        self.assertEqual("2", q.copy().is__depth(2).one().name)
+
+        self.assertEqual(0, orm_class.query.descendants(pks["7"], via="parent_id").count())
+
+        with self.assertRaises(ValueError):
+            orm_class.query.descendants(pks["1"])
+
+    def test_descendants_ancestors_cycle(self):
+        orm_class = self.get_orm_class(
+            parent_id=prom.Field(int, False),
+            name=prom.Field(str, True),
+        )
+        # 1 -> 2 -> 3 -> 1
+        o1 = orm_class.create(name="1")
+        o2 = orm_class.create(name="2", parent_id=o1.pk)
+        o3 = orm_class.create(name="3", parent_id=o2.pk)
+        o1.parent_id = o3.pk
+        o1.save()
+
+        q = orm_class.query.descendants(o1.pk, via="parent_id").asc__depth()
+        self.assertEqual([("2", 1), ("3", 2)], [(o.name, o._depth) for o in q.get()])
+        self.assertEqual(2, q.count())
+
+        q = orm_class.query.ancestors(o1.pk, via="parent_id").asc__depth()
+        self.assertEqual([("3", 1), ("2", 2)], [(o.name, o._depth) for o in q.get()])
+
+        q = orm_class.query.descendants(o2.pk, via="parent_id", max_depth=1)
+        self.assertEqual(["3"], [o.name for o in q.get()])
+
+    def test_empty_query(self):
+        orm_class = self.get_orm_class(
+            foo=prom.Field(int, False),
+        )
+        orm_class.create(foo=1)
+        orm_class.create(foo=2)
+        orm_class.create(foo=None)
+
+        with prom.profile(orm_class.interface) as p:
+            self.assertEqual([], [o for o in orm_class.query.in_foo([]).get()])
+            self.assertIsNone(orm_class.query.in_foo([]).one())
+            self.assertEqual(0, orm_class.query.in_foo([]).count())
+            self.assertFalse(orm_class.query.in_foo([]).has())
+            self.assertEqual(0, orm_class.query.is_foo(1).is_foo(2).count())
+            self.assertEqual(0, orm_class.query.is_foo(1).is_foo(None).count())
+        self.assertEqual(0, p.rollup()["queries"])
+
+        self.assertEqual(1, orm_class.query.is_foo(1).is_foo(1).count())
+        self.assertEqual(3, orm_class.query.nin_foo([]).count())
+        self.assertEqual(2, orm_class.query.nin_foo([]).gt__id(1).count())
+
     def test_copy(self):
         q1 = self.get_query()
         q2 = q1.copy()